@@ -1,7 +1,29 @@
-from django.contrib import admin
-from survey.models import (Survey, Question, Answer, Result, Page)
+from django.contrib import admin, messages
+from survey.models import (Survey, Question, Answer, Result, Page, Response, ResponseAnswer)
+from survey import export
+from survey.coverage import survey_coverage
 from django.db import models
 from django.forms import Textarea, TextInput
+from django.http import StreamingHttpResponse
+
+
+def _warn_about_coverage(modeladmin, request, survey_id):
+    """Tell about the attainable scores without a result and the results nobody can get."""
+    for warning in survey_coverage(survey_id).warnings():
+        modeladmin.message_user(request, warning, messages.WARNING)
+
+
+def _export_action(format):
+    def export_surveys(modeladmin, request, queryset):
+        survey_ids = list(queryset.values_list('id', flat=True))
+        response = StreamingHttpResponse(export.stream(survey_ids, format),
+                                         content_type=export.CONTENT_TYPES[format])
+        response['Content-Disposition'] = 'attachment; filename="surveys.{}"'.format(format)
+        return response
+    export_surveys.__name__ = 'export_{}'.format(format)
+    export_surveys.short_description = 'Export the selected surveys with their responses ({})'.format(
+        format.upper())
+    return export_surveys
 
 
 class ResultInLine(admin.TabularInline):
@@ -20,16 +42,34 @@ class PageInline(admin.TabularInline):
 class SurveyAdmin(admin.ModelAdmin):
     inlines = [PageInline, ResultInLine]
     fieldsets = [
-        ('Survey details', {'fields': ['name', 'description']})
+        ('Survey details', {'fields': ['name', 'description']}),
+        ('Scores', {'fields': ['score_coverage']})
     ]
+    readonly_fields = ['score_coverage']
     list_display = ('name', 'created_at')
     search_fields = ['name']
+    actions = [_export_action('csv'), _export_action('jsonl')]
 
     formfield_overrides = {
         models.CharField: {'widget': TextInput(attrs={'size': 80})},
         models.TextField: {'widget': Textarea(attrs={'rows': 8, 'cols': 100})}
     }
 
+    def score_coverage(self, obj):
+        if obj.pk is None:
+            return 'Shown once the survey is saved.'
+        coverage = survey_coverage(obj.pk)
+        lines = ['Attainable scores: {}.'.format(
+            ', '.join(str(start) if end == start + 1 else '{} to {}'.format(start, end - 1)
+                      for start, end in coverage.reachable.intervals()) or 'none')]
+        lines += coverage.warnings() or ['Every attainable score has a result and every result can be reached.']
+        return '\n'.join(lines)
+    score_coverage.short_description = 'Coverage'
+
+    def save_related(self, request, form, formsets, change):
+        super(SurveyAdmin, self).save_related(request, form, formsets, change)
+        _warn_about_coverage(self, request, form.instance.pk)
+
 
 class AnswerInline(admin.TabularInline):
     readonly_fields = ['id']
@@ -52,6 +92,25 @@ class QuestionAdmin(admin.ModelAdmin):
         models.CharField: {'widget': TextInput(attrs={'size': 150})}
     }
 
+    def save_related(self, request, form, formsets, change):
+        super(QuestionAdmin, self).save_related(request, form, formsets, change)
+        _warn_about_coverage(self, request, form.instance.page.survey_id)
+
+
+class ResponseAnswerInline(admin.TabularInline):
+    model = ResponseAnswer
+    raw_id_fields = ['answer']
+    extra = 0
+
+
+class ResponseAdmin(admin.ModelAdmin):
+    inlines = [ResponseAnswerInline]
+    list_display = ('key', 'survey', 'score', 'result', 'created_at')
+    list_filter = ['survey']
+    list_select_related = ('survey', 'result')
+    readonly_fields = ['key', 'survey', 'score', 'result', 'created_at']
+
 
 admin.site.register(Survey, SurveyAdmin)
-admin.site.register(Question, QuestionAdmin)
\ No newline at end of file
+admin.site.register(Question, QuestionAdmin)
+admin.site.register(Response, ResponseAdmin)
@@ -0,0 +1,190 @@
+"""
+Closest alternatives for many answer sets at once, outside of the request/response cycle.
+
+The survey snapshot (survey.snapshot) is loaded once and sent to every worker of a
+multiprocessing pool. The answer sets are read, solved and written as streams,
+a window of chunks at a time, so the memory used does not depend on how many there are.
+"""
+import csv
+import json
+import logging
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+from survey.closealternative import find_closest_alternatives
+from survey.snapshot import get_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+def solve(snapshot, answer_ids, alternatives=1):
+    """Closest alternatives for one answer set, as a JSON friendly dict.
+
+    :param snapshot: SurveySnapshot
+    :param answer_ids: list
+    :param alternatives: int
+    :return: dict
+    """
+    score = snapshot.get_score(answer_ids)
+    if score is None:
+        raise ValueError('None of the answers belongs to survey {}.'.format(snapshot.id))
+    given_ans, other_ans = snapshot.split_by_page(answer_ids)
+    found = find_closest_alternatives(score=score,
+                                      next_result=snapshot.get_result_above(score),
+                                      prev_result=snapshot.get_result_below(score),
+                                      answers=given_ans,
+                                      other_answers=other_ans,
+                                      alternatives=alternatives)
+    return {
+        'score': score,
+        'better': _changes_to_json(found.get('better')),
+        'worse': _changes_to_json(found.get('worse')),
+        'truncated': found['truncated']
+    }
+
+
+def _changes_to_json(route):
+    if route is None:
+        return None
+    if isinstance(route, list):
+        return [_changes_to_json(changes) for changes in route]
+    return [{
+        'page': w.pg,
+        'question': w.q,
+        'add': [a.id for a in w.add],
+        'remove': [a.id for a in w.rm],
+        'changes': w.val,
+        'score': w.score
+    } for w in sorted(route.itervalues(), key=lambda w: w.pg)]
+
+
+_worker_snapshot = None
+
+
+def _init_worker(snapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _solve(task):
+    """Runs in a worker. Never raises, so that one bad answer set does not stop the batch.
+
+    :param task: (record_id, answer_ids, alternatives)
+    :return: dict
+    """
+    record_id, answer_ids, alternatives = task
+    record = {'id': record_id, 'answers': answer_ids}
+    if answer_ids is None:
+        record['error'] = 'The answer set could not be read.'
+        return record
+    try:
+        record.update(solve(_worker_snapshot, answer_ids, alternatives))
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    return record
+
+
+def compute_batch(survey_id, answer_sets, processes=None, chunk_size=100, alternatives=1):
+    """Closest alternatives for a stream of answer sets, yielded in the input order.
+
+    :param survey_id:
+    :param answer_sets: iterable of (record_id, answer_ids)
+    :param processes: int
+        number of worker processes (None for one per CPU, 1 to work in this process)
+    :param chunk_size: int
+        answer sets sent to a worker at a time
+    :param alternatives: int
+    :return: generator of dicts, with an 'error' key for the answer sets that failed
+    """
+    snapshot = get_snapshot(survey_id)
+    tasks = ((record_id, answer_ids, alternatives) for record_id, answer_ids in answer_sets)
+
+    if processes == 1:
+        _init_worker(snapshot)
+        for task in tasks:
+            yield _solve(task)
+        return
+
+    pool = Pool(processes, initializer=_init_worker, initargs=(snapshot,))
+    try:
+        # Pool.imap reads its whole input right away, so it only gets a window at a time
+        window_size = chunk_size * (processes or 4) * 4
+        while True:
+            window = list(islice(tasks, window_size))
+            if not window:
+                break
+            for record in pool.imap(_solve, window, chunk_size):
+                yield record
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def read_answer_sets(lines, format='jsonl'):
+    """Parse answer sets, one per line.
+
+    jsonl: a list of answer ids, or an object {"id": ..., "answers": [...]}
+    csv: the answer ids of a set on one row
+
+    Lines that can not be parsed are yielded with answer_ids set to None.
+
+    :param lines: iterable of str (e.g. a file)
+    :param format: 'jsonl' or 'csv'
+    :return: generator of (record_id, answer_ids)
+    """
+    if format == 'csv':
+        for line_num, row in enumerate(csv.reader(lines), 1):
+            try:
+                yield line_num, [int(cell) for cell in row if cell.strip()]
+            except ValueError:
+                yield line_num, None
+        return
+
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            if isinstance(data, dict):
+                yield data.get('id', line_num), [int(a) for a in data['answers']]
+            else:
+                yield line_num, [int(a) for a in data]
+        except (ValueError, TypeError, KeyError):
+            yield line_num, None
+
+
+class Progress(object):
+    def __init__(self, every=1000):
+        """Counts the processed records and reports the throughput.
+
+        :param every: int
+            report after this many records
+        :return:
+        """
+        self.every = every
+        self.done = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def add(self, record):
+        """Count one record.
+
+        :param record: dict
+        :return: str or None, a line to report
+        """
+        self.done += 1
+        if 'error' in record:
+            self.failed += 1
+        if self.every and self.done % self.every == 0:
+            return self.report()
+        return None
+
+    def report(self):
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return '{} answer sets, {} failed, {:.1f}/s'.format(self.done, self.failed, rate)
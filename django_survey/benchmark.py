@@ -0,0 +1,247 @@
+"""
+Benchmarks for the closest path search (see the survey_benchmark command).
+
+Surveys of any shape are generated from a spec: a list of pages, each a list of
+(question type, [answer scores]). The search runs on them purely in memory, or on a
+survey saved with the test factories when _prepare_result_for_display is measured too.
+
+Every phase is timed `repeat` times. Peak memory is the growth of the maximum resident size
+during one extra run, made in a forked child so that earlier peaks do not hide it.
+"""
+import datetime
+import os
+import platform
+import random
+import resource
+from timeit import default_timer
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from survey import closealternative
+from survey.closealternative import AnsTuple, SOLVERS, _prepare_result_for_display
+from survey.models import Question, Result
+
+
+def generate_spec(pages, questions, answers, min_score=-10, max_score=10, question_type=Question.MULTIPLE,
+                  seed=0):
+    """A random survey shape.
+
+    :param pages: int
+    :param questions: int
+        questions per page
+    :param answers: int
+        answers per question
+    :param question_type: Question.SINGLE, Question.MULTIPLE or 'mixed'
+    :return: list of pages, each a list of (question type, [answer scores])
+    """
+    rnd = random.Random(seed)
+    types = (Question.SINGLE, Question.MULTIPLE)
+    spec = []
+    for p in range(pages):
+        page = []
+        for q in range(questions):
+            q_type = rnd.choice(types) if question_type == 'mixed' else question_type
+            page.append((q_type, [rnd.randint(min_score, max_score) for a in range(answers)]))
+        spec.append(page)
+    return spec
+
+
+def build_in_memory(spec):
+    """Give ids to the pages, questions and answers of a spec.
+
+    :param spec: list
+    :return: dict {page_id: {question_id: (question type, [AnsTuple])}}
+    """
+    survey = {}
+    ans_id = 1
+    q_id = 1
+    for page_id, questions in enumerate(spec, 1):
+        survey[page_id] = {}
+        for q_type, scores in questions:
+            survey[page_id][q_id] = (q_type, [AnsTuple(id=ans_id + i, score=s) for i, s in enumerate(scores)])
+            ans_id += len(scores)
+            q_id += 1
+    return survey
+
+
+def load_from_db(survey):
+    """Same as build_in_memory, for a survey saved in the database.
+
+    :param survey: Survey
+    :return: dict {page_id: {question_id: (question type, [AnsTuple])}}
+    """
+    loaded = {}
+    for question in Question.objects.filter(page__survey=survey).prefetch_related('answer_set'):
+        answers = [AnsTuple(id=a.id, score=a.score) for a in sorted(question.answer_set.all(), key=lambda a: a.id)]
+        loaded.setdefault(question.page_id, {})[question.id] = (question.type, answers)
+    return loaded
+
+
+def respond(survey, seed=0):
+    """Pick the answers of a random respondent: one per radio question, a non-empty subset otherwise.
+
+    :param survey: dict from build_in_memory or load_from_db
+    :return: int, dict, dict (score, given answers, other answers)
+    """
+    rnd = random.Random(seed)
+    given = {}
+    other = {}
+    score = 0
+    for page_id, questions in survey.iteritems():
+        given[page_id] = {}
+        other[page_id] = {}
+        for q_id, (q_type, answers) in questions.iteritems():
+            if q_type == Question.SINGLE:
+                picked = [rnd.choice(answers)]
+            else:
+                picked = rnd.sample(answers, rnd.randint(1, len(answers)))
+            given[page_id][q_id] = picked
+            other[page_id][q_id] = [a for a in answers if a not in picked]
+            score += sum(a.score for a in picked)
+    return score, given, other
+
+
+def results_around(score, gap):
+    """A previous and a next result, `gap` points away from the score in both directions.
+
+    :return: Result, Result
+    """
+    return (Result(min_score=score - 2 * gap, max_score=score - gap + 1, summary='Below'),
+            Result(min_score=score + gap, max_score=score + 2 * gap, summary='Above'))
+
+
+def _time(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    times.sort()
+    return {
+        'repeat': repeat,
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'max': times[-1]
+    }
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_memory_kb(func):
+    """Growth of the maximum resident size (KB) during one call, measured in a forked child.
+
+    :return: int or None when fork is not available
+    """
+    if not hasattr(os, 'fork'):
+        return None
+    reader, writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(reader)
+            before = _max_rss_kb()
+            func()
+            os.write(writer, str(_max_rss_kb() - before))
+        finally:
+            os._exit(0)
+    os.close(writer)
+    data = os.read(reader, 32)
+    os.close(reader)
+    os.waitpid(pid, 0)
+    return int(data) if data else None
+
+
+def measure(func, repeat, memory=True):
+    """Time a function and (optionally) its peak memory.
+
+    :return: dict
+    """
+    stats = _time(func, repeat)
+    stats['peak_kb'] = _peak_memory_kb(func) if memory else None
+    return stats
+
+
+def run_benchmark(spec, solvers=('dp', 'search'), repeat=5, gap=None, seed=0, survey=None):
+    """Measure _weight_all, compute and (with a saved survey) _prepare_result_for_display.
+
+    :param spec: list from generate_spec
+    :param solvers: keys of closealternative.SOLVERS
+    :param repeat: int
+    :param gap: int
+        points between the score and the next/previous result (a third of the largest
+        possible improvement when None)
+    :param survey: Survey
+        the spec saved in the database (see survey.tests.factories.create_survey);
+        without it _prepare_result_for_display is not measured
+    :return: list of dicts, one for each solver
+    """
+    structure = load_from_db(survey) if survey is not None else build_in_memory(spec)
+    score, given, other = respond(structure, seed)
+    if gap is None:
+        largest = sum(max(max(scores) for q_type, scores in page) - min(min(scores) for q_type, scores in page)
+                      for page in spec if page)
+        gap = max(1, largest // 3)
+    prev_result, next_result = results_around(score, gap)
+
+    runs = []
+    for solver in solvers:
+        def new_path():
+            return SOLVERS[solver](score=score, next_result=next_result, prev_result=prev_result,
+                                   answers=given, other_answers=other)
+
+        phases = {
+            'weight_all': measure(lambda: new_path()._weight_all(), repeat),
+            'compute': measure(lambda: new_path().compute(), repeat)
+        }
+        if survey is not None:
+            alternatives = new_path().compute()
+            with CaptureQueriesContext(connection) as queries:
+                _prepare_result_for_display(alternatives)
+            phases['prepare'] = measure(lambda: _prepare_result_for_display(alternatives), repeat, memory=False)
+            phases['prepare']['queries'] = len(queries)
+        runs.append({
+            'solver': solver,
+            'score': score,
+            'gap': gap,
+            'phases': phases
+        })
+    return runs
+
+
+def environment():
+    """Describes where the benchmark ran, to compare results from different machines.
+
+    :return: dict
+    """
+    return {
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': closealternative.numpy is not None,
+        'database': connection.vendor
+    }
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run_with_saved_survey(spec, **kwargs):
+    """Save the spec with the test factories, run the benchmark and roll everything back.
+
+    :param kwargs: passed to run_benchmark
+    :return: list of dicts, one for each solver
+    """
+    from survey.tests.factories import create_survey
+
+    runs = []
+    try:
+        with transaction.atomic():
+            runs = run_benchmark(spec, survey=create_survey(spec), **kwargs)
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return runs
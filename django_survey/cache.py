@@ -0,0 +1,177 @@
+"""
+Process level caches for values computed from the survey content.
+
+Every survey has a content version, kept in the django cache so that all the processes
+sharing that cache see the same one. The version changes (see survey.signals) whenever
+a Survey, Page, Question, Answer or Result of that survey is saved or deleted,
+so cache keys that include it stop matching as soon as the content changes.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+
+VERSION_KEY = 'survey-content-version-{}'
+SURVEY_COUNT_KEY = 'survey-count'
+
+
+class LRUCache(object):
+    def __init__(self, max_size):
+        """A thread safe mapping that forgets the least recently used keys.
+
+        :param max_size: int
+            the number of values kept
+        :return:
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.time():
+                self.misses += 1
+                return default
+            # re-insert to mark it as the most recently used
+            self._data[key] = value, expires
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        """
+        :param key:
+        :param value:
+        :param timeout: int
+            seconds the value is kept (until it is the least recently used when None)
+        :return:
+        """
+        expires = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value, expires
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # does not count as a hit or a miss, nor mark the key as recently used
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return False
+            return expires is None or expires > time.time()
+
+    def stats(self):
+        """Counters for monitoring.
+
+        :return: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'max_size': self.max_size
+        }
+
+
+def get_survey_version(survey_id):
+    """Returns the current content version of a survey.
+
+    The version is a random token rather than a counter, so a version lost by the django cache
+    is replaced by a new one and never matches values computed for old content.
+
+    :param survey_id:
+    :return: str
+    """
+    key = VERSION_KEY.format(survey_id)
+    version = shared_cache.get(key)
+    if version is None:
+        shared_cache.add(key, uuid.uuid4().hex, None)
+        version = shared_cache.get(key)
+    return version
+
+
+def bump_survey_version(survey_id):
+    """Mark the content of a survey as changed.
+
+    :param survey_id:
+    :return:
+    """
+    shared_cache.set(VERSION_KEY.format(survey_id), uuid.uuid4().hex, None)
+
+
+def get_survey_count(count):
+    """Returns the number of surveys, cached in the django cache.
+
+    The count is forgotten when a survey is added or deleted (see survey.signals)
+    and, in any case, after SURVEY_COUNT_TIMEOUT seconds (default 300).
+
+    :param count: function
+        counts the surveys when the cached count is missing
+    :return: int
+    """
+    value = shared_cache.get(SURVEY_COUNT_KEY)
+    if value is None:
+        value = count()
+        shared_cache.set(SURVEY_COUNT_KEY, value, getattr(settings, 'SURVEY_COUNT_TIMEOUT', 300))
+    return value
+
+
+def forget_survey_count():
+    shared_cache.delete(SURVEY_COUNT_KEY)
+
+
+def closest_path_key(survey_id, score, answer_ids, alternatives):
+    """The cache key of the closest alternatives for a set of answers.
+
+    The answers are fingerprinted in a canonical form (sorted, without duplicates),
+    so the same answers submitted in a different order share the cached value.
+
+    :param survey_id:
+    :param score: int
+    :param answer_ids: list
+    :param alternatives: int
+    :return: tuple
+    """
+    canonical = ','.join(str(a) for a in sorted(set(answer_ids)))
+    fingerprint = hashlib.sha1('{}:{}:{}'.format(score, alternatives, canonical)).hexdigest()
+    return int(survey_id), get_survey_version(survey_id), fingerprint
+
+
+def cache_closest_path(key, alternatives):
+    """Keep the closest alternatives for a set of answers.
+
+    A search cut short by its deadline (a route listed under 'truncated') is only kept for
+    SURVEY_CLOSEST_PATH_TRUNCATED_TIMEOUT seconds (default 30), so that a slow moment does
+    not decide the alternatives shown for these answers until the survey changes.
+
+    :param key: from closest_path_key
+    :param alternatives: dict, from find_closest_alternatives
+    :return:
+    """
+    timeout = getattr(settings, 'SURVEY_CLOSEST_PATH_TRUNCATED_TIMEOUT', 30) if alternatives.get('truncated') else None
+    closest_path_cache.set(key, alternatives, timeout)
+
+
+closest_path_cache = LRUCache(getattr(settings, 'SURVEY_CLOSEST_PATH_CACHE_SIZE', 1000))
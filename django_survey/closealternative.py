@@ -32,60 +32,358 @@ Steps:
 
 3. Find what it would take to get from the current user answers to the *previous* result.
     Do the same as above (2) but use a variable higher_is_better that reverses some of the comparisons.
+
+OptimalPath replaces steps 2.d and 2.e with a dynamic program over the pages.
+For every number of changes it keeps the largest score improvement that can be obtained
+using at most one weight per page (a multiple-choice knapsack indexed by the number of changes).
+The answer is the smallest number of changes whose improvement reaches the points needed,
+so the result is always optimal. The work is bounded by pages * weights per page * total changes,
+and the total number of changes can never exceed the number of answers in the survey.
+
+ResultPaths answers "what would it take to reach each result" in one computation:
+a dynamic program over the pages keeps the fewest changes for every reachable score change,
+and every Result interval then reads its closest score change from it. Score changes that
+can no longer end inside a result are dropped along the way.
+
+DiscoverPath and OptimalPath accept a deadline (in milliseconds). When it passes, they stop exploring and
+return the best changes found so far; the routes cut short are listed under 'truncated'.
+ResultPaths accepts one too, and sets its truncated attribute when it was cut short.
 """
 
 import heapq
+import json
 import logging
-from operator import attrgetter
+from operator import attrgetter, itemgetter
+from timeit import default_timer
 from collections import namedtuple
-from itertools import chain
 import copy
 
 from survey.models import Question, Answer
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 logger = logging.getLogger(__name__)
+stats_logger = logging.getLogger('survey-search')
 
 AnsTuple = namedtuple("AnsTuple", ['id', 'score'])
 Weight = namedtuple('Weight', ['val', 'rm', 'add', 'q', 'pg', 'score'])
 
 
-def compute_closest_alternatives(score, next_result, prev_result, answers, other_answers):
-    d = DiscoverPath(score=score,
-                     next_result=next_result,
-                     prev_result=prev_result,
-                     answers=answers,
-                     other_answers=other_answers)
-    alternative = d.compute()
-    return _prepare_result_for_display(alternative)
-
-
-def _extract_worst(n, lst):
-    """Returns the n smallest AnsTuples from a list.
-    >>> lst = [AnsTuple(1, -10), AnsTuple(2, 0), AnsTuple(3, 10), AnsTuple(4, -1)]
-    >>> _extract_worst(3, lst)
-    [AnsTuple(id=1, score=-10), AnsTuple(id=4, score=-1), AnsTuple(id=2, score=0)]
-    >>> lst = [AnsTuple(1, 10), AnsTuple(2, 1), AnsTuple(3, 10), AnsTuple(4, -1)]
-    >>> _extract_worst(0, lst)
-    []
+def compute_closest_alternatives(score, next_result, prev_result, answers, other_answers, solver='dp',
+                                 alternatives=1, deadline=None, stats=None):
+    """Find the closest better and worse alternatives and load them for display.
+
+    See find_closest_alternatives for the parameters.
+
+    :return: dict, dict (or list, list)
+    """
+    found = find_closest_alternatives(score=score,
+                                      next_result=next_result,
+                                      prev_result=prev_result,
+                                      answers=answers,
+                                      other_answers=other_answers,
+                                      solver=solver,
+                                      alternatives=alternatives,
+                                      deadline=deadline,
+                                      stats=stats)
+    return _prepare_result_for_display(found)
+
+
+def find_closest_alternatives(score, next_result, prev_result, answers, other_answers, solver='dp',
+                              alternatives=1, deadline=None, stats=None):
+    """Find the closest better and worse alternatives, as ids (Weight and AnsTuple objects).
+
+    :param solver: str
+        a key from SOLVERS: 'dp' (OptimalPath, the default) or 'search' (DiscoverPath)
+    :param alternatives: int
+        with more than 1, each route is a list with up to that many alternatives,
+        ordered by the number of changes (only the 'dp' solver supports this)
+    :param deadline: int
+        milliseconds the search may take (no limit when None)
+    :param stats: SearchStats
+        collects counts and timings of the search, returned under 'stats'
+    :return: dict {'better': ..., 'worse': ..., 'truncated': [...]}
+    """
+    try:
+        path_class = SOLVERS[solver]
+    except KeyError:
+        raise ValueError('Unknown solver: {}'.format(solver))
+    kwargs = {}
+    if alternatives != 1:
+        if path_class is not OptimalPath:
+            raise ValueError('Only the dp solver can find more than one alternative.')
+        kwargs['alternatives'] = alternatives
+    d = path_class(score=score,
+                   next_result=next_result,
+                   prev_result=prev_result,
+                   answers=answers,
+                   other_answers=other_answers,
+                   deadline=deadline,
+                   stats=stats,
+                   **kwargs)
+    return d.compute()
+
+
+def _best_splits_python(first, second):
+    """For every number of changes w, pick the split j + k = w with the largest first[j] + second[k].
+
+    first[j] is the effect of changing j given answers, second[k] the effect of changing k other answers.
+    Splits that change nothing or leave the question without answers (j = len(first) - 1, k = 0)
+    are not allowed. On ties the split with the fewest removals (smallest j) wins.
+
+    >>> _best_splits_python([0, 5, 3], [0, 10, 12])
+    [None, (10, 0), (15, 1), (17, 1), (15, 2)]
+    >>> _best_splits_python([0], [0, 2])
+    [None, (2, 0)]
+
+    :param first: list
+    :param second: list
+    :return: list of (value, j) or None, indexed by the number of changes
     """
-    return heapq.nsmallest(n, lst, key=attrgetter('score'))
+    last = len(first) - 1
+    best = [None] * (len(first) + len(second) - 1)
+    for j, a in enumerate(first):
+        for k, b in enumerate(second):
+            if k == 0 and (j == 0 or j == last):
+                continue
+            if best[j + k] is None or a + b > best[j + k][0]:
+                best[j + k] = (a + b, j)
+    return best
+
+
+def _best_splits_numpy(first, second):
+    """Same as _best_splits_python, computed in one vectorized pass over all the splits.
+
+    :param first: list
+    :param second: list
+    :return: list of (value, j) or None, indexed by the number of changes
+    """
+    width = len(second)
+    sums = numpy.add.outer(numpy.array(first, dtype=float), numpy.array(second, dtype=float))
+    sums[0, 0] = -numpy.inf
+    sums[len(first) - 1, 0] = -numpy.inf
+    changes = numpy.add.outer(numpy.arange(len(first)), numpy.arange(width)).ravel()
+    flat = sums.ravel()
+    # lexsort is stable: ordered by changes, then largest sum, then smallest j
+    order = numpy.lexsort((-flat, changes))
+    firsts = order[numpy.unique(changes[order], return_index=True)[1]]
+    return [None if numpy.isinf(flat[i]) else (int(flat[i]), int(i) // width) for i in firsts]
+
 
+def _prefix_sums(values):
+    sums = [0]
+    for v in values:
+        sums.append(sums[-1] + v)
+    return sums
 
-def _extract_best(n, lst):
-    """Returns the n largest AnsTuples from a list.
-    >>> lst = [AnsTuple(1, -10), AnsTuple(2, 0), AnsTuple(3, -20), AnsTuple(4, -1)]
-    >>> _extract_best(2, lst)
-    [AnsTuple(id=2, score=0), AnsTuple(id=4, score=-1)]
-    >>> lst = [AnsTuple(1, 10), AnsTuple(2, 1), AnsTuple(3, 15), AnsTuple(4, -1)]
-    >>> _extract_best(0, lst)
-    []
+
+class DeltaTable(object):
+    def __init__(self, answers, other_answers):
+        """The largest and the smallest score change for 1, 2, 3... changes on one question.
+
+        The answers are sorted only once. Removing the j worst (or best) given answers
+        and adding the k best (or worst) other answers is read from the prefix sums,
+        so both routes (better and worse) are answered from the same table.
+
+        :param answers: list of AnsTuple given by the user
+        :param other_answers: list of AnsTuple not given by the user
+        :return:
+        """
+        score = attrgetter('score')
+        self.given_asc = sorted(answers, key=score)
+        self.given_desc = sorted(answers, key=score, reverse=True)
+        self.other_asc = sorted(other_answers, key=score)
+        self.other_desc = sorted(other_answers, key=score, reverse=True)
+        self.max_changes = len(answers) + len(other_answers)
+
+        self._given_asc_sums = _prefix_sums(a.score for a in self.given_asc)
+        self._given_desc_sums = _prefix_sums(a.score for a in self.given_desc)
+        self._other_asc_sums = _prefix_sums(a.score for a in self.other_asc)
+        self._other_desc_sums = _prefix_sums(a.score for a in self.other_desc)
+
+        best_splits = _best_splits_numpy if numpy is not None else _best_splits_python
+        # remove the worst given answers, add the best other answers
+        self.improve = best_splits([-s for s in self._given_asc_sums], self._other_desc_sums)
+        # remove the best given answers, add the worst other answers (maximize the negated change)
+        worsen = best_splits(self._given_desc_sums, [-s for s in self._other_asc_sums])
+        self.worsen = [(-entry[0], entry[1]) if entry else None for entry in worsen]
+
+    def get(self, changes, higher_is_better):
+        """Returns the score change and the answers to remove/add for a number of changes.
+
+        :param changes: int
+        :param higher_is_better: bool
+        :return: (int, list, list) or None if that many changes are not possible
+        """
+        if changes > self.max_changes:
+            return None
+        if higher_is_better:
+            entry = self.improve[changes]
+            rm_from, add_from = self.given_asc, self.other_desc
+        else:
+            entry = self.worsen[changes]
+            rm_from, add_from = self.given_desc, self.other_asc
+        if entry is None:
+            return None
+        score, j = entry
+        return score, rm_from[:j], add_from[:changes - j]
+
+    def fewest_changes(self, out_of_time=None):
+        """Every score change the question can make, with the fewest answer changes making it.
+
+        Removing given answers and adding other answers is a 0/1 knapsack on the score change,
+        which keeps only the fewest changes for each score change (so the changes that need
+        a middle-scored answer are found too). The question keeps at least one answer.
+        The work is bounded by the number of answers * the number of distinct score changes.
+
+        :param out_of_time: function
+            returns True when the computation must stop; the changes found so far are given
+        :return: dict {score change: (number of changes, answers to remove, answers to add)}
+        """
+        # removals only, then at least one answer added
+        removed = {0: (0, (), ())}
+        for answer in self.given_asc:
+            if out_of_time is not None and out_of_time():
+                break
+            for total, (count, to_remove, to_add) in removed.items():
+                _keep_fewer(removed, total - answer.score, (count + 1, to_remove + (answer,), ()))
+        added = {}
+        for answer in self.other_asc:
+            if out_of_time is not None and out_of_time():
+                break
+            for total, (count, to_remove, to_add) in removed.items() + added.items():
+                _keep_fewer(added, total + answer.score, (count + 1, to_remove, to_add + (answer,)))
+
+        fewest = {}
+        for total, entry in removed.iteritems():
+            # no change, or no answer left
+            if 0 < entry[0] < len(self.given_asc):
+                fewest[total] = entry
+        for total, entry in added.iteritems():
+            _keep_fewer(fewest, total, entry)
+        return fewest
+
+
+def _keep_fewer(fewest, total, entry):
+    """Store entry for total, unless an entry with as few changes is there already.
+
+    :param fewest: dict {score change: (number of changes, ...)}
     """
-    return heapq.nlargest(n, lst, key=attrgetter('score'))
+    if total not in fewest or entry[0] < fewest[total][0]:
+        fewest[total] = entry
+
+
+class _NoTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullStats(object):
+    """Accepts the search statistics and drops them. Used when no SearchStats is attached."""
+    _no_timer = _NoTimer()
+
+    def start_route(self, route):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def weight(self, weight):
+        pass
+
+    def phase(self, name):
+        return self._no_timer
+
+    def emit(self):
+        pass
+
+    def as_dict(self):
+        return None
+
+
+class _Timer(object):
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + default_timer() - self.start
+        return False
+
+
+class SearchStats(NullStats):
+    def __init__(self, callback=None):
+        """Counts and times what happens inside a search, route by route.
+
+        counts: tables (DeltaTables built), weights and weights_pruned (kept and discarded by the weighting),
+            candidates and candidates_pruned (change sets or DP entries generated and discarded),
+            all_possible_changes (change sets DiscoverPath chose from)
+        weights_per_page, weights_per_value: the kept weights, by page id and by weight value
+        timings: seconds spent in each phase
+
+        :param callback: function
+            called with as_dict() when the search is done; otherwise the statistics
+            are logged on the 'survey-search' logger at debug level
+        :return:
+        """
+        self.callback = callback
+        self.routes = {}
+        self._route = None
+
+    def start_route(self, route):
+        self._route = self.routes.setdefault(route, {
+            'counts': {},
+            'weights_per_page': {},
+            'weights_per_value': {},
+            'timings': {}
+        })
+
+    def count(self, name, n=1):
+        counts = self._route['counts']
+        counts[name] = counts.get(name, 0) + n
+
+    def set(self, name, value):
+        self._route['counts'][name] = value
+
+    def weight(self, weight):
+        self.count('weights')
+        per_page = self._route['weights_per_page']
+        per_page[weight.pg] = per_page.get(weight.pg, 0) + 1
+        per_value = self._route['weights_per_value']
+        per_value[weight.val] = per_value.get(weight.val, 0) + 1
+
+    def phase(self, name):
+        return _Timer(self._route['timings'], name)
+
+    def emit(self):
+        if self.callback is not None:
+            self.callback(self.as_dict())
+        elif stats_logger.isEnabledFor(logging.DEBUG):
+            stats_logger.debug(json.dumps(self.as_dict(), sort_keys=True))
+
+    def as_dict(self):
+        return self.routes
+
+
+NULL_STATS = NullStats()
 
 
 class DiscoverPath(object):
-    def __init__(self, score, next_result, prev_result, answers, other_answers):
+    def __init__(self, score, next_result, prev_result, answers, other_answers, deadline=None, stats=None):
         """Initializes the object.
 
         self.routes
@@ -100,6 +398,10 @@ class DiscoverPath(object):
         :param prev_result: survey.models.Result
         :param answers: dict
         :param other_answers: dict
+        :param deadline: int
+            milliseconds compute() may take, shared between the routes (no limit when None)
+        :param stats: SearchStats
+            collects counts and timings of the search (nothing is collected when None)
         :return:
         """
         self.score = score
@@ -109,6 +411,11 @@ class DiscoverPath(object):
         self.other_answers = other_answers
         self.routes = []
         self.higher_is_better = True
+        self._tables = {}
+        self.deadline = deadline
+        self._stop_at = None
+        self._timed_out = False
+        self.stats = stats if stats is not None else NULL_STATS
         if next_result:
             self.routes.append(1)
         if prev_result:
@@ -121,31 +428,73 @@ class DiscoverPath(object):
 
         Only one question per page can be changed, and the number of answers changed should be minimal.
 
-        :return: dict {'better': dict, 'worse': dict}
+        With a deadline, each route gets an equal share of the time left when it starts.
+        The routes that ran out of time are listed under 'truncated': their changes are
+        the best found in time, but maybe not the fewest possible.
+
+        With stats attached, they are emitted and also returned under 'stats'.
+
+        :return: dict {'better': dict, 'worse': dict, 'truncated': list}
         """
-        results = {}
-        for route in self.routes:
+        results = {'truncated': []}
+        if self.deadline is not None:
+            end = default_timer() + self.deadline / 1000.0
+        for i, route in enumerate(self.routes):
+            self._timed_out = False
+            if self.deadline is not None:
+                self._stop_at = default_timer() + (end - default_timer()) / (len(self.routes) - i)
             if route == 1:
                 self.higher_is_better = True
                 points_needed = self.next.min_score - self.score
-                results['better'] = self._get_changes(points_needed)
+                name = 'better'
 
             else:
                 self.higher_is_better = False
                 # + 1 because the interval is [min_score, max_score)
                 points_needed = self.score - self.prev.max_score + 1
-                results['worse'] = self._get_changes(points_needed)
+                name = 'worse'
+
+            self.stats.start_route(name)
+            with self.stats.phase('total'):
+                results[name] = self._get_changes(points_needed)
+            if self._timed_out:
+                results['truncated'].append(name)
 
+        if self.stats is not NULL_STATS:
+            self.stats.emit()
+            results['stats'] = self.stats.as_dict()
         return results
 
+    def _out_of_time(self):
+        """True once the deadline of the current route has passed.
+
+        :return: bool
+        """
+        if self._stop_at is None:
+            return False
+        if not self._timed_out and default_timer() >= self._stop_at:
+            self._timed_out = True
+        return self._timed_out
+
     def _get_changes(self, points_needed):
+        with self.stats.phase('weight_all'):
+            w_q = self._weight_all()
+        with self.stats.phase('search'):
+            all_possible_changes = self._search_all(w_q, points_needed)
+        self.stats.set('all_possible_changes', len(all_possible_changes))
+        with self.stats.phase('choose'):
+            best = self._choose_best(all_possible_changes)
+        return best
+
+    def _search_all(self, w_q, points_needed):
         all_possible_changes = []
-        w_q = self._weight_all()
         sorted_weights = {}
         for w, details in w_q.iteritems():
             sorted_weights[w] = sorted(details.itervalues(), key=attrgetter('score'), reverse=self.higher_is_better)
 
         for w, details in sorted_weights.iteritems():
+            if self._out_of_time():
+                break
             i = 0
             length = len(details)
             points_needed_cpy = points_needed
@@ -173,14 +522,16 @@ class DiscoverPath(object):
                 )
 
             if points_needed_cpy <= 0:
+                self.stats.count('candidates')
                 all_possible_changes.append(changes)
-        best = self._choose_best(all_possible_changes)
-        return best
+        return all_possible_changes
 
     def _search_lower_weight_values(self, sorted_weights, w, points_needed, changes, all_changes):
         for prev_weight in range(1, w):
             if prev_weight not in sorted_weights:
                 continue
+            if self._out_of_time():
+                return
             prev_details = sorted_weights[prev_weight]
             prev_length = len(prev_details)
             points = points_needed
@@ -191,6 +542,7 @@ class DiscoverPath(object):
                 j += 1
                 if obj.pg in changes:
                     # already used a question from this page
+                    self.stats.count('candidates_pruned')
                     continue
                 inner_changes[obj.pg] = obj
                 if self.higher_is_better:
@@ -199,6 +551,7 @@ class DiscoverPath(object):
                     points += obj.score
 
             if points <= 0:
+                self.stats.count('candidates')
                 changes_copy = copy.copy(changes)
                 changes_copy.update(inner_changes)
                 all_changes.append(changes_copy)
@@ -227,16 +580,34 @@ class DiscoverPath(object):
         """
         w = {}
 
-        for page_id, questions in self.answers.iteritems():
-            for q_id, ans in questions.iteritems():
-                num_ans = len(ans) + len(self.other_answers[page_id][q_id])
-                self._weight_question(num_ans, page_id=page_id, q_id=q_id, all_weights=w)
+        for page_id, q_id in ((page_id, q_id) for page_id, questions in self.answers.iteritems() for q_id in questions):
+            if self._out_of_time():
+                break
+            self._weight_question(self._get_table(page_id, q_id), page_id=page_id, q_id=q_id, all_weights=w)
 
+        # only the weights kept once every question is weighted
+        for details in w.itervalues():
+            for weight in details.itervalues():
+                self.stats.weight(weight)
         return w
 
-    def _weight_question(self, max_weight, page_id, q_id, all_weights):
-        for weight in range(1, max_weight + 1):
+    def _get_table(self, page_id, q_id):
+        """The DeltaTable of a question, built once and shared by both routes.
+
+        :param page_id:
+        :param q_id:
+        :return: DeltaTable
+        """
+        key = (page_id, q_id)
+        if key not in self._tables:
+            self.stats.count('tables')
+            self._tables[key] = DeltaTable(self.answers[page_id][q_id], self.other_answers[page_id][q_id])
+        return self._tables[key]
+
+    def _weight_question(self, table, page_id, q_id, all_weights):
+        for weight in range(1, table.max_changes + 1):
             best_weight = self._get_best_on_page_for_weight(
+                table=table,
                 weight=weight,
                 page_id=page_id,
                 q_id=q_id,
@@ -249,47 +620,29 @@ class DiscoverPath(object):
                     all_weights[weight][page_id] = best_weight
                     continue
                 prev_weight = all_weights[weight][page_id]
+                # one of the two is discarded
+                self.stats.count('weights_pruned')
                 if prev_weight.score < best_weight.score and self.higher_is_better\
                         or prev_weight.score > best_weight.score and not self.higher_is_better:
                     all_weights[weight][page_id] = best_weight
 
-    def _get_best_on_page_for_weight(self, weight, page_id, q_id, all_weights):
-        best_weight = None
-        for j in range(0, weight+1):
-            if self.higher_is_better:
-                smallest = _extract_worst(j, self.answers[page_id][q_id])
-                largest = _extract_best(abs(weight-j), self.other_answers[page_id][q_id])
-            else:
-                smallest = _extract_best(j, self.answers[page_id][q_id])
-                largest = _extract_worst(abs(weight-j), self.other_answers[page_id][q_id])
-            if not smallest and not largest:
-                # no changes
-                continue
-            if len(smallest) + len(largest) != weight:
-                continue
-            new_set = self._combine_answers(self.answers[page_id][q_id], smallest, largest)
-
-            if not new_set:
-                # the question should have an answer
-                continue
-            score_improvement = sum(a.score for a in new_set) - \
-                                sum(a.score for a in self.answers[page_id][q_id])
-
-            if not self._is_improvement_bigger(
-                    score_improvement, weight, page_id, all_weights
-            ) or score_improvement == 0:
-                continue
-            # if improvement less equal that other weights less that this one => skip
-            if best_weight is None or score_improvement > best_weight.score and self.higher_is_better\
-                    or score_improvement < best_weight.score and not self.higher_is_better:
-                best_weight = Weight(
-                    val=weight,
-                    score=score_improvement,
-                    rm=smallest,
-                    add=largest,
-                    q=q_id,
-                    pg=page_id)
-        return best_weight
+    def _get_best_on_page_for_weight(self, table, weight, page_id, q_id, all_weights):
+        entry = table.get(weight, self.higher_is_better)
+        if entry is None:
+            return None
+        score_improvement, to_remove, to_add = entry
+        if not self._is_improvement_bigger(
+                score_improvement, weight, page_id, all_weights
+        ) or score_improvement == 0:
+            self.stats.count('weights_pruned')
+            return None
+        return Weight(
+            val=weight,
+            score=score_improvement,
+            rm=to_remove,
+            add=to_add,
+            q=q_id,
+            pg=page_id)
 
     def _is_improvement_bigger(self, score_improvement, weight_val, page_id, all_weights):
         """
@@ -314,13 +667,328 @@ class DiscoverPath(object):
             return False
         return True
 
+
+class OptimalPath(DiscoverPath):
+    def __init__(self, score, next_result, prev_result, answers, other_answers, alternatives=1, deadline=None,
+                 stats=None):
+        """Same rules as DiscoverPath, but the combination of weights is found with a dynamic program.
+
+        :param alternatives: int
+            how many distinct change sets to return for each route, cheapest first.
+            With 1 a route is a dict (like DiscoverPath), otherwise it is a list of dicts.
+        """
+        super(OptimalPath, self).__init__(score=score,
+                                          next_result=next_result,
+                                          prev_result=prev_result,
+                                          answers=answers,
+                                          other_answers=other_answers,
+                                          deadline=deadline,
+                                          stats=stats)
+        if alternatives < 1:
+            raise ValueError('At least one alternative is needed.')
+        self.alternatives = alternatives
+
+    def _get_changes(self, points_needed):
+        """Pick at most one weight per page so that points_needed is reached with the fewest changes.
+
+        :param points_needed: int
+        :return: dict {page_id: Weight} or None if the points can not be reached,
+            or a list of such dicts when more than one alternative was asked for
+        """
+        found = self._get_alternatives(points_needed)
+        if self.alternatives == 1:
+            return found[0] if found else None
+        return found
+
+    def _get_alternatives(self, points_needed):
+        """The k best change sets, ordered by the number of changes (and by improvement for equal changes).
+
+        Every page keeps, for each number of changes, only the k largest improvements,
+        so the memory used is bounded by pages * total changes * k.
+        A kept entry is (improvement, changes before this page, rank before this page, Weight or None).
+        When time runs out, the remaining pages are left unchanged.
+
+        :param points_needed: int
+        :return: list of dicts {page_id: Weight}
+        """
+        k = self.alternatives
+        with self.stats.phase('weight_all'):
+            by_page = self._weight_all_by_page() if k == 1 else self._weight_questions_by_page()
+        with self.stats.phase('dp'):
+            levels = self._levels(by_page, k, points_needed)
+        with self.stats.phase('rebuild'):
+            return self._collect(levels, points_needed, k)
+
+    def _levels(self, by_page, k, points_needed):
+        """The dynamic program: one level per page, with the k best entries for each number of changes.
+
+        An entry that still reaches points_needed without its smallest improvement is dropped:
+        it only pads a cheaper change set, and so does everything built on it.
+
+        :param by_page: dict {page_id: [Weight]}
+        :param k: int
+        :param points_needed: int
+        :return: list of dicts {changes: [entry]}
+        """
+        improvement = itemgetter(0)
+        # the last item of an entry is the smallest improvement of its weights
+        levels = [{0: [(0, None, None, None, None)]}]
+        for page_id in sorted(by_page):
+            if self._out_of_time():
+                break
+            candidates = {}
+            for changes, entries in levels[-1].iteritems():
+                for rank, entry in enumerate(entries):
+                    candidates.setdefault(changes, []).append((entry[0], changes, rank, None, entry[4]))
+                    for weight in by_page[page_id]:
+                        gain = self._improvement(weight)
+                        smallest = gain if entry[4] is None else min(entry[4], gain)
+                        if entry[0] + gain - smallest >= points_needed:
+                            continue
+                        candidates.setdefault(changes + weight.val, []).append(
+                            (entry[0] + gain, changes, rank, weight, smallest))
+            levels.append(dict((changes, heapq.nlargest(k, entries, key=improvement))
+                               for changes, entries in candidates.iteritems()))
+            if self.stats is not NULL_STATS:
+                generated = sum(len(entries) for entries in candidates.itervalues())
+                self.stats.count('candidates', generated)
+                self.stats.count('candidates_pruned', generated - sum(len(entries) for entries in levels[-1].itervalues()))
+        return levels
+
+    def _collect(self, levels, points_needed, k):
+        """The k entries of the last level with the fewest changes that reach points_needed.
+
+        :return: list of dicts {page_id: Weight}
+        """
+        found = []
+        for changes in sorted(levels[-1]):
+            for rank, entry in enumerate(levels[-1][changes]):
+                if entry[0] < points_needed:
+                    # the entries are sorted by improvement
+                    break
+                found.append(self._rebuild(levels, changes, rank))
+                if len(found) == k:
+                    return found
+        return found
+
     @staticmethod
-    def _combine_answers(initial, to_remove, to_add):
-        answers = [a for a in initial if a not in to_remove]
-        return answers + to_add
+    def _rebuild(levels, changes, rank):
+        """Follow the kept entries back through the pages and collect the weights used.
+
+        :return: dict {page_id: Weight}
+        """
+        result = {}
+        for level in reversed(levels[1:]):
+            entry = level[changes][rank]
+            if entry[3] is not None:
+                result[entry[3].pg] = entry[3]
+            changes, rank = entry[1], entry[2]
+        return result
+
+    def _weight_all_by_page(self):
+        """The weights from _weight_all (the best question for each weight value), grouped by page.
+
+        :return: dict {page_id: [Weight]}
+        """
+        by_page = {}
+        for w, details in self._weight_all().iteritems():
+            for page_id, weight in details.iteritems():
+                by_page.setdefault(page_id, []).append(weight)
+        return by_page
+
+    def _weight_questions_by_page(self):
+        """Every useful weight of every question, grouped by page.
+
+        Unlike _weight_all, each question keeps its own weights, so the alternatives can
+        change different questions of the same page. A weight is kept only if it improves more
+        than the weights with fewer changes of the same question.
+
+        :return: dict {page_id: [Weight]}
+        """
+        by_page = {}
+        for page_id, questions in self.answers.iteritems():
+            by_page[page_id] = []
+            for q_id in questions:
+                if self._out_of_time():
+                    return by_page
+                table = self._get_table(page_id, q_id)
+                best = 0
+                for changes in range(1, table.max_changes + 1):
+                    entry = table.get(changes, self.higher_is_better)
+                    if entry is None:
+                        continue
+                    weight = Weight(val=changes, score=entry[0], rm=entry[1], add=entry[2], q=q_id, pg=page_id)
+                    if self._improvement(weight) > best:
+                        best = self._improvement(weight)
+                        self.stats.weight(weight)
+                        by_page[page_id].append(weight)
+                    else:
+                        self.stats.count('weights_pruned')
+        return by_page
+
+    def _improvement(self, weight):
+        """How much a weight moves the score towards the target result (always positive).
+
+        :param weight: Weight
+        :return: int
+        """
+        return weight.score if self.higher_is_better else -weight.score
 
 
-def _prepare_result_for_display(alternatives):
+class ResultPaths(object):
+    def __init__(self, score, results, answers, other_answers, deadline=None):
+        """The fewest changes that lead to each result of a survey, found in a single computation.
+
+        The same rules apply as for DiscoverPath: at most one question changed per page,
+        and a question keeps at least one answer. A dynamic program over the pages keeps,
+        for every total score change reachable so far, the fewest answer changes that reach it.
+        Reaching a result means landing inside its [min_score, max_score) interval.
+
+        :param score: int
+            current user score
+        :param results: list of survey.models.Result
+        :param answers: dict
+        :param other_answers: dict
+        :param deadline: int
+            milliseconds compute() may take (no limit when None); when it passes, the pages
+            not explored yet are left unchanged and truncated is set
+        :return:
+        """
+        self.score = score
+        self.results = results
+        self.answers = answers
+        self.other_answers = other_answers
+        self.deadline = deadline
+        self.truncated = False
+        self._stop_at = None
+
+    def compute(self):
+        """Find the closest changes for every result.
+
+        :return: dict {result_id: dict {page_id: Weight} or None when the result can not be reached}
+            (an empty dict for the result the user already has)
+        """
+        self.truncated = False
+        self._stop_at = default_timer() + self.deadline / 1000.0 if self.deadline is not None else None
+        if not self.results:
+            return {}
+        # the score changes that end inside a result
+        low = min(r.min_score for r in self.results) - self.score
+        high = max(r.max_score for r in self.results) - 1 - self.score
+
+        by_page = self._weight_by_page(low, high)
+        pages = sorted(by_page)
+        # how far the pages after each one can still move the score, down and up
+        reach_down = [0] * (len(pages) + 1)
+        reach_up = [0] * (len(pages) + 1)
+        for i in xrange(len(pages) - 1, -1, -1):
+            scores = [w.score for w in by_page[pages[i]]]
+            reach_down[i] = reach_down[i + 1] + min([0] + scores)
+            reach_up[i] = reach_up[i + 1] + max([0] + scores)
+
+        # fewest[score change] = fewest answer changes reaching it
+        fewest = {0: 0}
+        # one dict per page: score change -> (score change before this page, Weight used on this page)
+        steps = []
+        for i, page_id in enumerate(pages):
+            if self._out_of_time():
+                break
+            new_fewest = {}
+            step = {}
+            # the score changes the next pages can still bring inside a result
+            lowest, highest = low - reach_up[i + 1], high - reach_down[i + 1]
+            for delta, changes in fewest.iteritems():
+                if self._out_of_time():
+                    break
+                if lowest <= delta <= highest:
+                    _keep_fewer_changes(new_fewest, step, delta, changes, None)
+                for weight in by_page[page_id]:
+                    total = delta + weight.score
+                    if lowest <= total <= highest:
+                        _keep_fewer_changes(new_fewest, step, total, changes + weight.val, (delta, weight))
+            steps.append(step)
+            fewest = new_fewest
+
+        paths = {}
+        for result in self.results:
+            inside = [delta for delta in fewest if result.min_score <= self.score + delta < result.max_score]
+            if not inside:
+                paths[result.id] = None
+                continue
+            delta = min(inside, key=lambda d: (fewest[d], abs(d)))
+            path = {}
+            for step in reversed(steps):
+                if step.get(delta) is not None:
+                    delta, weight = step[delta]
+                    path[weight.pg] = weight
+            paths[result.id] = path
+        return paths
+
+    def _weight_by_page(self, low, high):
+        """For every page and every score change one question can make, the weight with the fewest changes.
+
+        The score changes beyond what the whole survey can bring back inside [low, high] are left out.
+
+        :param low: int
+        :param high: int
+        :return: dict {page_id: [Weight]}
+        """
+        by_page = {}
+        for page_id, questions in self.answers.iteritems():
+            by_score = {}
+            for q_id, ans in questions.iteritems():
+                if self._out_of_time():
+                    break
+                table = DeltaTable(ans, self.other_answers[page_id][q_id])
+                for score, (changes, to_remove, to_add) in table.fewest_changes(self._out_of_time).iteritems():
+                    if score == 0 or score in by_score and by_score[score].val <= changes:
+                        continue
+                    by_score[score] = Weight(val=changes, score=score, rm=list(to_remove), add=list(to_add),
+                                             q=q_id, pg=page_id)
+            by_page[page_id] = by_score.values()
+        # what the other pages can move the score by, at most
+        down = sum(min([0] + [w.score for w in weights]) for weights in by_page.itervalues())
+        up = sum(max([0] + [w.score for w in weights]) for weights in by_page.itervalues())
+        for page_id, weights in by_page.iteritems():
+            page_down = min([0] + [w.score for w in weights])
+            page_up = max([0] + [w.score for w in weights])
+            lowest, highest = low - (up - page_up), high - (down - page_down)
+            by_page[page_id] = [w for w in weights if lowest <= w.score <= highest]
+        return by_page
+
+    def _out_of_time(self):
+        """True once the deadline has passed.
+
+        :return: bool
+        """
+        if self._stop_at is None:
+            return False
+        if not self.truncated and default_timer() >= self._stop_at:
+            self.truncated = True
+        return self.truncated
+
+
+def _keep_fewer_changes(fewest, step, total, changes, came_from):
+    """Store the changes reaching a score change in the dynamic program of ResultPaths, when they are fewer.
+
+    :param fewest: dict {score change: number of changes}
+    :param step: dict {score change: (score change before the page, Weight) or None when the page is unchanged}
+    :param total: int
+    :param changes: int
+    :param came_from: (int, Weight) or None
+    """
+    if total not in fewest or changes < fewest[total]:
+        fewest[total] = changes
+        step[total] = came_from
+
+
+SOLVERS = {
+    'search': DiscoverPath,
+    'dp': OptimalPath
+}
+
+
+def _prepare_result_for_display(alternatives, snapshot=None):
     """Given two alternatives (better and/or worse) create a structure easy to use in the template.
 
     The structure is like this:
@@ -332,36 +1000,66 @@ def _prepare_result_for_display(alternatives):
         ...
     }
 
+    When a route holds a list of alternatives (OptimalPath with alternatives > 1)
+    a list of such structures is returned for it. The questions and answers of all
+    the alternatives are loaded with one in_bulk call each.
+
     :param alternatives:
-    :return: dict, dict
+    :param snapshot: SurveySnapshot
+        when given, its question and answer nodes are used instead of loading the objects
+    :return: dict, dict (or list, list)
     """
-    better = alternatives.get('better', {})
-    better_prepared = {}
-    worse = alternatives.get('worse', {})
-    worse_prepared = {}
-
-    question_ids = []
-    answer_ids = []
-    for w in chain(better.itervalues(), worse.itervalues()):
-        question_ids.append(w.q)
-        answer_ids += [a.id for a in w.add]
-        answer_ids += [a.id for a in w.rm]
-
-    questions = Question.objects.in_bulk(question_ids)
-    answers = Answer.objects.in_bulk(answer_ids)
-
-    for w in better.itervalues():
-        better_prepared[questions[w.q]] = {'add': [], 'rm': []}
-        better_prepared[questions[w.q]]['add'] = [answers[a.id] for a in w.add]
-        better_prepared[questions[w.q]]['rm'] = [answers[a.id] for a in w.rm]
-
-    for w in worse.itervalues():
-        worse_prepared[questions[w.q]] = {'add': [], 'rm': []}
-        worse_prepared[questions[w.q]]['add'] = [answers[a.id] for a in w.add]
-        worse_prepared[questions[w.q]]['rm'] = [answers[a.id] for a in w.rm]
+    better = alternatives.get('better') or {}
+    worse = alternatives.get('worse') or {}
+    better_list = _as_list(better)
+    prepared = _prepare_changes_for_display(better_list + _as_list(worse), snapshot)
+    better_prepared = prepared[:len(better_list)]
+    worse_prepared = prepared[len(better_list):]
+
+    if not isinstance(better, list):
+        better_prepared = better_prepared[0]
+    if not isinstance(worse, list):
+        worse_prepared = worse_prepared[0]
     return better_prepared, worse_prepared
 
 
+def _prepare_changes_for_display(all_changes, snapshot=None):
+    """Same structure as _prepare_result_for_display, for a list of change dicts.
+
+    :param all_changes: list of dicts {page_id: Weight}
+    :param snapshot: SurveySnapshot
+    :return: list of dicts {<Question obj>: {'add': [...], 'rm': [...]}}
+    """
+    if snapshot is not None:
+        questions = snapshot.questions
+        answers = snapshot.answers
+    else:
+        question_ids = []
+        answer_ids = []
+        for changes in all_changes:
+            for w in changes.itervalues():
+                question_ids.append(w.q)
+                answer_ids += [a.id for a in w.add]
+                answer_ids += [a.id for a in w.rm]
+
+        questions = Question.objects.in_bulk(question_ids)
+        answers = Answer.objects.in_bulk(answer_ids)
+
+    prepared = []
+    for changes in all_changes:
+        prepared.append({})
+        for w in changes.itervalues():
+            prepared[-1][questions[w.q]] = {
+                'add': [answers[a.id] for a in w.add],
+                'rm': [answers[a.id] for a in w.rm]
+            }
+    return prepared
+
+
+def _as_list(route):
+    return route if isinstance(route, list) else [route]
+
+
 def _main():
     import doctest
     doctest.testmod()
@@ -0,0 +1,224 @@
+"""
+Which total scores a survey can give, and whether its results cover them.
+
+A respondent answers every question: a radio question with exactly one of its answers,
+a checkbox question with any non-empty subset of them. The attainable totals are computed
+exactly with bitsets (Python integers, bit i standing for the score low + i): the scores of
+a question are the subset sums of its answers (checkbox) or its answer scores (radio), and
+the totals of the survey are the sum of these sets, one question at a time. Every step is a
+few shifts and ORs of integers as wide as the range of scores, so large surveys stay fast.
+
+The results of a survey then leave two kinds of problems:
+    uncovered scores: attainable totals that no result contains (the result page shows
+        no result for them)
+    dead results: results that contain no attainable total (nobody can get them)
+"""
+from survey.models import Question
+from survey.snapshot import get_snapshot
+
+
+class ScoreSet(object):
+    __slots__ = ('bits', 'low')
+
+    def __init__(self, bits=1, low=0):
+        """A set of integers: bit i of bits is set when low + i is in the set.
+
+        The default is {0}, the neutral element of plus.
+
+        :param bits: int
+        :param low: int
+        """
+        self.bits = bits
+        self.low = low
+
+    @classmethod
+    def from_scores(cls, scores):
+        """
+        >>> list(ScoreSet.from_scores([3, -1, 3]))
+        [-1, 3]
+
+        :param scores: iterable of int
+        :return: ScoreSet
+        """
+        scores = list(scores)
+        if not scores:
+            return cls(0)
+        low = min(scores)
+        bits = 0
+        for score in scores:
+            bits |= 1 << (score - low)
+        return cls(bits, low)
+
+    def _aligned(self, low):
+        # the bits, for a smaller (or equal) low
+        return self.bits << (self.low - low)
+
+    def shifted(self, n):
+        """Every score plus n."""
+        return ScoreSet(self.bits, self.low + n)
+
+    @classmethod
+    def interval(cls, start, end):
+        """The scores from start to end - 1."""
+        return cls((1 << max(end - start, 0)) - 1, start)
+
+    def union(self, other):
+        low = min(self.low, other.low)
+        return ScoreSet(self._aligned(low) | other._aligned(low), low)
+
+    def difference(self, other):
+        low = min(self.low, other.low)
+        return ScoreSet(self._aligned(low) & ~other._aligned(low), low)
+
+    def overlaps(self, other):
+        low = min(self.low, other.low)
+        return bool(self._aligned(low) & other._aligned(low))
+
+    def plus(self, other):
+        """All the sums of a score of this set and a score of the other one.
+
+        >>> list(ScoreSet.from_scores([0, 10]).plus(ScoreSet.from_scores([-1, 1])))
+        [-1, 1, 9, 11]
+
+        :param other: ScoreSet
+        :return: ScoreSet
+        """
+        # one shift per score of the smaller set
+        small, big = sorted((self, other), key=len)
+        bits = 0
+        for i in _bit_positions(small.bits):
+            bits |= big.bits << i
+        return ScoreSet(bits, small.low + big.low)
+
+    def intervals(self):
+        """The runs of consecutive scores, as [start, end) intervals like the results.
+
+        >>> ScoreSet.from_scores([-2, -1, 0, 4, 6, 7]).intervals()
+        [(-2, 1), (4, 5), (6, 8)]
+
+        :return: list of (int, int)
+        """
+        runs = []
+        bits = self.bits
+        offset = self.low
+        while bits:
+            start = _lowest_bit(bits)
+            bits >>= start
+            # the number of consecutive ones at the bottom
+            length = _lowest_bit(~bits)
+            runs.append((offset + start, offset + start + length))
+            bits >>= length
+            offset += start + length
+        return runs
+
+    def __contains__(self, score):
+        return score >= self.low and bool(self.bits >> (score - self.low) & 1)
+
+    def __iter__(self):
+        return (self.low + i for i in _bit_positions(self.bits))
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __nonzero__(self):
+        return self.bits != 0
+
+    def __repr__(self):
+        return 'ScoreSet({})'.format(self.intervals())
+
+
+def _lowest_bit(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+def _bit_positions(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def question_scores(question_type, scores):
+    """The scores a question can give.
+
+    >>> list(question_scores(Question.SINGLE, [1, 2, 2]))
+    [1, 2]
+    >>> list(question_scores(Question.MULTIPLE, [1, 2, -5]))
+    [-5, -4, -3, -2, 1, 2, 3]
+
+    :param question_type: Question.SINGLE (one answer) or Question.MULTIPLE (a non-empty subset)
+    :param scores: list of int, the scores of its answers
+    :return: ScoreSet, empty when the question has no answers
+    """
+    if question_type == Question.SINGLE:
+        return ScoreSet.from_scores(scores)
+    # with and without the empty subset
+    any_subset = ScoreSet()
+    non_empty = ScoreSet(0)
+    for score in scores:
+        non_empty = non_empty.union(any_subset.shifted(score))
+        any_subset = any_subset.union(any_subset.shifted(score))
+    return non_empty
+
+
+def reachable_scores(questions):
+    """The total scores a respondent can get by answering all the questions.
+
+    :param questions: iterable of (question type, [answer scores])
+    :return: ScoreSet, empty when a question has no answers
+    """
+    total = ScoreSet()
+    for question_type, scores in questions:
+        total = total.plus(question_scores(question_type, scores))
+        if not total:
+            break
+    return total
+
+
+class Coverage(object):
+    def __init__(self, reachable, results):
+        """How the results of a survey cover its attainable scores.
+
+        :param reachable: ScoreSet
+        :param results: iterable of Result (or anything with min_score and max_score)
+        """
+        self.reachable = reachable
+        self.results = sorted(results, key=lambda r: (r.min_score, r.max_score))
+        covered = ScoreSet(0)
+        # results containing no attainable score
+        self.dead = []
+        # the results are cut to the attainable range, which can be much narrower
+        low, high = reachable.low, reachable.low + reachable.bits.bit_length()
+        for result in self.results:
+            interval = ScoreSet.interval(max(result.min_score, low), min(result.max_score, high))
+            if not reachable.overlaps(interval):
+                self.dead.append(result)
+            covered = covered.union(interval)
+        # attainable scores in no result, as [start, end) intervals
+        self.uncovered = reachable.difference(covered).intervals()
+
+    def warnings(self):
+        """
+        :return: list of str
+        """
+        if not self.reachable:
+            return ['The survey can not be completed: a question has no answers.']
+        messages = []
+        for start, end in self.uncovered:
+            scores = str(start) if end == start + 1 else 'from {} to {}'.format(start, end - 1)
+            messages.append('No result for the attainable scores {}.'.format(scores))
+        for result in self.dead:
+            messages.append(u'Nobody can get the result "{}": no attainable score is between {} and {}.'.format(
+                result.summary, result.min_score, result.max_score - 1))
+        return messages
+
+
+def survey_coverage(survey_id):
+    """The coverage of a survey, from its snapshot.
+
+    :param survey_id:
+    :return: Coverage
+    """
+    snapshot = get_snapshot(survey_id)
+    questions = [(q.type, [a.score for a in q.answers]) for q in snapshot.questions.itervalues()]
+    return Coverage(reachable_scores(questions), snapshot.results)
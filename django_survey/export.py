@@ -0,0 +1,203 @@
+"""
+Streams the content and the responses of surveys as CSV or JSON lines.
+
+The structure comes from the survey snapshot and the responses are read by id, a chunk at
+a time, so the memory used does not depend on the number of responses. Every response
+carries its id as 'offset': an export stopped midway is resumed with after=<last offset>
+(the structure is only written when starting from the beginning). A CSV response spans several
+rows, so the last one of an interrupted CSV export may be incomplete: cut_csv removes its rows,
+and the export resumes with that response.
+
+JSON lines: one {"type": "answer", ...} line per answer of the survey, then one
+{"type": "response", ...} line per response with the ids of the answers given.
+CSV: the same columns for every row (CSV_COLUMNS); a row per answer of the survey without
+the response columns, then a row per answer given in each response.
+"""
+import csv
+import json
+
+from survey.models import Response, ResponseAnswer
+from survey.snapshot import get_snapshot
+
+
+CSV_COLUMNS = ['survey_id', 'offset', 'response_key', 'created_at', 'score', 'result_id',
+               'page_num', 'question_id', 'question_text', 'question_type', 'answer_id', 'answer_text',
+               'answer_score']
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+
+def iter_responses(survey_id, after=0, chunk_size=1000):
+    """The responses of a survey, by id, with the answers given.
+
+    :param survey_id:
+    :param after: int
+        only the responses with a bigger id
+    :param chunk_size: int
+        responses read at a time (two queries per chunk)
+    :return: generator of ((id, key, created_at, score, result_id), [answer ids])
+    """
+    last_id = after
+    while True:
+        chunk = list(Response.objects.filter(survey=survey_id, id__gt=last_id).order_by('id').values_list(
+            'id', 'key', 'created_at', 'score', 'result_id')[:chunk_size])
+        if not chunk:
+            return
+        answers = {}
+        rows = ResponseAnswer.objects.filter(response__in=[row[1] for row in chunk]).order_by('id').values_list(
+            'response_id', 'answer_id')
+        for key, answer_id in rows.iterator():
+            answers.setdefault(key, []).append(answer_id)
+        for row in chunk:
+            yield row, answers.get(row[1], [])
+        last_id = chunk[-1][0]
+
+
+def _structure(snapshot):
+    page_nums = dict(zip(snapshot.page_ids, snapshot.page_nums))
+    for page_id in snapshot.page_ids:
+        for question in snapshot.page_questions[page_id]:
+            for answer in question.answers:
+                yield page_nums[page_id], question, answer
+
+
+def _answer_fields(page_nums, snapshot, answer_id):
+    answer = snapshot.answers.get(answer_id)
+    if answer is None:
+        # deleted since
+        return [None, None, None, None, answer_id, None, None]
+    question = snapshot.questions[answer.question_id]
+    return [page_nums[question.page_id], question.id, question.question_text, question.type,
+            answer.id, answer.answer_text, answer.score]
+
+
+def export_rows(survey_id, after=0, chunk_size=1000, structure=None):
+    """The CSV rows (without the header) of a survey.
+
+    :param survey_id:
+    :param after: int
+    :param chunk_size: int
+    :param structure: bool
+        write the rows of the survey answers first (by default when not resuming)
+    :return: generator of lists, with the CSV_COLUMNS values
+    """
+    snapshot = get_snapshot(survey_id)
+    page_nums = dict(zip(snapshot.page_ids, snapshot.page_nums))
+    if structure is None:
+        structure = not after
+    if structure:
+        for page_num, question, answer in _structure(snapshot):
+            yield [snapshot.id, None, None, None, None, None] + _answer_fields(page_nums, snapshot, answer.id)
+    for (offset, key, created_at, score, result_id), answer_ids in iter_responses(survey_id, after, chunk_size):
+        response = [snapshot.id, offset, key, created_at.isoformat(), score, result_id]
+        for answer_id in answer_ids:
+            yield response + _answer_fields(page_nums, snapshot, answer_id)
+
+
+def export_records(survey_id, after=0, chunk_size=1000, structure=None):
+    """The JSON lines records of a survey.
+
+    :param survey_id:
+    :param after: int
+    :param chunk_size: int
+    :param structure: bool
+        write the records of the survey answers first (by default when not resuming)
+    :return: generator of dicts
+    """
+    snapshot = get_snapshot(survey_id)
+    if structure is None:
+        structure = not after
+    if structure:
+        for page_num, question, answer in _structure(snapshot):
+            yield {
+                'type': 'answer',
+                'survey_id': snapshot.id,
+                'page_num': page_num,
+                'question_id': question.id,
+                'question_text': question.question_text,
+                'question_type': question.type,
+                'answer_id': answer.id,
+                'answer_text': answer.answer_text,
+                'score': answer.score
+            }
+    for (offset, key, created_at, score, result_id), answer_ids in iter_responses(survey_id, after, chunk_size):
+        yield {
+            'type': 'response',
+            'survey_id': snapshot.id,
+            'offset': offset,
+            'key': key,
+            'created_at': created_at.isoformat(),
+            'score': score,
+            'result_id': result_id,
+            'answer_ids': answer_ids
+        }
+
+
+class _Echo(object):
+    """A file-like object for csv.writer that returns the lines instead of storing them."""
+    def write(self, value):
+        return value
+
+
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+
+def stream(survey_ids, format='csv', after=0, chunk_size=1000, structure=None):
+    """The lines of the export of some surveys.
+
+    :param survey_ids: list
+    :param format: str
+        csv or jsonl
+    :param after: int
+        resume after this offset (the same for all the surveys)
+    :param chunk_size: int
+    :param structure: bool
+        export the survey answers before the responses (by default when not resuming)
+    :return: generator of str
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format {!r}, use one of {}.'.format(format, ', '.join(FORMATS)))
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for survey_id in survey_ids:
+            for row in export_rows(survey_id, after, chunk_size, structure):
+                yield writer.writerow([_encode(value) for value in row])
+    else:
+        for survey_id in survey_ids:
+            for record in export_records(survey_id, after, chunk_size, structure):
+                yield json.dumps(record) + '\n'
+
+
+def cut_csv(f, offset):
+    """Remove the rows of a response, and of the ones after it, from a CSV export.
+
+    The export may have stopped between two rows of its last response: its rows are removed,
+    so that it is written again, in full, by the resumed export.
+
+    :param f: the export file, open in 'r+b' mode
+    :param offset: int
+        the offset of the response
+    :return:
+    """
+    f.seek(0)
+    # where the last row read ends (a row can span several lines)
+    end = [0]
+
+    def lines():
+        for line in iter(f.readline, ''):
+            end[0] = f.tell()
+            yield line
+
+    kept = 0
+    for i, row in enumerate(csv.reader(lines())):
+        # the header, the survey answers, then the responses by offset
+        if i > 0 and row[1] and int(row[1]) >= offset:
+            break
+        kept = end[0]
+    f.seek(kept)
+    f.truncate()
@@ -0,0 +1,189 @@
+"""
+Imports surveys from a compact JSON or YAML description.
+
+A survey is described as:
+
+    {
+        "name": "...",
+        "description": "...",
+        "pages": [
+            [
+                {"text": "...", "type": "radio", "answers": [{"text": "...", "score": 1}, ...]},
+                ...
+            ],
+            ...
+        ],
+        "results": [{"summary": "...", "description": "...", "min_score": 0, "max_score": 10}, ...]
+    }
+
+The pages are lists of questions, numbered from 1; "type" is radio or checkbox (default);
+"description" is optional. A survey is validated first, then inserted in one transaction
+with one bulk_create per level (pages, questions, answers, results).
+
+Input formats: json (one survey or a list of surveys), jsonl (one survey per line, read a
+line at a time) and yaml (one survey per document, read a document at a time; needs PyYAML).
+"""
+import json
+import logging
+
+from django.db import transaction
+
+from survey.cache import bump_survey_version
+from survey.models import Survey, Page, Question, Answer, Result
+from survey.utils import ResultIndex
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('json', 'jsonl', 'yaml')
+QUESTION_TYPES = [choice for choice, name in Question.TYPE_IN_CHOICES]
+
+
+class InvalidSurvey(ValueError):
+    pass
+
+
+def read_surveys(stream, format='json'):
+    """The survey descriptions in a file.
+
+    :param stream: file
+    :param format: str
+        json, jsonl or yaml
+    :return: generator of dicts
+    """
+    if format == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise InvalidSurvey('Line {}: {}'.format(line_num, e))
+    elif format == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            raise InvalidSurvey(str(e))
+        for survey in (data if isinstance(data, list) else [data]):
+            yield survey
+    elif format == 'yaml':
+        if yaml is None:
+            raise InvalidSurvey('PyYAML is needed to read YAML files.')
+        for survey in yaml.safe_load_all(stream):
+            if survey is not None:
+                yield survey
+    else:
+        raise ValueError('Unknown format {!r}, use one of {}.'.format(format, ', '.join(FORMATS)))
+
+
+def _check(condition, message, *args):
+    if not condition:
+        raise InvalidSurvey(message.format(*args))
+
+
+def validate(data):
+    """Check a survey description.
+
+    :param data: dict
+    :return: list of warnings (str)
+    :raise: InvalidSurvey
+    """
+    _check(isinstance(data, dict), 'A survey must be an object, not {!r}.', type(data).__name__)
+    _check(data.get('name'), 'A survey needs a name.')
+    name = data['name']
+    pages = data.get('pages', [])
+    _check(isinstance(pages, list), '{}: pages must be a list.', name)
+    for page_num, questions in enumerate(pages, 1):
+        _check(isinstance(questions, list), '{}, page {}: a page must be a list of questions.', name, page_num)
+        for position, question in enumerate(questions, 1):
+            where = '{}, page {}, question {}'.format(name, page_num, position)
+            _check(isinstance(question, dict) and question.get('text'), '{}: a question needs a text.', where)
+            _check(question.get('type', Question.MULTIPLE) in QUESTION_TYPES,
+                   '{}: the type must be one of {}.', where, ', '.join(QUESTION_TYPES))
+            answers = question.get('answers')
+            _check(isinstance(answers, list) and answers, '{}: a question needs answers.', where)
+            for answer in answers:
+                _check(isinstance(answer, dict) and answer.get('text') and isinstance(answer.get('score'), int),
+                       '{}: an answer needs a text and an integer score.', where)
+
+    results = data.get('results', [])
+    _check(isinstance(results, list), '{}: results must be a list.', name)
+    for result in results:
+        _check(isinstance(result, dict) and result.get('summary'), '{}: a result needs a summary.', name)
+        _check(isinstance(result.get('min_score'), int) and isinstance(result.get('max_score'), int),
+               '{}, result {}: the scores must be integers.', name, result['summary'])
+        _check(result['min_score'] < result['max_score'],
+               '{}, result {}: min_score must be smaller than max_score.', name, result['summary'])
+    index = ResultIndex(Result(summary=r['summary'], min_score=r['min_score'], max_score=r['max_score'])
+                        for r in results)
+    for prev, result in index.overlaps:
+        raise InvalidSurvey('{}: results {} and {} overlap.'.format(name, prev.summary, result.summary))
+    return ['{}: no result for the scores from {} to {}.'.format(name, prev.max_score, result.min_score - 1)
+            for prev, result in index.gaps]
+
+
+def import_survey(data, batch_size=500):
+    """Validate and save a survey description.
+
+    Takes a constant number of queries per level, whatever the survey size
+    (more than one for the levels with more than batch_size objects).
+
+    :param data: dict
+    :param batch_size: int
+    :return: Survey, list of warnings
+    :raise: InvalidSurvey
+    """
+    warnings = validate(data)
+    pages = data.get('pages', [])
+    with transaction.atomic():
+        survey = Survey(name=data['name'], description=data.get('description'))
+        survey.save()
+
+        Page.objects.bulk_create([Page(survey=survey, page_num=page_num)
+                                  for page_num in xrange(1, len(pages) + 1)], batch_size)
+        # bulk_create does not set the ids (on most databases), so they are read back
+        page_ids = dict(Page.objects.filter(survey=survey).values_list('page_num', 'id'))
+
+        Question.objects.bulk_create([
+            Question(page_id=page_ids[page_num], position=position, question_text=question['text'],
+                     type=question.get('type', Question.MULTIPLE))
+            for page_num, questions in enumerate(pages, 1)
+            for position, question in enumerate(questions, 1)
+        ], batch_size)
+        question_ids = dict(((page_id, position), q_id) for q_id, page_id, position in Question.objects.filter(
+            page__survey=survey).values_list('id', 'page_id', 'position'))
+
+        Answer.objects.bulk_create([
+            Answer(question_id=question_ids[page_ids[page_num], position], answer_text=answer['text'],
+                   score=answer['score'])
+            for page_num, questions in enumerate(pages, 1)
+            for position, question in enumerate(questions, 1)
+            for answer in question['answers']
+        ], batch_size)
+
+        Result.objects.bulk_create([
+            Result(survey=survey, summary=result['summary'], description=result.get('description'),
+                   min_score=result['min_score'], max_score=result['max_score'])
+            for result in data.get('results', [])
+        ], batch_size)
+    # bulk_create sends no signals
+    bump_survey_version(survey.id)
+    return survey, warnings
+
+
+def import_surveys(stream, format='json', batch_size=500):
+    """Import all the surveys of a file, each one in its own transaction.
+
+    :param stream: file
+    :param format: str
+    :param batch_size: int
+    :return: generator of (Survey, warnings)
+    :raise: InvalidSurvey, for the first invalid survey (the ones before it are saved)
+    """
+    for data in read_surveys(stream, format):
+        yield import_survey(data, batch_size)
@@ -0,0 +1,212 @@
+"""
+Runs the closest path search in a local worker pool, away from the request threads.
+
+When a respondent finishes a survey, SurveyView submits the search with everything it needs
+already loaded from the database, so the workers never touch the database.
+The result is stored in survey.cache.closest_path_cache, where ClosestPath picks it up.
+The better and the worse routes are submitted as separate jobs, so that ClosestPathStream
+can send each one as soon as it is found.
+
+Settings:
+    SURVEY_CLOSEST_PATH_POOL: 'thread' (default), 'process', or None to search right away
+    SURVEY_CLOSEST_PATH_WORKERS: number of workers in the pool (default 2)
+"""
+import atexit
+import logging
+import threading
+from multiprocessing.pool import Pool, ThreadPool
+from timeit import default_timer
+
+from django.conf import settings
+
+from survey.cache import cache_closest_path, closest_path_cache
+from survey.closealternative import find_closest_alternatives
+
+
+logger = logging.getLogger(__name__)
+
+POOLS = {
+    'thread': ThreadPool,
+    'process': Pool
+}
+
+
+def _search(kwargs):
+    """Runs in a worker. Exceptions are returned, as the pool has no error callback.
+
+    :param kwargs: dict
+        the arguments for find_closest_alternatives
+    :return: (dict, None) or (None, str)
+    """
+    try:
+        return find_closest_alternatives(**kwargs), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def _search_named(item):
+    name, kwargs = item
+    return name, _search(kwargs)
+
+
+def merge_routes(outcomes):
+    """The result of a whole search, from the results of its routes searched separately.
+
+    :param outcomes: dict {route name: dict from find_closest_alternatives for that route only}
+    :return: dict {'better': ..., 'worse': ..., 'truncated': [...]}
+    """
+    alternatives = {'truncated': []}
+    for name, route_alternatives in outcomes.iteritems():
+        alternatives[name] = route_alternatives.get(name)
+        alternatives['truncated'] += route_alternatives['truncated']
+    return alternatives
+
+
+class _Routes(object):
+    """The routes of a search submitted with submit_routes, filled in as they finish."""
+
+    def __init__(self, names, expires=None):
+        self.names = set(names)
+        # name -> (dict, None) or (None, str)
+        self.outcomes = {}
+        # the default_timer() after which the search is given up on, None to wait for it forever
+        self.expires = expires
+
+    def finished(self):
+        return len(self.outcomes) == len(self.names)
+
+    def expired(self):
+        return self.expires is not None and default_timer() > self.expires
+
+
+class ClosestPathJobs(object):
+    def __init__(self):
+        self._pool = None
+        # key -> _Routes
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._route_finished = threading.Condition(self._lock)
+
+    def submit_routes(self, key, searches, expire_after=None):
+        """Start the routes of a search separately, unless its result is already cached or being computed.
+
+        Each route can be waited for with wait_routes. Once all of them are done, their results
+        are merged and cached under key (unless one of them failed).
+
+        :param key: the closest_path_cache key of the result
+        :param searches: dict {route name: the arguments for find_closest_alternatives, for that route only}
+        :param expire_after: float
+            seconds after which the search is no longer seen as pending, in case its routes never
+            finish (a process worker that died); None to wait for it forever
+        :return:
+        """
+        with self._lock:
+            if key in closest_path_cache or self._get_pending(key) is not None:
+                return
+            pool = self._get_pool()
+            expires = default_timer() + expire_after if expire_after is not None else None
+            routes = self._pending[key] = _Routes(searches, expires)
+        for item in searches.iteritems():
+            if pool is None:
+                self._route_done(key, routes, _search_named(item))
+            else:
+                pool.apply_async(_search_named, (item,), callback=lambda result: self._route_done(key, routes, result))
+
+    def wait_routes(self, key, timeout):
+        """The outcome of each route of a search started with submit_routes, as soon as it is ready.
+
+        :param key: the closest_path_cache key of the result
+        :param timeout: float
+            seconds to wait for all the routes
+        :return: generator of (name, (dict, None) or (None, str)), in the order they finish;
+            nothing when no such search is pending, and not the routes unfinished in time
+        """
+        end = default_timer() + timeout
+        given = set()
+        with self._lock:
+            routes = self._get_pending(key)
+        if routes is None:
+            return
+        while len(given) < len(routes.names):
+            with self._route_finished:
+                ready = [item for item in routes.outcomes.iteritems() if item[0] not in given]
+                left = end - default_timer()
+                if not ready and left > 0:
+                    self._route_finished.wait(left)
+                    ready = [item for item in routes.outcomes.iteritems() if item[0] not in given]
+            if not ready and default_timer() >= end:
+                return
+            for name, outcome in ready:
+                given.add(name)
+                yield name, outcome
+
+    def search_each(self, searches):
+        """Run several searches at the same time and give each outcome as soon as it is ready.
+
+        Without a pool the searches run one after the other, in the calling thread.
+
+        :param searches: dict {name: the arguments for find_closest_alternatives}
+        :return: generator of (name, (dict, None) or (None, str)), in the order they finish
+        """
+        with self._lock:
+            pool = self._get_pool()
+        if pool is None:
+            for item in searches.iteritems():
+                yield _search_named(item)
+            return
+        for name, outcome in pool.imap_unordered(_search_named, searches.items()):
+            yield name, outcome
+
+    def is_pending(self, key):
+        with self._lock:
+            return self._get_pending(key) is not None
+
+    def _get_pending(self, key):
+        """The routes of the search pending for key, if it has not expired. Called with the lock held.
+
+        :return: _Routes or None
+        """
+        routes = self._pending.get(key)
+        if routes is not None and routes.expired():
+            logger.error('Closest path search expired before its routes finished: {}'.format(key))
+            del self._pending[key]
+            return None
+        return routes
+
+    def _route_done(self, key, routes, result):
+        name, (alternatives, error) = result
+        if error:
+            logger.error('Closest path search failed ({}): {}'.format(name, error))
+        with self._route_finished:
+            routes.outcomes[name] = alternatives, error
+            if routes.finished():
+                if not any(error for alternatives, error in routes.outcomes.itervalues()):
+                    cache_closest_path(key, merge_routes(dict(
+                        (name, alternatives) for name, (alternatives, error) in routes.outcomes.iteritems())))
+                # unless it expired and was submitted again
+                if self._pending.get(key) is routes:
+                    del self._pending[key]
+            self._route_finished.notify_all()
+
+    def _get_pool(self):
+        kind = getattr(settings, 'SURVEY_CLOSEST_PATH_POOL', 'thread')
+        if kind is None:
+            return None
+        if self._pool is None:
+            self._pool = POOLS[kind](getattr(settings, 'SURVEY_CLOSEST_PATH_WORKERS', 2))
+        return self._pool
+
+    def shutdown(self):
+        """Wait for the running searches and stop the workers.
+
+        :return:
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+closest_path_jobs = ClosestPathJobs()
+atexit.register(closest_path_jobs.shutdown)
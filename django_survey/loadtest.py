@@ -0,0 +1,314 @@
+"""
+Load tests of the respondent flow (see the survey_loadtest command).
+
+Every simulated respondent walks a survey end to end, like a browser: the survey list, a GET
+and a POST with valid answers for each page, the result and the closest path. The closest path
+is read from closest_path/stream, like the result page does, until both routes arrive; or, in
+polling mode, from closest_path (polled while the search started at the end of the survey is
+running). Radio questions get one answer, checkbox questions a random non-empty subset.
+
+The requests go either through the Django test client, in this process, or over HTTP to a
+running server (base_url). The respondents are shared by a pool of threads; the surveys are
+read from their snapshots beforehand, so the threads only make requests.
+
+The report gives the throughput and, for each url name of survey/urls.py, the number of
+requests, the error rate and the p50/p95/p99 latencies.
+"""
+import cookielib
+import json
+import math
+import random
+import threading
+import time
+import urllib
+import urllib2
+from Queue import Queue, Empty
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+
+from survey.models import Question
+from survey.snapshot import get_snapshot
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def plan_survey(survey_id):
+    """What a respondent can answer on each page of a survey.
+
+    :param survey_id:
+    :return: list of (page_num, [(question id, question type, [answer ids])])
+    """
+    snapshot = get_snapshot(survey_id)
+    return [(page_num, [(q.id, q.type, [a.id for a in q.answers]) for q in snapshot.get_questions(page_num)])
+            for page_num in snapshot.page_nums]
+
+
+def pick_answers(questions, rnd):
+    """Valid answers for the questions of a page, as POST data.
+
+    :param questions: list of (question id, question type, [answer ids])
+    :param rnd: random.Random
+    :return: dict
+    """
+    data = {}
+    for q_id, q_type, answer_ids in questions:
+        if q_type == Question.SINGLE:
+            given = [rnd.choice(answer_ids)]
+        else:
+            given = rnd.sample(answer_ids, rnd.randint(1, len(answer_ids)))
+        data['question[{}]'.format(q_id)] = given
+    return data
+
+
+class ClientTransport(object):
+    """Requests made in this process through the Django test client (no network)."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        """
+        :return: int, the status code
+        """
+        return getattr(self.client, method)(path, data or {}).status_code
+
+    def read(self, path):
+        """A GET that reads the whole body, streamed or not.
+
+        :return: int, str: the status code and the body
+        """
+        response = self.client.get(path)
+        body = ''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body
+
+
+class _NoRedirect(urllib2.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport(object):
+    """Requests made over HTTP to a running server, with a browser's cookies and CSRF token."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = cookielib.CookieJar()
+        self.opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        """
+        :return: int, the status code
+        """
+        return self._open(method, path, data)[0]
+
+    def read(self, path):
+        """A GET that reads the whole body, streamed or not.
+
+        :return: int, str: the status code and the body
+        """
+        return self._open('get', path)
+
+    def _open(self, method, path, data=None):
+        body = None
+        if method == 'post':
+            data = dict(data or {})
+            for cookie in self.cookies:
+                if cookie.name == settings.CSRF_COOKIE_NAME:
+                    data['csrfmiddlewaretoken'] = cookie.value
+            body = urllib.urlencode(data, doseq=True)
+        try:
+            response = self.opener.open(self.base_url + path, body)
+        except urllib2.HTTPError as e:
+            # the redirects, which are not followed, and the errors
+            return e.code, e.read()
+        return response.getcode(), response.read()
+
+
+class Respondent(object):
+    def __init__(self, transport, record, rnd, poll_interval=0.05, max_polls=100, stream=True):
+        """Walks surveys through a transport.
+
+        :param transport: ClientTransport or HttpTransport
+        :param record: function(url name, seconds, ok)
+        :param rnd: random.Random
+        :param poll_interval: float
+            seconds between two requests for a closest path that is being searched
+        :param max_polls: int
+        :param stream: bool
+            read the closest path from its stream, like the result page, instead of polling it
+        :return:
+        """
+        self.transport = transport
+        self.record = record
+        self.rnd = rnd
+        self.poll_interval = poll_interval
+        self.max_polls = max_polls
+        self.stream = stream
+
+    def _request(self, method, url_name, args=(), data=None, expected=(200,)):
+        start = default_timer()
+        try:
+            status = self.transport.request(method, reverse(url_name, args=args), data)
+        except Exception:
+            self.record(url_name, default_timer() - start, False)
+            raise
+        ok = status in expected
+        self.record(url_name, default_timer() - start, ok)
+        if not ok:
+            raise ValueError('{} {}: status {}'.format(method.upper(), url_name, status))
+        return status
+
+    def walk(self, survey_id, plan):
+        """Take a survey from the list to the closest path.
+
+        :param survey_id:
+        :param plan: list from plan_survey
+        :return:
+        """
+        self._request('get', 'survey:list')
+        for page_num, questions in plan:
+            self._request('get', 'survey:survey', (survey_id, page_num))
+            self._request('post', 'survey:survey', (survey_id, page_num), pick_answers(questions, self.rnd),
+                          expected=(302,))
+        self._request('get', 'survey:result', (survey_id,))
+        if self.stream:
+            self._read_stream(survey_id)
+            return
+        for i in xrange(self.max_polls):
+            if self._request('get', 'survey:closest', (survey_id,), expected=(200, 202)) == 200:
+                return
+            time.sleep(self.poll_interval)
+        raise ValueError('The closest path was still pending after {} polls.'.format(self.max_polls))
+
+
+    def _read_stream(self, survey_id):
+        """Read the closest path stream to its end, which is when the last route arrives."""
+        url_name = 'survey:closest_stream'
+        start = default_timer()
+        try:
+            status, body = self.transport.read(reverse(url_name, args=(survey_id,)))
+            chunks = [json.loads(line) for line in body.splitlines()] if status == 200 else []
+        except Exception:
+            self.record(url_name, default_timer() - start, False)
+            raise
+        routes = sorted(chunk['route'] for chunk in chunks if 'html' in chunk)
+        ok = status == 200 and routes == ['better', 'worse']
+        self.record(url_name, default_timer() - start, ok)
+        if not ok:
+            raise ValueError('GET {}: status {}, routes {}'.format(url_name, status, routes))
+
+
+def _percentile(ordered, percent):
+    # nearest rank
+    return ordered[max(0, int(math.ceil(percent / 100.0 * len(ordered))) - 1)]
+
+
+def summarize(samples, elapsed):
+    """The report of a load test.
+
+    :param samples: list of (url name, seconds, ok)
+    :param elapsed: float
+        seconds the load test took
+    :return: dict
+    """
+    by_name = {}
+    for url_name, seconds, ok in samples:
+        by_name.setdefault(url_name, []).append((seconds, ok))
+    urls = {}
+    for url_name, timings in by_name.iteritems():
+        ordered = sorted(seconds for seconds, ok in timings)
+        errors = sum(1 for seconds, ok in timings if not ok)
+        urls[url_name] = dict(
+            [('p{}'.format(p), _percentile(ordered, p)) for p in PERCENTILES],
+            requests=len(timings),
+            errors=errors,
+            error_rate=float(errors) / len(timings),
+            mean=sum(ordered) / len(ordered)
+        )
+    return {
+        'elapsed': elapsed,
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else None,
+        'urls': urls
+    }
+
+
+def run_load_test(survey_ids, respondents=10, concurrency=2, base_url=None, seed=0, poll_interval=0.05,
+                  stream=True):
+    """Have respondents walk the surveys, `concurrency` of them at a time.
+
+    With one respondent at a time the walks run in the calling thread.
+
+    :param survey_ids: list
+        each respondent takes one of them at random
+    :param respondents: int
+    :param concurrency: int
+    :param base_url: str
+        the root of a running server (like http://localhost:8000); the requests go through
+        the Django test client when None
+    :param seed: int
+    :param poll_interval: float
+    :param stream: bool
+        read the closest path from its stream (as the result page does), or poll it
+    :return: dict, see summarize, with the number of respondents and of failed walks
+    """
+    plans = dict((survey_id, plan_survey(survey_id)) for survey_id in survey_ids)
+    rnd = random.Random(seed)
+    todo = Queue()
+    for i in xrange(respondents):
+        survey_id = rnd.choice(survey_ids)
+        todo.put((survey_id, random.Random(rnd.random())))
+
+    samples = []
+    failures = []
+    lock = threading.Lock()
+
+    def record(url_name, seconds, ok):
+        with lock:
+            samples.append((url_name, seconds, ok))
+
+    def work():
+        while True:
+            try:
+                survey_id, respondent_rnd = todo.get_nowait()
+            except Empty:
+                return
+            transport = HttpTransport(base_url) if base_url else ClientTransport()
+            try:
+                Respondent(transport, record, respondent_rnd, poll_interval, stream=stream).walk(
+                    survey_id, plans[survey_id])
+            except Exception as e:
+                with lock:
+                    failures.append('{}: {}'.format(type(e).__name__, e))
+
+    def work_in_thread():
+        try:
+            work()
+        finally:
+            # the connection of this thread, when the requests go through the test client
+            connection.close()
+
+    start = default_timer()
+    if concurrency <= 1:
+        work()
+    else:
+        threads = [threading.Thread(target=work_in_thread, name='survey-load-{}'.format(i))
+                   for i in xrange(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    report = summarize(samples, default_timer() - start)
+    report.update({
+        'respondents': respondents,
+        'concurrency': concurrency,
+        'stream': stream,
+        'failed': len(failures),
+        'failures': sorted(set(failures))
+    })
+    return report
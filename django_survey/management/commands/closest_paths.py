@@ -0,0 +1,62 @@
+import json
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.batch import Progress, compute_batch, read_answer_sets
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default=None, dest='format',
+                    help='Input format: jsonl or csv (guessed from the file extension by default).'),
+        make_option('-o', '--output', default=None, dest='output',
+                    help='Write the results (JSON lines) to this file instead of stdout.'),
+        make_option('--processes', default=None, dest='processes', type='int',
+                    help='Number of worker processes (one per CPU by default, 1 to use no pool).'),
+        make_option('--chunk-size', default=100, dest='chunk_size', type='int',
+                    help='Answer sets sent to a worker at a time.'),
+        make_option('--alternatives', default=1, dest='alternatives', type='int',
+                    help='How many alternatives to find for each route.'),
+        make_option('--progress', default=1000, dest='progress', type='int',
+                    help='Report the progress after this many answer sets (0 to disable).'),
+    )
+    help = ('Find the closest better and worse alternatives for many answer sets of a survey. '
+            'The input has one answer set per line (a JSON list of answer ids, '
+            'an object {"id": ..., "answers": [...]}, or a CSV row of answer ids); '
+            'use - to read from stdin.')
+    args = '<survey_id> <input_file>'
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: closest_paths {}'.format(self.args))
+        survey_id, input_path = args
+        if not Survey.objects.filter(pk=survey_id).exists():
+            raise CommandError('Survey {} does not exist.'.format(survey_id))
+
+        input_format = options['format'] or ('csv' if input_path.endswith('.csv') else 'jsonl')
+        if input_format not in ('jsonl', 'csv'):
+            raise CommandError('Unknown input format: {}'.format(input_format))
+
+        input_file = sys.stdin if input_path == '-' else open(input_path, 'rb')
+        output = open(options['output'], 'wb') if options['output'] else self.stdout
+        progress = Progress(options['progress'])
+        try:
+            records = compute_batch(survey_id,
+                                    read_answer_sets(input_file, input_format),
+                                    processes=options['processes'],
+                                    chunk_size=options['chunk_size'],
+                                    alternatives=options['alternatives'])
+            for record in records:
+                output.write(json.dumps(record) + '\n')
+                report = progress.add(record)
+                if report:
+                    self.stderr.write(report)
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+            if options['output']:
+                output.close()
+        self.stderr.write('Done: {}'.format(progress.report()))
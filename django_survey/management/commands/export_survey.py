@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey import export
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='csv', dest='format',
+                    help='Output format: csv (default) or jsonl.'),
+        make_option('-o', '--output', default=None, dest='output',
+                    help='Write to this file instead of stdout (appended to when resuming).'),
+        make_option('--after', default=0, dest='after', type='int',
+                    help='Resume after this offset, the last one written by an interrupted export. '
+                         'With csv, the response of this offset is written again in full '
+                         '(and its rows already in the output file are removed).'),
+        make_option('--chunk-size', default=1000, dest='chunk_size', type='int',
+                    help='Responses read at a time.'),
+    )
+    help = 'Export the questions, answers and responses of a survey.'
+    args = '<survey_id>'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: export_survey {}'.format(self.args))
+        survey_id = args[0]
+        if not Survey.objects.filter(pk=survey_id).exists():
+            raise CommandError('Survey {} does not exist.'.format(survey_id))
+        if options['format'] not in export.FORMATS:
+            raise CommandError('Unknown format {}.'.format(options['format']))
+
+        after = options['after']
+        structure = not after
+        if after and options['format'] == 'csv':
+            # the export may have stopped partway through the rows of this response
+            if options['output']:
+                with open(options['output'], 'r+b') as f:
+                    export.cut_csv(f, after)
+            after -= 1
+        lines = export.stream([survey_id], options['format'], after, options['chunk_size'], structure)
+        if not structure and options['format'] == 'csv':
+            # the header is already in the file
+            next(lines)
+        output = open(options['output'], 'ab' if options['after'] else 'wb') if options['output'] else self.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,46 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey import importer
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default=None, dest='format',
+                    help='Input format: json, jsonl or yaml (guessed from the file extension by default).'),
+        make_option('--batch-size', default=500, dest='batch_size', type='int',
+                    help='Objects inserted per query.'),
+    )
+    help = ('Import surveys (pages, questions, answers and results) from a JSON, JSON lines or YAML file; '
+            'use - to read from stdin. See survey.importer for the format.')
+    args = '<input_file>'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: import_survey {}'.format(self.args))
+        input_path = args[0]
+        input_format = options['format'] or _guess_format(input_path)
+        if input_format not in importer.FORMATS:
+            raise CommandError('Unknown format {}.'.format(input_format))
+
+        stream = sys.stdin if input_path == '-' else open(input_path)
+        try:
+            for survey, warnings in importer.import_surveys(stream, input_format, options['batch_size']):
+                for warning in warnings:
+                    self.stderr.write('Warning: {}'.format(warning))
+                self.stdout.write('Imported survey {}: {}'.format(survey.id, survey.name))
+        except importer.InvalidSurvey as e:
+            raise CommandError('Invalid survey: {}'.format(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def _guess_format(path):
+    if path.endswith('.jsonl'):
+        return 'jsonl'
+    if path.endswith(('.yaml', '.yml')):
+        return 'yaml'
+    return 'json'
@@ -0,0 +1,24 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey import statistics
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', default=1000, dest='chunk_size', type='int',
+                    help='Responses read at a time.'),
+    )
+    help = ('Recompute the survey statistics from the saved responses, '
+            'for the given surveys or for all of them.')
+    args = '[survey_id ...]'
+
+    def handle(self, *args, **options):
+        survey_ids = args or Survey.objects.values_list('id', flat=True)
+        for survey_id in survey_ids:
+            if not Survey.objects.filter(pk=survey_id).exists():
+                raise CommandError('Survey {} does not exist.'.format(survey_id))
+            done = statistics.rebuild(survey_id, options['chunk_size'])
+            self.stdout.write('Survey {}: {} responses counted.'.format(survey_id, done))
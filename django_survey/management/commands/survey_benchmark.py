@@ -0,0 +1,73 @@
+import json
+from itertools import product
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.benchmark import environment, generate_spec, run_benchmark, run_with_saved_survey
+from survey.closealternative import SOLVERS
+from survey.models import Question
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--pages', default='5,10,20', dest='pages',
+                    help='Pages per survey (comma separated to try several).'),
+        make_option('--questions', default='3', dest='questions',
+                    help='Questions per page (comma separated to try several).'),
+        make_option('--answers', default='4,10', dest='answers',
+                    help='Answers per question (comma separated to try several).'),
+        make_option('--min-score', default=-10, dest='min_score', type='int'),
+        make_option('--max-score', default=10, dest='max_score', type='int'),
+        make_option('--type', default=Question.MULTIPLE, dest='question_type',
+                    help='Question type: radio, checkbox or mixed.'),
+        make_option('--solvers', default='dp,search', dest='solvers',
+                    help='Solvers to compare (comma separated).'),
+        make_option('--repeat', default=5, dest='repeat', type='int'),
+        make_option('--seed', default=0, dest='seed', type='int'),
+        make_option('--db', action='store_true', default=False, dest='db',
+                    help='Save each survey (rolled back afterwards) to measure _prepare_result_for_display too.'),
+        make_option('-o', '--output', default=None, dest='output',
+                    help='Write the results as JSON to this file instead of stdout.'),
+    )
+    help = 'Time the closest path search on generated surveys of different shapes.'
+
+    def handle(self, *args, **options):
+        solvers = options['solvers'].split(',')
+        for solver in solvers:
+            if solver not in SOLVERS:
+                raise CommandError('Unknown solver: {}'.format(solver))
+        if options['question_type'] not in (Question.SINGLE, Question.MULTIPLE, 'mixed'):
+            raise CommandError('Unknown question type: {}'.format(options['question_type']))
+
+        runs = []
+        shapes = product(_int_list(options['pages']), _int_list(options['questions']), _int_list(options['answers']))
+        for pages, questions, answers in shapes:
+            shape = {
+                'pages': pages,
+                'questions': questions,
+                'answers': answers,
+                'min_score': options['min_score'],
+                'max_score': options['max_score'],
+                'type': options['question_type'],
+                'seed': options['seed']
+            }
+            spec = generate_spec(pages, questions, answers, options['min_score'], options['max_score'],
+                                 options['question_type'], options['seed'])
+            run = run_with_saved_survey if options['db'] else run_benchmark
+            for result in run(spec, solvers=solvers, repeat=options['repeat'], seed=options['seed']):
+                result['shape'] = shape
+                runs.append(result)
+                self.stderr.write('{pages}x{questions}x{answers} {solver}: compute {median:.4f}s'.format(
+                    solver=result['solver'], median=result['phases']['compute']['median'], **shape))
+
+        report = json.dumps({'environment': environment(), 'runs': runs}, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
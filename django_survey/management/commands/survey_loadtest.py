@@ -0,0 +1,52 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.benchmark import environment
+from survey.loadtest import PERCENTILES, run_load_test
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    args = '[survey_id ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--respondents', default=20, dest='respondents', type='int',
+                    help='Number of respondents walking a survey.'),
+        make_option('--concurrency', default=4, dest='concurrency', type='int',
+                    help='Respondents walking at the same time.'),
+        make_option('--url', default=None, dest='url',
+                    help='Root of a running server (like http://localhost:8000); '
+                         'the requests go through the Django test client in this process otherwise.'),
+        make_option('--seed', default=0, dest='seed', type='int'),
+        make_option('--poll', action='store_false', default=True, dest='stream',
+                    help='Poll closest_path for the closest path instead of reading closest_path/stream '
+                         '(which the result page uses).'),
+        make_option('-o', '--output', default=None, dest='output',
+                    help='Write the report as JSON to this file instead of stdout.'),
+    )
+    help = 'Simulate respondents taking surveys end to end and report the latency of every view.'
+
+    def handle(self, *survey_ids, **options):
+        surveys = Survey.objects.filter(page__isnull=False).distinct()
+        if survey_ids:
+            surveys = surveys.filter(pk__in=survey_ids)
+        survey_ids = list(surveys.values_list('id', flat=True))
+        if not survey_ids:
+            raise CommandError('No survey with pages to take.')
+
+        report = run_load_test(survey_ids, options['respondents'], options['concurrency'], options['url'],
+                               options['seed'], stream=options['stream'])
+        self.stderr.write('{requests} requests in {elapsed:.2f}s ({throughput:.1f}/s), '
+                          '{failed} of {respondents} respondents failed'.format(**report))
+        for url_name, stats in sorted(report['urls'].iteritems()):
+            self.stderr.write('{:<22} {:>6} requests {:>6.1%} errors '.format(
+                url_name, stats['requests'], stats['error_rate']) + ' '.join(
+                'p{}={:.1f}ms'.format(p, stats['p{}'.format(p)] * 1000) for p in PERCENTILES))
+
+        report = json.dumps({'environment': environment(), 'report': report}, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
@@ -1,6 +1,29 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 
-from survey.utils import get_first_value
+from survey.cache import get_survey_count
+from survey.utils import get_first_value, ResultIndex
+
+
+class DefaultSurveyManager(models.Manager):
+    def get_count(self):
+        """The number of surveys, cached.
+
+        :return: int
+        """
+        return get_survey_count(self.count)
+
+    def list_rows(self, description_length=160):
+        """Surveys for a list: the description is not loaded, only the part shorten_description shows.
+
+        :param description_length: int
+            the length that will be given to shorten_description
+        :return: QuerySet
+        """
+        table = self.model._meta.db_table
+        # one more character, to know if the description is longer
+        prefix = 'SUBSTR({}.description, 1, {})'.format(table, int(description_length) + 1)
+        return self.defer('description').extra(select={'description_prefix': prefix})
 
 
 class DefaultPageManager(models.Manager):
@@ -26,8 +49,58 @@ class DefaultAnswerManager(models.Manager):
         q = self.filter(id__in=answer_ids).aggregate(total=models.Sum('score'))
         return q['total']
 
+    def get_survey_rows(self, survey_id):
+        """All the answers of a survey, in one query.
+
+        :param survey_id:
+        :return: list of (page_id, question_id, answer_id, score) tuples
+        """
+        return list(self.filter(question__page__survey=survey_id).order_by('id').values_list(
+            'question__page_id', 'question_id', 'id', 'score'))
+
+    def split_by_page(self, survey_id, given_ans_ids, rows=None):
+        """All the answers of a survey, by page and question, split into the given answers
+        and the other answers (the ones the user has not submitted).
+
+        :param survey_id:
+        :param given_ans_ids: list
+        :param rows: list
+            the result of get_survey_rows, when already loaded
+        :return: dict, dict {page_id: {question_id: [AnsTuple]}}
+        """
+        # imported here because closealternative needs the models
+        from survey.closealternative import AnsTuple
+
+        if rows is None:
+            rows = self.get_survey_rows(survey_id)
+        given_ids = set(given_ans_ids)
+        given_ans = {}
+        other_ans = {}
+        for page_id, q_id, ans_id, score in rows:
+            given_q = given_ans.setdefault(page_id, {}).setdefault(q_id, [])
+            other_q = other_ans.setdefault(page_id, {}).setdefault(q_id, [])
+            if ans_id in given_ids:
+                given_q.append(AnsTuple(id=ans_id, score=score))
+            else:
+                other_q.append(AnsTuple(id=ans_id, score=score))
+        return given_ans, other_ans
+
 
 class DefaultResultManager(models.Manager):
+    def get_index(self, survey_id):
+        """Returns the index of a survey's result intervals, the one of its snapshot.
+
+        :param survey_id:
+        :return: ResultIndex (empty when there is no such survey)
+        """
+        # imported here because the snapshot needs the models
+        from survey.snapshot import get_snapshot
+
+        try:
+            return get_snapshot(survey_id).result_index
+        except ObjectDoesNotExist:
+            return ResultIndex(())
+
     def get_result(self, survey_id, score):
         """Returns the result object (or None if not found) for a specific score and survey.
 
@@ -35,8 +108,7 @@ class DefaultResultManager(models.Manager):
         :param score:
         :return:
         """
-        q = self.filter(survey=survey_id, max_score__gt=score, min_score__lte=score)
-        return get_first_value(q)
+        return self.get_index(survey_id).get_result(score)
 
     def get_result_above(self, survey_id, score):
         """Returns the first result which has min_score bigger that the current user score.
@@ -45,8 +117,7 @@ class DefaultResultManager(models.Manager):
         :param score:
         :return:
         """
-        q = self.filter(survey=survey_id, min_score__gt=score).order_by('min_score')
-        return get_first_value(q)
+        return self.get_index(survey_id).get_result_above(score)
 
     def get_result_below(self, survey_id, score):
         """Returns the first result which has max_score smaller that the current user score.
@@ -55,5 +126,4 @@ class DefaultResultManager(models.Manager):
         :param score:
         :return:
         """
-        q = self.filter(survey=survey_id, max_score__lt=score).order_by('-min_score')
-        return get_first_value(q)
\ No newline at end of file
+        return self.get_index(survey_id).get_result_below(score)
@@ -1,6 +1,13 @@
+import heapq
+import json
 import logging
+import random
+import re
+from timeit import default_timer
 
-from django.db import connection
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.util import CursorWrapper
 
 
 logger = logging.getLogger('survey-sql')
@@ -18,4 +25,161 @@ class SqlLoggingMiddleware(object):
         for query in connection.queries:
             message = '({}) {}'.format(query['time'], query['sql'])
             logger.debug(message)
-        return response
\ No newline at end of file
+        return response
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """The shape of a statement: the same for statements that only differ by their values.
+
+    >>> normalize_sql('SELECT "a"."id" FROM "a" WHERE "a"."page_id" = %s AND "a"."id" IN (%s, %s)')
+    'SELECT "a"."id" FROM "a" WHERE "a"."page_id" = ? AND "a"."id" IN (...)'
+    >>> normalize_sql("SELECT  * FROM t2 WHERE name = 'it''s' LIMIT 21")
+    'SELECT * FROM t2 WHERE name = ? LIMIT ?'
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _VALUE_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder(object):
+    def __init__(self, slowest=5):
+        """The statements run while handling one request.
+
+        :param slowest: int
+            how many of the slowest statements are kept
+        :return:
+        """
+        self.count = 0
+        self.duration = 0.0
+        # shape -> [count, duration]
+        self.shapes = {}
+        self._slowest = []
+        self._keep = slowest
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        shape = self.shapes.setdefault(normalize_sql(sql), [0, 0.0])
+        shape[0] += 1
+        shape[1] += duration
+        item = (duration, self.count, sql)
+        if len(self._slowest) < self._keep:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        return [(sql, duration) for duration, n, sql in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """The shapes run at least threshold times, most run first: usually N+1 queries.
+
+        :param threshold: int
+        :return: list of (shape, count, duration)
+        """
+        repeated = [(shape, n, d) for shape, (n, d) in self.shapes.iteritems() if n >= threshold]
+        return sorted(repeated, key=lambda r: (-r[1], r[0]))
+
+
+class _TimingCursor(CursorWrapper):
+    def __init__(self, cursor, db, recorder):
+        super(_TimingCursor, self).__init__(cursor, db)
+        self.recorder = recorder
+
+    def execute(self, sql, params=None):
+        start = default_timer()
+        try:
+            return super(_TimingCursor, self).execute(sql, params)
+        finally:
+            self.recorder.add(sql, default_timer() - start)
+
+    def executemany(self, sql, param_list):
+        start = default_timer()
+        try:
+            return super(_TimingCursor, self).executemany(sql, param_list)
+        finally:
+            self.recorder.add(sql, default_timer() - start)
+
+
+def _install(recorder):
+    """Time the statements of the current thread's connections, until _uninstall.
+
+    Django 1.6 has no execute wrapper, so the connections are given a debug cursor that times
+    the statements instead of storing them. A debug cursor already in use keeps working.
+
+    :param recorder: QueryRecorder
+    :return: list of (connection, previous use_debug_cursor)
+    """
+    installed = []
+    for db in connections.all():
+        was_debug = db.use_debug_cursor or (db.use_debug_cursor is None and settings.DEBUG)
+
+        def make_cursor(cursor, db=db, was_debug=was_debug):
+            if was_debug:
+                cursor = type(db).make_debug_cursor(db, cursor)
+            return _TimingCursor(cursor, db, recorder)
+        installed.append((db, db.use_debug_cursor))
+        db.make_debug_cursor = make_cursor
+        db.use_debug_cursor = True
+    return installed
+
+
+def _uninstall(installed):
+    for db, use_debug_cursor in installed:
+        db.use_debug_cursor = use_debug_cursor
+        del db.make_debug_cursor
+
+
+class SqlInstrumentationMiddleware(object):
+    """Samples requests and logs a summary of their SQL statements, without DEBUG.
+
+    For a sampled request, logs on 'survey-sql' one JSON object with the view, the number of
+    statements, the time spent in the database, the slowest statements, and the statement
+    shapes run at least SURVEY_SQL_REPEATED times (a warning: usually an N+1 query).
+    The summary is also attached to the log record as sql_summary.
+
+    Settings:
+        SURVEY_SQL_SAMPLE_RATE: share of the requests instrumented (default 0.01)
+        SURVEY_SQL_SLOWEST: slowest statements logged (default 5)
+        SURVEY_SQL_REPEATED: times a shape must run to be reported (default 5)
+    """
+    RECORDER = '_survey_sql_recorder'
+
+    def process_request(self, request):
+        if random.random() >= getattr(settings, 'SURVEY_SQL_SAMPLE_RATE', 0.01):
+            return None
+        recorder = QueryRecorder(getattr(settings, 'SURVEY_SQL_SLOWEST', 5))
+        setattr(request, self.RECORDER, (recorder, _install(recorder)))
+        return None
+
+    def process_response(self, request, response):
+        sampled = getattr(request, self.RECORDER, None)
+        if sampled is None:
+            return response
+        recorder, installed = sampled
+        _uninstall(installed)
+        delattr(request, self.RECORDER)
+
+        match = getattr(request, 'resolver_match', None)
+        repeated = recorder.repeated(getattr(settings, 'SURVEY_SQL_REPEATED', 5))
+        summary = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 3),
+            'slowest': [{'sql': sql, 'ms': round(d * 1000, 3)} for sql, d in recorder.slowest()],
+            'repeated': [{'sql': shape, 'count': n, 'ms': round(d * 1000, 3)} for shape, n, d in repeated]
+        }
+        level = logging.WARNING if repeated else logging.INFO
+        logger.log(level, json.dumps(summary, sort_keys=True), extra={'sql_summary': summary})
+        return response
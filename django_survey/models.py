@@ -10,6 +10,8 @@ class Survey(models.Model):
     description = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_index=True)
 
+    objects = managers.DefaultSurveyManager()
+
     def __unicode__(self):
         return self.name
 
@@ -22,10 +24,17 @@ class Survey(models.Model):
         super(Survey, self).save(*args, **kwargs)
 
     def shorten_description(self, length=160):
+        if 'description' not in self.__dict__ and hasattr(self, 'description_prefix'):
+            # loaded by DefaultSurveyManager.list_rows, without the full description
+            description = self.description_prefix
+        else:
+            description = self.description
+        if not description:
+            return description
         max_length = length - 3
-        if len(self.description) > length:  # 3 for the ellipses
-            return self.description[:max_length] + '...'
-        return self.description
+        if len(description) > length:  # 3 for the ellipses
+            return description[:max_length] + '...'
+        return description
 
     class Meta:
         ordering = ['-created_at']
@@ -83,6 +92,9 @@ class Answer(models.Model):
     def __str__(self):
         return self.__unicode__()
 
+    class Meta:
+        ordering = ['id']
+
 
 class Result(models.Model):
     survey = models.ForeignKey(Survey)
@@ -97,4 +109,65 @@ class Result(models.Model):
         return self.summary[:10]
 
     def __str__(self):
-        return self.__unicode__()
\ No newline at end of file
+        return self.__unicode__()
+
+
+class Response(models.Model):
+    """A finished survey. Written in batches by survey.responses.ResponseWriter."""
+    # generated before saving, so that the answers can refer to a response not saved yet
+    key = models.CharField(max_length=32, unique=True)
+    survey = models.ForeignKey(Survey)
+    score = models.IntegerField(null=True, blank=True)
+    result = models.ForeignKey(Result, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __unicode__(self):
+        return u"Response {} to {}".format(self.key, self.survey_id)
+
+    def __str__(self):
+        return self.__unicode__()
+
+
+class ResponseAnswer(models.Model):
+    response = models.ForeignKey(Response, to_field='key')
+    answer = models.ForeignKey(Answer)
+
+    def __unicode__(self):
+        return u"{} in {}".format(self.answer_id, self.response_id)
+
+    def __str__(self):
+        return self.__unicode__()
+
+
+class StatCounter(models.Model):
+    """One shard of a survey statistic, kept up to date by survey.statistics."""
+    COMPLETIONS = 'completions'
+    SCORE = 'score'
+    RESULT = 'result'
+    ANSWER = 'answer'
+    KIND_CHOICES = (
+        (COMPLETIONS, 'Finished surveys'),
+        (SCORE, 'Finished surveys with this score'),
+        (RESULT, 'Finished surveys with this result'),
+        (ANSWER, 'Finished surveys with this answer')
+    )
+
+    survey = models.ForeignKey(Survey)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # the score, the result id or the answer id (0 for completions)
+    item = models.IntegerField(default=0)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u"{} {} of {}: {}".format(self.kind, self.item, self.survey_id, self.count)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    class Meta:
+        unique_together = ('survey', 'kind', 'item', 'shard')
+
+
+# connect the signal handlers once the models are defined
+from survey import signals
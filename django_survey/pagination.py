@@ -0,0 +1,112 @@
+"""
+Pagination helpers for long lists.
+
+KeysetPaginator pages through a queryset ordered by a field (newest first) and the
+primary key, continuing after (or before) the last row shown instead of counting
+and skipping rows, so deep pages cost the same as the first one.
+"""
+import base64
+from collections import namedtuple
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+KeysetPage = namedtuple('KeysetPage', ['object_list', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(created_at, pk):
+    """An opaque url safe cursor for a row.
+
+    :param created_at: datetime
+    :param pk: int
+    :return: str
+    """
+    return base64.urlsafe_b64encode('{}|{}'.format(created_at.isoformat(), pk))
+
+
+def decode_cursor(cursor):
+    """The (created_at, pk) a cursor was made from.
+
+    :param cursor: str
+    :return: (datetime, int)
+    :raise: ValueError for invalid cursors
+    """
+    try:
+        created_at, pk = base64.urlsafe_b64decode(str(cursor)).split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise ValueError('Invalid cursor {!r}'.format(cursor))
+    if created_at is None:
+        raise ValueError('Invalid cursor {!r}'.format(cursor))
+    return created_at, pk
+
+
+class KeysetPaginator(object):
+    def __init__(self, queryset, per_page, field='created_at'):
+        """Pages of a queryset, newest first.
+
+        :param queryset:
+        :param per_page: int
+        :param field: str
+            an indexed datetime field; the primary key breaks the ties
+        :return:
+        """
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def page(self, after=None, before=None):
+        """The rows after (older than) or before (newer than) a cursor; the first page without one.
+
+        Takes one query, for per_page + 1 rows: the extra row tells if there are more.
+
+        :param after: str
+            next_cursor of the page shown
+        :param before: str
+            prev_cursor of the page shown
+        :return: KeysetPage
+        :raise: ValueError for invalid cursors
+        """
+        field = self.field
+        queryset = self.queryset
+        backwards = before is not None
+        if backwards:
+            value, pk = decode_cursor(before)
+            queryset = queryset.filter(Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            queryset = queryset.order_by(field, 'pk')
+        else:
+            if after is not None:
+                value, pk = decode_cursor(after)
+                queryset = queryset.filter(Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+            queryset = queryset.order_by('-' + field, '-pk')
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        # coming from a cursor, there are rows on the other side of it
+        has_next = (before is not None) if backwards else more
+        has_prev = more if backwards else (after is not None)
+
+        next_cursor = self._cursor(rows[-1]) if has_next and rows else None
+        prev_cursor = self._cursor(rows[0]) if has_prev and rows else None
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    def _cursor(self, row):
+        return encode_cursor(getattr(row, self.field), row.pk)
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count, **kwargs):
+        """A Paginator that is given the number of objects instead of counting them.
+
+        :param count: int
+            for example a cached count
+        :return:
+        """
+        super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+        self._count = count
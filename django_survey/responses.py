@@ -0,0 +1,152 @@
+"""
+Records finished surveys (Response and ResponseAnswer rows) without a transaction per response.
+
+SurveyView hands every finished survey to response_writer, which keeps it in memory and
+writes the buffered responses with bulk_create: when SURVEY_RESPONSES_BATCH_SIZE responses
+are waiting, every SURVEY_RESPONSES_FLUSH_INTERVAL seconds and when the process exits.
+A response is lost if the process dies before its flush. When a batch fails, its responses
+are written one by one: the ones the database rejects are set aside, the others are retried.
+The survey statistics (survey.statistics) are updated with each batch.
+
+Settings:
+    SURVEY_RESPONSES_BATCH_SIZE: responses written together (default 500)
+    SURVEY_RESPONSES_FLUSH_INTERVAL: seconds a response may wait in memory (default 5)
+    SURVEY_RESPONSES_SYNC: write every response right away (default False), for tests
+"""
+import atexit
+import datetime
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from survey import statistics
+from survey.models import Response, ResponseAnswer
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseWriter(object):
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        # one flush at a time, so that a failed batch is retried before the next one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        # the responses the database rejected
+        self.rejected = []
+
+    @staticmethod
+    def _setting(name, default):
+        return getattr(settings, 'SURVEY_RESPONSES_' + name, default)
+
+    def record(self, survey_id, answer_ids, score=None, result_id=None):
+        """Buffer a finished survey.
+
+        :param survey_id:
+        :param answer_ids: list
+        :param score: int
+        :param result_id:
+        :return: str, the key of the response
+        """
+        key = uuid.uuid4().hex
+        response = Response(key=key, survey_id=survey_id, score=score, result_id=result_id,
+                            created_at=datetime.datetime.now())
+        answers = [ResponseAnswer(response_id=key, answer_id=a) for a in set(answer_ids)]
+
+        if self._setting('SYNC', False):
+            self._write([(response, answers)])
+            return key
+
+        with self._lock:
+            self._buffer.append((response, answers))
+            full = len(self._buffer) >= self._setting('BATCH_SIZE', 500)
+            self._start_thread()
+        if full:
+            self._wake.set()
+        return key
+
+    def flush(self):
+        """Write all the buffered responses.
+
+        :return: int, the number of responses written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception('Could not write {} survey responses, writing them one by one.'.format(len(batch)))
+                return self._write_one_by_one(batch)
+            return len(batch)
+
+    def _write_one_by_one(self, batch):
+        """Write the responses of a failed batch separately.
+
+        A response the database rejects (an answer deleted since, for instance) is set aside
+        in self.rejected, so that it does not hold back the others. On any other error the
+        responses left are put back in the buffer, to be retried.
+
+        :param batch: list of (Response, [ResponseAnswer])
+        :return: int, the number of responses written
+        """
+        written = 0
+        for i, item in enumerate(batch):
+            try:
+                self._write([item])
+            except IntegrityError:
+                logger.exception('Survey response {} was rejected, it is set aside.'.format(item[0].key))
+                with self._lock:
+                    self.rejected.append(item)
+            except Exception:
+                logger.exception('Could not write {} survey responses, will retry.'.format(len(batch) - i))
+                with self._lock:
+                    self._buffer[:0] = batch[i:]
+                break
+            else:
+                written += 1
+        return written
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _write(self, batch):
+        batch_size = self._setting('BATCH_SIZE', 500)
+        with transaction.atomic():
+            Response.objects.bulk_create([response for response, answers in batch], batch_size)
+            ResponseAnswer.objects.bulk_create([a for response, answers in batch for a in answers], batch_size)
+            statistics.add_responses((response.survey_id, response.score, response.result_id,
+                                      [a.answer_id for a in answers]) for response, answers in batch)
+
+    def _start_thread(self):
+        # called with self._lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='survey-response-writer')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._setting('FLUSH_INTERVAL', 5))
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # this thread's connection is not closed by the request handling
+                connection.close()
+
+    def shutdown(self):
+        """Write what is left, when the process exits."""
+        self.flush()
+
+
+response_writer = ResponseWriter()
+atexit.register(response_writer.shutdown)
@@ -0,0 +1,53 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from survey.cache import bump_survey_version, forget_survey_count
+from survey.models import Survey, Page, Question, Answer, Result
+
+
+logger = logging.getLogger(__name__)
+
+
+def _get_survey_id(instance):
+    """Returns the id of the survey an object belongs to, or None if it can not be found anymore.
+
+    :param instance: Survey, Page, Question, Answer or Result
+    :return:
+    """
+    if isinstance(instance, Survey):
+        return instance.id
+    if isinstance(instance, (Page, Result)):
+        return instance.survey_id
+    if isinstance(instance, Question):
+        ids = Page.objects.filter(pk=instance.page_id).values_list('survey_id', flat=True)
+    else:
+        ids = Question.objects.filter(pk=instance.question_id).values_list('page__survey_id', flat=True)
+    return ids[0] if ids else None
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_save, sender=Page)
+@receiver(post_save, sender=Question)
+@receiver(post_save, sender=Answer)
+@receiver(post_save, sender=Result)
+@receiver(post_delete, sender=Survey)
+@receiver(post_delete, sender=Page)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Answer)
+@receiver(post_delete, sender=Result)
+def survey_content_changed(sender, instance, **kwargs):
+    survey_id = _get_survey_id(instance)
+    if survey_id is None:
+        logger.info('Changed {} {} does not belong to a survey anymore.'.format(sender.__name__, instance.pk))
+        return
+    bump_survey_version(survey_id)
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+def survey_added_or_deleted(sender, instance, created=True, **kwargs):
+    # created is only sent by post_save
+    if created:
+        forget_survey_count()
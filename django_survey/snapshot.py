@@ -0,0 +1,202 @@
+"""
+Compiled, read only copies of the survey content.
+
+A SurveySnapshot holds everything the survey views need (pages, questions, answers
+and results) so that, once built, taking a survey does not query the database for
+its structure. Snapshots are built lazily, kept in a process level cache and rebuilt
+when the survey content version changes (see survey.cache and survey.signals).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from survey.cache import LRUCache, get_survey_version
+from survey.models import Survey, Page, Question, Answer, Result
+from survey.utils import ResultIndex
+
+
+class SurveyNode(object):
+    __slots__ = ('id', 'name', 'description')
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+
+    def __unicode__(self):
+        return self.name
+
+    def __str__(self):
+        return self.__unicode__()
+
+
+class QuestionNode(object):
+    __slots__ = ('id', 'page_id', 'question_text', 'position', 'type', 'answers')
+
+    def __init__(self, id, page_id, question_text, position, type):
+        self.id = id
+        self.page_id = page_id
+        self.question_text = question_text
+        self.position = position
+        self.type = type
+        # AnswerNode objects, ordered by id
+        self.answers = ()
+
+    def __unicode__(self):
+        return self.question_text[:10]
+
+    def __str__(self):
+        return self.__unicode__()
+
+
+class AnswerNode(object):
+    __slots__ = ('id', 'question_id', 'answer_text', 'score')
+
+    def __init__(self, id, question_id, answer_text, score):
+        self.id = id
+        self.question_id = question_id
+        self.answer_text = answer_text
+        self.score = score
+
+    def __unicode__(self):
+        return self.answer_text[:10]
+
+    def __str__(self):
+        return self.__unicode__()
+
+
+class SurveySnapshot(object):
+    __slots__ = ('id', 'version', 'survey', 'page_nums', 'page_ids', 'page_questions',
+                 'questions', 'answers', 'answer_ids', 'answer_question_ids', 'answer_page_ids',
+                 'answer_scores', 'results', 'result_index')
+
+    def __init__(self, survey_id, version=None):
+        """Load the content of a survey (5 queries).
+
+        The answers are kept sorted by id in parallel arrays (id, question id, page id, score),
+        the results in a ResultIndex.
+
+        :param survey_id:
+        :param version: str
+            the content version the snapshot is built for
+        :return:
+        :raise: Survey.DoesNotExist
+        """
+        survey = Survey.objects.values_list('id', 'name', 'description').get(pk=survey_id)
+        self.id = survey[0]
+        self.version = version
+        self.survey = SurveyNode(*survey)
+
+        pages = Page.objects.filter(survey=self.id).order_by('page_num').values_list('id', 'page_num')
+        self.page_ids = array('l', [p[0] for p in pages])
+        self.page_nums = array('l', [p[1] for p in pages])
+
+        self.questions = {}
+        self.page_questions = dict((page_id, []) for page_id in self.page_ids)
+        rows = Question.objects.filter(page__survey=self.id).values_list(
+            'id', 'page_id', 'question_text', 'position', 'type')
+        for row in rows:
+            question = QuestionNode(*row)
+            self.questions[question.id] = question
+            self.page_questions[question.page_id].append(question)
+        for page_id, questions in self.page_questions.iteritems():
+            # same order as Question.Meta.ordering
+            self.page_questions[page_id] = tuple(sorted(questions, key=lambda q: (q.position, q.id)))
+
+        self.answers = {}
+        by_question = {}
+        rows = Answer.objects.filter(question__page__survey=self.id).order_by('id').values_list(
+            'id', 'question_id', 'question__page_id', 'answer_text', 'score')
+        self.answer_ids = array('l')
+        self.answer_question_ids = array('l')
+        self.answer_page_ids = array('l')
+        self.answer_scores = array('l')
+        for ans_id, q_id, page_id, answer_text, score in rows:
+            answer = AnswerNode(ans_id, q_id, answer_text, score)
+            self.answers[ans_id] = answer
+            by_question.setdefault(q_id, []).append(answer)
+            self.answer_ids.append(ans_id)
+            self.answer_question_ids.append(q_id)
+            self.answer_page_ids.append(page_id)
+            self.answer_scores.append(score)
+        for q_id, answers in by_question.iteritems():
+            self.questions[q_id].answers = tuple(answers)
+
+        self.result_index = ResultIndex(Result.objects.filter(survey=self.id))
+        self.results = self.result_index.results
+
+    def get_questions(self, page_num):
+        """The questions on a page, with their answers.
+
+        :param page_num:
+        :return: tuple of QuestionNode (empty if there is no such page)
+        """
+        i = bisect_left(self.page_nums, int(page_num))
+        if i == len(self.page_nums) or self.page_nums[i] != int(page_num):
+            return ()
+        return self.page_questions[self.page_ids[i]]
+
+    def get_next_page(self, page_num):
+        """Same as DefaultPageManager.get_next_page.
+
+        :param page_num:
+        :return: int or None
+        """
+        i = bisect_right(self.page_nums, int(page_num))
+        return self.page_nums[i] if i < len(self.page_nums) else None
+
+    def _answer_index(self, answer_id):
+        i = bisect_left(self.answer_ids, answer_id)
+        if i < len(self.answer_ids) and self.answer_ids[i] == answer_id:
+            return i
+        return None
+
+    def get_score(self, answer_ids):
+        """Same as DefaultAnswerManager.get_score_sum, for the answers of this survey.
+
+        :param answer_ids:
+        :return: int or None when no answer is from this survey
+        """
+        indexes = [i for i in (self._answer_index(a) for a in set(answer_ids)) if i is not None]
+        return sum(self.answer_scores[i] for i in indexes) if indexes else None
+
+    def split_by_page(self, given_ans_ids):
+        """Same as DefaultAnswerManager.split_by_page.
+
+        :param given_ans_ids: list
+        :return: dict, dict {page_id: {question_id: [AnsTuple]}}
+        """
+        rows = zip(self.answer_page_ids, self.answer_question_ids, self.answer_ids, self.answer_scores)
+        return Answer.objects.split_by_page(self.id, given_ans_ids, rows=rows)
+
+    def get_result(self, score):
+        """Same as DefaultResultManager.get_result."""
+        return self.result_index.get_result(score)
+
+    def get_result_above(self, score):
+        """Same as DefaultResultManager.get_result_above."""
+        return self.result_index.get_result_above(score)
+
+    def get_result_below(self, score):
+        """Same as DefaultResultManager.get_result_below."""
+        return self.result_index.get_result_below(score)
+
+
+snapshot_cache = LRUCache(getattr(settings, 'SURVEY_SNAPSHOT_CACHE_SIZE', 100))
+
+
+def get_snapshot(survey_id):
+    """The snapshot of the current content of a survey, built when missing or outdated.
+
+    :param survey_id:
+    :return: SurveySnapshot
+    :raise: Survey.DoesNotExist
+    """
+    # read the version first: content changed while building gets a newer version
+    version = get_survey_version(survey_id)
+    snapshot = snapshot_cache.get(int(survey_id))
+    if snapshot is None or snapshot.version != version:
+        snapshot = SurveySnapshot(survey_id, version)
+        snapshot_cache.set(snapshot.id, snapshot)
+    return snapshot
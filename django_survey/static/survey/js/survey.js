@@ -2,23 +2,132 @@
     $(document).ready(function(){
         var alternative_path = $('#alternative'),
             url = alternative_path.attr('data-url'),
-            loader = $('#loader');
+            stream_url = alternative_path.attr('data-stream-url'),
+            loader = $('#loader'),
+            // wait between polls while the search is still running (grows up to max_delay)
+            max_delay = 4000,
+            max_attempts = 20;
         console.log('score='+alternative_path.attr('data-score'));
 
+        // the whole closest path, polled while it is being computed in the background
+        var fetch = function(done, failed) {
+            var delay = 250,
+                attempts = 0;
+            var poll = function() {
+                $.ajax({
+                    url: url,
+                    method: 'GET',
+                    success: function(data, status, xhr) {
+                        if (xhr.status === 202) {
+                            // still being computed in the background
+                            attempts += 1;
+                            if (attempts < max_attempts) {
+                                setTimeout(poll, delay);
+                                delay = Math.min(delay * 2, max_delay);
+                            } else {
+                                failed();
+                            }
+                            return;
+                        }
+                        done(data);
+                    },
+                    error: function(err) {
+                        console.log(err);
+                        failed();
+                    }
+                })
+            };
+            poll();
+        };
+
         var compute = function() {
-            $.ajax({
-                url: url,
-                method: 'GET',
-                success: function(xhr) {
-                    alternative_path.html(xhr);
+            fetch(function(data) {
+                alternative_path.html(data);
+            }, function() {
+                loader.hide();
+            });
+        };
+
+        var show_route_error = function(section, route) {
+            section.html('<div class="score-alternative text-danger">Something went wrong while looking for a <b>' +
+                         route + '</b> result. <a href="#" class="retry">Try again</a></div>');
+            section.find('.retry').click(function(e) {
+                e.preventDefault();
+                retry_route(section, route);
+            });
+        };
+
+        // a route whose search failed in the stream is asked for again, without streaming
+        var retry_route = function(section, route) {
+            section.html('<div class="score-alternative">Looking again for a <b>' + route + '</b> result...</div>');
+            fetch(function(data) {
+                // the closest path shows the better route, then the worse one
+                var found = $('<div>').html(data).children('.score-alternative').eq(route === 'better' ? 0 : 1);
+                if (found.length) {
+                    section.html(found);
+                } else {
+                    show_route_error(section, route);
+                }
+            }, function() {
+                show_route_error(section, route);
+            });
+        };
+
+        // each route (better, then worse) is shown as soon as its line of JSON arrives
+        var stream = function() {
+            var xhr = new XMLHttpRequest(),
+                routes = {
+                    better: $('<div class="route"></div>'),
+                    worse: $('<div class="route"></div>')
                 },
-                error: function(err) {
-                    console.log(err);
+                received = 0,
+                // how much of the response was read
+                seen = 0;
+            alternative_path.prepend(routes.better, routes.worse);
+
+            var read = function() {
+                var text = xhr.responseText,
+                    end;
+                while ((end = text.indexOf('\n', seen)) !== -1) {
+                    var chunk = JSON.parse(text.substring(seen, end));
+                    seen = end + 1;
+                    if (chunk.error) {
+                        retry_route(routes[chunk.route], chunk.route);
+                    } else if (chunk.html) {
+                        routes[chunk.route].html(chunk.html);
+                    }
+                    received += 1;
                 }
-            })
+            };
+            var fall_back = function() {
+                // nothing usable was streamed, ask for both routes at once
+                routes.better.remove();
+                routes.worse.remove();
+                compute();
+            };
+
+            xhr.open('GET', stream_url);
+            xhr.onprogress = read;
+            xhr.onload = function() {
+                if (xhr.status !== 200) {
+                    fall_back();
+                    return;
+                }
+                read();
+                loader.hide();
+            };
+            xhr.onerror = function(err) {
+                console.log(err);
+                if (received === 0) {
+                    fall_back();
+                } else {
+                    loader.hide();
+                }
+            };
+            xhr.send();
         };
 
-        setTimeout(compute, 1)
-        
+        setTimeout(stream_url ? stream : compute, 1)
+
     });
-}(jQuery))
\ No newline at end of file
+}(jQuery))
@@ -0,0 +1,137 @@
+"""
+Survey statistics kept up to date as responses are saved.
+
+Every statistic (completions, responses per score, per result and per answer) is a
+StatCounter row split into SURVEY_STATS_SHARDS shards (default 8). The response writer
+adds a whole batch of responses at once: the batch is counted in memory, then every
+counter touched gets one UPDATE ... SET count = count + n on a random shard, so
+concurrent writers rarely wait on the same row. Reading a survey's statistics sums
+the shards, whatever the number of responses.
+"""
+import logging
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from survey.models import Response, ResponseAnswer, StatCounter, Survey
+
+
+logger = logging.getLogger(__name__)
+
+
+def count_responses(responses):
+    """The counter increments for some responses.
+
+    :param responses: iterable of (survey_id, score, result_id, answer_ids)
+    :return: Counter {(survey_id, kind, item): n}
+    """
+    counts = Counter()
+    for survey_id, score, result_id, answer_ids in responses:
+        counts[survey_id, StatCounter.COMPLETIONS, 0] += 1
+        if score is not None:
+            counts[survey_id, StatCounter.SCORE, score] += 1
+        if result_id is not None:
+            counts[survey_id, StatCounter.RESULT, result_id] += 1
+        for answer_id in set(answer_ids):
+            counts[survey_id, StatCounter.ANSWER, answer_id] += 1
+    return counts
+
+
+def add_responses(responses):
+    """Add some responses to the statistics, one query per counter touched (two for new counters).
+
+    :param responses: iterable of (survey_id, score, result_id, answer_ids)
+    :return:
+    """
+    shard = random.randrange(getattr(settings, 'SURVEY_STATS_SHARDS', 8))
+    for (survey_id, kind, item), n in count_responses(responses).iteritems():
+        _increment(survey_id, kind, item, shard, n)
+
+
+def _increment(survey_id, kind, item, shard, n):
+    counter = StatCounter.objects.filter(survey=survey_id, kind=kind, item=item, shard=shard)
+    if counter.update(count=F('count') + n):
+        return
+    try:
+        with transaction.atomic():
+            StatCounter.objects.create(survey_id=survey_id, kind=kind, item=item, shard=shard, count=n)
+    except IntegrityError:
+        # created by another writer in the meantime
+        counter.update(count=F('count') + n)
+
+
+def get_statistics(survey_id):
+    """The statistics of a survey, for a dashboard. One query over the counters.
+
+    :param survey_id:
+    :return: dict {
+        'completions': int,
+        'scores': [(score, count)] sorted by score,
+        'results': {result_id: count},
+        'answers': {answer_id: (count, share of the completions)}
+    }
+    """
+    rows = StatCounter.objects.filter(survey=survey_id).values_list('kind', 'item').annotate(
+        total=Sum('count')).order_by()
+    totals = dict(((kind, item), total) for kind, item, total in rows)
+    completions = totals.get((StatCounter.COMPLETIONS, 0), 0)
+
+    def by_kind(kind):
+        return dict((item, total) for (k, item), total in totals.iteritems() if k == kind)
+
+    return {
+        'completions': completions,
+        'scores': sorted(by_kind(StatCounter.SCORE).iteritems()),
+        'results': by_kind(StatCounter.RESULT),
+        'answers': dict((answer_id, (total, float(total) / completions if completions else 0.0))
+                        for answer_id, total in by_kind(StatCounter.ANSWER).iteritems())
+    }
+
+
+def rebuild(survey_id, chunk_size=1000):
+    """Recompute the statistics of a survey from its responses.
+
+    The responses are read in chunks of chunk_size (by id), so the memory used depends on
+    the number of counters, not of responses. The counters are replaced in one transaction.
+
+    :param survey_id:
+    :param chunk_size: int
+    :return: int, the number of responses counted
+    """
+    counts = Counter()
+    done = 0
+    last_id = 0
+    with transaction.atomic():
+        while True:
+            chunk = list(Response.objects.filter(survey=survey_id, id__gt=last_id).order_by('id').values_list(
+                'id', 'key', 'score', 'result_id')[:chunk_size])
+            if not chunk:
+                break
+            answers = {}
+            for key, answer_id in ResponseAnswer.objects.filter(
+                    response__in=[row[1] for row in chunk]).values_list('response_id', 'answer_id'):
+                answers.setdefault(key, []).append(answer_id)
+            counts.update(count_responses(
+                (survey_id, score, result_id, answers.get(key, ())) for pk, key, score, result_id in chunk))
+            done += len(chunk)
+            last_id = chunk[-1][0]
+
+        StatCounter.objects.filter(survey=survey_id).delete()
+        StatCounter.objects.bulk_create([
+            StatCounter(survey_id=survey_id, kind=kind, item=item, shard=0, count=n)
+            for (s, kind, item), n in counts.iteritems()
+        ], 500)
+    return done
+
+
+def rebuild_all(chunk_size=1000):
+    """Recompute the statistics of every survey.
+
+    :param chunk_size: int
+    :return: dict {survey_id: number of responses}
+    """
+    return dict((survey_id, rebuild(survey_id, chunk_size))
+                for survey_id in Survey.objects.values_list('id', flat=True))
@@ -2,7 +2,7 @@ from itertools import count
 
 import factory
 
-from survey.models import Survey, Page
+from survey.models import Survey, Page, Question, Answer, Result
 
 _survey_id = iter(count(start=1))
 
@@ -22,3 +22,41 @@ class PageFactory(factory.DjangoModelFactory):
     class Meta:
         model = Page
 
+
+class QuestionFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Question
+    question_text = factory.Sequence(lambda n: 'Question #{}'.format(n))
+    position = factory.Sequence(lambda n: n)
+
+
+class AnswerFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Answer
+    answer_text = factory.Sequence(lambda n: 'Answer #{}'.format(n))
+    score = 0
+
+
+class ResultFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Result
+    summary = factory.Sequence(lambda n: 'Result #{}'.format(n))
+
+
+def create_survey(spec, results=()):
+    """Create a survey from a spec like the ones made by survey.benchmark.generate_spec.
+
+    :param spec: list of pages, each a list of (question type, [answer scores])
+    :param results: list of (min_score, max_score)
+    :return: Survey
+    """
+    survey = SurveyFactory()
+    for page_num, questions in enumerate(spec, 1):
+        page = PageFactory(survey=survey, page_num=page_num)
+        for position, (q_type, scores) in enumerate(questions, 1):
+            question = QuestionFactory(page=page, position=position, type=q_type)
+            for score in scores:
+                AnswerFactory(question=question, score=score)
+    for min_score, max_score in results:
+        ResultFactory(survey=survey, min_score=min_score, max_score=max_score)
+    return survey
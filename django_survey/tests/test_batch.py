@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, SimpleTestCase
+
+from survey.batch import compute_batch, read_answer_sets, solve
+from survey.snapshot import get_snapshot
+
+
+class SolveTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_solve(self):
+        record = solve(get_snapshot(1), [1, 2, 5, 7, 8, 10, 12])
+
+        self.assertEqual(record['score'], 8)
+        self.assertEqual(record['better'], [{'page': 1, 'question': 1, 'add': [3], 'remove': [],
+                                             'changes': 1, 'score': 10}])
+        self.assertEqual(len(record['worse']), 1)
+
+    def test_solve_foreign_answers(self):
+        with self.assertRaises(ValueError):
+            solve(get_snapshot(1), [1000])
+
+
+class ComputeBatchTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_in_process(self):
+        records = list(compute_batch(1, [(1, [1, 2, 5, 7, 8, 10, 12]), (2, [1000]), (3, None)], processes=1))
+
+        self.assertEqual([r['id'] for r in records], [1, 2, 3])
+        self.assertEqual(records[0]['score'], 8)
+        self.assertTrue('error' in records[1])
+        self.assertTrue('error' in records[2])
+
+    def test_pool_keeps_order(self):
+        answer_sets = [(i, [1, 2, 5, 7, 8, 10, 12] if i % 2 else [1, 4, 8, 9, 13]) for i in range(20)]
+        records = list(compute_batch(1, answer_sets, processes=2, chunk_size=3))
+
+        self.assertEqual([r['id'] for r in records], range(20))
+        self.assertEqual([r['score'] for r in records], [6, 8] * 10)
+
+
+class ReadAnswerSetsTest(SimpleTestCase):
+
+    def test_jsonl(self):
+        lines = ['[1, 2, 3]\n', '\n', '{"id": "a", "answers": [4, 5]}\n', 'not json\n']
+
+        self.assertEqual(list(read_answer_sets(lines)), [(1, [1, 2, 3]), ('a', [4, 5]), (4, None)])
+
+    def test_csv(self):
+        lines = ['1,2,3\n', '4,,5\n', '6,x\n']
+
+        self.assertEqual(list(read_answer_sets(lines, 'csv')), [(1, [1, 2, 3]), (2, [4, 5]), (3, None)])
+
+
+class ClosestPathsCommandTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_command(self):
+        input_path = os.path.join(self.dir, 'answers.csv')
+        output_path = os.path.join(self.dir, 'out.jsonl')
+        with open(input_path, 'w') as f:
+            f.write('1,2,5,7,8,10,12\n1,4,8,9,13\n')
+
+        stderr = StringIO()
+        call_command('closest_paths', '1', input_path, output=output_path, processes=1, stderr=stderr)
+
+        with open(output_path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r['score'] for r in records], [8, 6])
+        self.assertTrue('2 answer sets, 0 failed' in stderr.getvalue())
@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from survey.benchmark import build_in_memory, generate_spec, respond, run_benchmark, run_with_saved_survey
+from survey.models import Answer, Question, Survey
+from survey.tests.factories import create_survey
+
+
+class GenerateTest(SimpleTestCase):
+
+    def test_shape(self):
+        spec = generate_spec(pages=3, questions=2, answers=4, min_score=0, max_score=5)
+        survey = build_in_memory(spec)
+
+        self.assertEqual(len(survey), 3)
+        self.assertTrue(all(len(questions) == 2 for questions in survey.itervalues()))
+        all_answers = [a for questions in survey.itervalues() for q_type, answers in questions.itervalues()
+                       for a in answers]
+        self.assertEqual(len(set(a.id for a in all_answers)), 24)
+        self.assertTrue(all(0 <= a.score <= 5 for a in all_answers))
+
+    def test_radio_respondent(self):
+        survey = build_in_memory(generate_spec(pages=2, questions=2, answers=3, question_type=Question.SINGLE))
+        score, given, other = respond(survey)
+
+        for page_id, questions in given.iteritems():
+            for q_id, answers in questions.iteritems():
+                self.assertEqual(len(answers), 1)
+                self.assertEqual(len(other[page_id][q_id]), 2)
+        self.assertEqual(score, sum(a.score for questions in given.itervalues()
+                                    for answers in questions.itervalues() for a in answers))
+
+    def test_run_in_memory(self):
+        runs = run_benchmark(generate_spec(pages=3, questions=2, answers=3), repeat=2)
+
+        self.assertEqual([r['solver'] for r in runs], ['dp', 'search'])
+        for run in runs:
+            self.assertEqual(set(run['phases']), {'weight_all', 'compute'})
+            self.assertEqual(run['phases']['compute']['repeat'], 2)
+            self.assertTrue(run['phases']['compute']['min'] <= run['phases']['compute']['max'])
+
+
+class SavedSurveyTest(TestCase):
+
+    def test_create_survey(self):
+        survey = create_survey(generate_spec(pages=2, questions=3, answers=2), results=[(0, 10)])
+
+        self.assertEqual(Question.objects.filter(page__survey=survey).count(), 6)
+        self.assertEqual(Answer.objects.filter(question__page__survey=survey).count(), 12)
+        self.assertEqual(survey.result_set.count(), 1)
+
+    def test_run_with_saved_survey(self):
+        runs = run_with_saved_survey(generate_spec(pages=2, questions=2, answers=3), solvers=('dp',), repeat=1)
+
+        self.assertEqual(runs[0]['phases']['prepare']['queries'], 2)
+        self.assertEqual(Survey.objects.count(), 0)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output = os.path.join(directory, 'bench.json')
+            call_command('survey_benchmark', pages='2', questions='2', answers='2,3', repeat=1, output=output,
+                         stderr=open(os.devnull, 'w'))
+            with open(output) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(len(report['runs']), 4)
+        self.assertTrue('python' in report['environment'])
@@ -0,0 +1,116 @@
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.test.client import Client
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+
+from survey.cache import LRUCache, cache_closest_path, closest_path_cache, closest_path_key, get_survey_version
+from survey.models import Answer, Question, Page, Result
+
+
+class LRUCacheTest(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_stats(self):
+        cache = LRUCache(5)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('missing')
+
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 1, 'max_size': 5})
+
+    def test_timeout(self):
+        cache = LRUCache(5)
+        cache.set('kept', 1, timeout=60)
+        cache.set('expired', 2, timeout=0)
+
+        self.assertTrue('kept' in cache)
+        self.assertEqual(cache.get('kept'), 1)
+        self.assertFalse('expired' in cache)
+        self.assertIsNone(cache.get('expired'))
+
+
+class CacheClosestPathTest(SimpleTestCase):
+
+    def setUp(self):
+        closest_path_cache.clear()
+
+    @override_settings(SURVEY_CLOSEST_PATH_TRUNCATED_TIMEOUT=0)
+    def test_truncated_search_not_kept(self):
+        cache_closest_path('complete', {'better': {}, 'worse': {}, 'truncated': []})
+        cache_closest_path('truncated', {'better': None, 'worse': {}, 'truncated': ['better']})
+
+        self.assertTrue('complete' in closest_path_cache)
+        self.assertFalse('truncated' in closest_path_cache)
+
+    def test_truncated_search_kept_briefly(self):
+        cache_closest_path('truncated', {'better': None, 'worse': {}, 'truncated': ['better']})
+
+        self.assertTrue('truncated' in closest_path_cache)
+
+
+class ClosestPathKeyTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_canonical_answers(self):
+        self.assertEqual(closest_path_key(1, 8, [8, 1, 2, 1], 3), closest_path_key(1, 8, [1, 2, 8], 3))
+        self.assertNotEqual(closest_path_key(1, 8, [1, 2, 8], 3), closest_path_key(1, 8, [1, 2, 7], 3))
+        self.assertNotEqual(closest_path_key(1, 8, [1, 2, 8], 3), closest_path_key(2, 8, [1, 2, 8], 3))
+
+    def test_version_changes_on_save(self):
+        for obj in (Page.objects.get(pk=1), Question.objects.get(pk=1), Answer.objects.get(pk=1),
+                    Result.objects.filter(survey=1)[0]):
+            version = get_survey_version(1)
+            obj.save()
+            self.assertNotEqual(get_survey_version(1), version, type(obj))
+
+    def test_version_changes_on_delete(self):
+        version = get_survey_version(1)
+        other_version = get_survey_version(2)
+        Answer.objects.get(pk=1).delete()
+
+        self.assertNotEqual(get_survey_version(1), version)
+        self.assertEqual(get_survey_version(2), other_version)
+
+
+class ClosestPathCacheTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.c = Client()
+        session = SessionStore()
+        session['score'] = 8
+        session['answers'] = [1, 2, 5, 7, 8, 10, 12]
+        session.save()
+        self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        closest_path_cache.clear()
+
+    def test_second_request_is_a_hit(self):
+        first = self.c.get('/survey/1/closest_path')
+        second = self.c.get('/survey/1/closest_path')
+
+        self.assertEqual(closest_path_cache.stats()['misses'], 1)
+        self.assertEqual(closest_path_cache.stats()['hits'], 1)
+        self.assertEqual(first.content, second.content)
+
+    def test_change_invalidates(self):
+        self.c.get('/survey/1/closest_path')
+        answer = Answer.objects.get(pk=3)
+        answer.score = 100
+        answer.save()
+        self.c.get('/survey/1/closest_path')
+
+        self.assertEqual(closest_path_cache.stats()['misses'], 2)
+        self.assertEqual(closest_path_cache.stats()['hits'], 0)
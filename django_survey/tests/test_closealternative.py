@@ -1,5 +1,13 @@
+from itertools import combinations, product
+import random
+from timeit import default_timer
+
+from unittest import skipIf
+
 from django.test import SimpleTestCase, TestCase
-from survey.closealternative import AnsTuple, DiscoverPath, compute_closest_alternatives
+from survey import closealternative
+from survey.closealternative import (AnsTuple, DeltaTable, DiscoverPath, OptimalPath, ResultPaths,
+                                     SearchStats, compute_closest_alternatives)
 from survey.models import Result, Question
 
 
@@ -25,6 +33,28 @@ class ComputeClosestAlternativesTest(TestCase):
         self.assertEqual(worse[1]['add'], [])
         self.assertIsInstance(worse[0], Question)
 
+    def test_several_alternatives(self):
+        d = OptimalPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                        answers=get_answers(), other_answers=get_other_answers(), alternatives=3)
+        alternatives = d.compute()
+
+        with self.assertNumQueries(2):
+            better, worse = closealternative._prepare_result_for_display(alternatives)
+
+        self.assertEqual(len(better), 3)
+        self.assertEqual(len(worse), len(alternatives['worse']))
+        for prepared in better:
+            for question, changes in prepared.iteritems():
+                self.assertIsInstance(question, Question)
+                self.assertEqual(set(changes), {'add', 'rm'})
+
+    def test_several_alternatives_need_dp(self):
+        with self.assertRaises(ValueError):
+            compute_closest_alternatives(
+                score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                answers=get_answers(), other_answers=get_other_answers(), solver='search', alternatives=3
+            )
+
 
 class DiscoverPathTest(SimpleTestCase):
 
@@ -97,6 +127,379 @@ class DiscoverPathTest(SimpleTestCase):
         self.assertEqual(len(weights[2][2].add), 1)
 
 
+class DeltaTableTest(SimpleTestCase):
+
+    def test_improve(self):
+        table = DeltaTable(get_answers()[1][1], get_other_answers()[1][1])
+
+        self.assertEqual(table.max_changes, 3)
+        self.assertIsNone(table.get(0, True))
+        self.assertEqual(table.get(1, True), (10, [], [AnsTuple(id=3, score=10)]))
+        self.assertEqual(table.get(2, True), (15, [AnsTuple(id=1, score=-5)], [AnsTuple(id=3, score=10)]))
+        self.assertIsNone(table.get(4, True))
+
+    def test_worsen(self):
+        table = DeltaTable(get_answers()[1][1], get_other_answers()[1][1])
+
+        self.assertEqual(table.get(1, False), (-5, [AnsTuple(id=2, score=5)], []))
+        self.assertEqual(table.get(3, False), (10, [AnsTuple(id=2, score=5), AnsTuple(id=1, score=-5)],
+                                               [AnsTuple(id=3, score=10)]))
+
+    def test_weights_reuse_tables(self):
+        disc = DiscoverPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                            answers=get_answers(), other_answers=get_other_answers())
+        disc.compute()
+        tables = dict(disc._tables)
+        disc.compute()
+
+        self.assertEqual(len(tables), 5)
+        for key, table in tables.iteritems():
+            self.assertIs(disc._tables[key], table)
+
+    @skipIf(closealternative.numpy is None, 'numpy is not installed')
+    def test_numpy_same_as_python(self):
+        rnd = random.Random(3)
+        for i in range(200):
+            first = closealternative._prefix_sums(rnd.randint(-9, 9) for j in range(rnd.randint(1, 5)))
+            second = closealternative._prefix_sums(rnd.randint(-9, 9) for j in range(rnd.randint(0, 5)))
+            self.assertEqual(closealternative._best_splits_numpy(first, second),
+                             closealternative._best_splits_python(first, second))
+
+
+class OptimalPathTest(SimpleTestCase):
+
+    def test_same_as_search_for_better(self):
+        next_result = get_next_result()
+        points_needed = next_result.min_score - get_score()
+        search = DiscoverPath(score=get_score(), next_result=next_result, prev_result=get_prev_result(),
+                              answers=get_answers(), other_answers=get_other_answers())
+        dp = OptimalPath(score=get_score(), next_result=next_result, prev_result=get_prev_result(),
+                         answers=get_answers(), other_answers=get_other_answers())
+
+        self.assertEqual(dp._get_changes(points_needed), search._get_changes(points_needed))
+
+    def test_same_as_search_for_worse(self):
+        search = DiscoverPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                              answers=get_answers(), other_answers=get_other_answers())
+        dp = OptimalPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                         answers=get_answers(), other_answers=get_other_answers())
+
+        self.assertEqual(dp.compute()['worse'], search.compute()['worse'])
+
+    def test_unreachable(self):
+        dp = OptimalPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                         answers=get_answers(), other_answers=get_other_answers())
+
+        self.assertIsNone(dp._get_changes(1000))
+
+    def test_optimal_on_random_surveys(self):
+        rnd = random.Random(7)
+        for i in range(30):
+            answers, other_answers = random_answers(rnd, pages=4, questions=2, answers=3)
+            dp = OptimalPath(score=0, next_result=get_next_result(), prev_result=None,
+                             answers=answers, other_answers=other_answers)
+            weights = dp._weight_all()
+            for points_needed in (1, 5, 10, 20):
+                result = dp._get_changes(points_needed)
+                expected = brute_force_fewest_changes(weights, points_needed)
+                if expected is None:
+                    self.assertIsNone(result)
+                    continue
+                self.assertEqual(sum(w.val for w in result.itervalues()), expected)
+                self.assertTrue(sum(w.score for w in result.itervalues()) >= points_needed)
+
+    def test_alternatives_cheapest_first(self):
+        rnd = random.Random(11)
+        for i in range(20):
+            answers, other_answers = random_answers(rnd, pages=3, questions=2, answers=3)
+            dp = OptimalPath(score=0, next_result=get_next_result(), prev_result=None,
+                             answers=answers, other_answers=other_answers, alternatives=4)
+            all_costs = brute_force_all_changes(dp._weight_questions_by_page(), points_needed=8)
+            found = dp._get_changes(8)
+            costs = [sum(w.val for w in changes.itervalues()) for changes in found]
+
+            self.assertEqual(costs, all_costs[:4])
+            keys = set(tuple(sorted((w.pg, w.q, w.val) for w in changes.itervalues())) for changes in found)
+            self.assertEqual(len(keys), len(found))
+            for changes in found:
+                self.assertTrue(sum(w.score for w in changes.itervalues()) >= 8)
+
+    def test_alternatives_not_padded(self):
+        # one more answer on page 1 is enough
+        answers = {1: {1: [AnsTuple(id=1, score=0)]}, 2: {2: [AnsTuple(id=2, score=0)]}}
+        other_answers = {1: {1: [AnsTuple(id=3, score=10)]}, 2: {2: [AnsTuple(id=4, score=1)]}}
+        dp = OptimalPath(score=0, next_result=Result(min_score=5, max_score=20, id=2, summary='Up'), prev_result=None,
+                         answers=answers, other_answers=other_answers, alternatives=3)
+        found = dp.compute()['better']
+
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].keys(), [1])
+        self.assertEqual(found[0][1].score, 10)
+
+    def test_one_alternative_is_first_of_many(self):
+        one = OptimalPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                          answers=get_answers(), other_answers=get_other_answers())
+        many = OptimalPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                           answers=get_answers(), other_answers=get_other_answers(), alternatives=5)
+        best = one.compute()['better']
+        found = many.compute()['better']
+
+        self.assertEqual(sum(w.val for w in found[0].itervalues()), sum(w.val for w in best.itervalues()))
+        costs = [sum(w.val for w in changes.itervalues()) for changes in found]
+        self.assertEqual(costs, sorted(costs))
+
+
+class DeadlineTest(SimpleTestCase):
+
+    def test_no_deadline(self):
+        for path_class in (DiscoverPath, OptimalPath):
+            result = path_class(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                                answers=get_answers(), other_answers=get_other_answers()).compute()
+            self.assertEqual(result['truncated'], [])
+
+    def test_enough_time_is_optimal(self):
+        for path_class in (DiscoverPath, OptimalPath):
+            unlimited = path_class(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                                   answers=get_answers(), other_answers=get_other_answers()).compute()
+            limited = path_class(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                                 answers=get_answers(), other_answers=get_other_answers(), deadline=60000).compute()
+            self.assertEqual(limited, unlimited)
+
+    def test_out_of_time(self):
+        for path_class in (DiscoverPath, OptimalPath):
+            result = path_class(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                                answers=get_answers(), other_answers=get_other_answers(), deadline=0).compute()
+            self.assertEqual(sorted(result['truncated']), ['better', 'worse'])
+
+    def test_best_so_far_is_valid(self):
+        answers, other_answers = random_answers(random.Random(5), pages=30, questions=3, answers=6)
+        dp = OptimalPath(score=0, next_result=get_next_result(), prev_result=None,
+                         answers=answers, other_answers=other_answers)
+        weights = dp._weight_all_by_page()
+        dp._weight_all_by_page = lambda: weights
+        checks = []
+
+        def out_of_time():
+            # time runs out after 10 pages
+            checks.append(1)
+            dp._timed_out = len(checks) > 10
+            return dp._timed_out
+        dp._out_of_time = out_of_time
+        result = dp._get_changes(20)
+
+        self.assertTrue(dp._timed_out)
+        self.assertTrue(sum(w.score for w in result.itervalues()) >= 20)
+        self.assertTrue(all(page_id <= 10 for page_id in result))
+
+
+class SearchStatsTest(SimpleTestCase):
+
+    def compute(self, path_class, stats=None):
+        return path_class(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                          answers=get_answers(), other_answers=get_other_answers(), stats=stats).compute()
+
+    def test_no_stats(self):
+        for path_class in (DiscoverPath, OptimalPath):
+            self.assertNotIn('stats', self.compute(path_class))
+
+    def test_same_result_with_stats(self):
+        for path_class in (DiscoverPath, OptimalPath):
+            result = self.compute(path_class, SearchStats(callback=lambda stats: None))
+            del result['stats']
+            self.assertEqual(result, self.compute(path_class))
+
+    def test_discover_path_stats(self):
+        emitted = []
+        result = self.compute(DiscoverPath, SearchStats(callback=emitted.append))
+
+        self.assertEqual(emitted, [result['stats']])
+        for route in ('better', 'worse'):
+            stats = result['stats'][route]
+            self.assertTrue(stats['counts']['candidates'] > 0)
+            self.assertEqual(stats['counts']['weights'], sum(stats['weights_per_page'].itervalues()))
+            self.assertEqual(stats['counts']['weights'], sum(stats['weights_per_value'].itervalues()))
+            self.assertIn('all_possible_changes', stats['counts'])
+            self.assertEqual(sorted(stats['timings']), ['choose', 'search', 'total', 'weight_all'])
+
+    def test_weights_counted_once_kept(self):
+        stats = SearchStats(callback=lambda stats: None)
+        stats.start_route('better')
+        path = DiscoverPath(score=get_score(), next_result=get_next_result(), prev_result=get_prev_result(),
+                            answers=get_answers(), other_answers=get_other_answers(), stats=stats)
+        kept = sum(len(details) for details in path._weight_all().itervalues())
+
+        counts = stats.as_dict()['better']['counts']
+        self.assertEqual(counts['weights'], kept)
+        # question 1 and question 5 of page 1 both give a weight of 1, only the best is kept
+        self.assertTrue(counts['weights_pruned'] > 0)
+
+    def test_optimal_path_stats(self):
+        result = self.compute(OptimalPath, SearchStats(callback=lambda stats: None))
+
+        for route in ('better', 'worse'):
+            stats = result['stats'][route]
+            self.assertTrue(stats['counts']['candidates'] > stats['counts']['candidates_pruned'])
+            self.assertEqual(sorted(stats['timings']), ['dp', 'rebuild', 'total', 'weight_all'])
+
+
+class ResultPathsTest(SimpleTestCase):
+
+    def get_results(self):
+        return [get_prev_result(), Result(min_score=0, max_score=14, id=2, summary='Middle'), get_next_result()]
+
+    def test_every_result(self):
+        paths = ResultPaths(score=get_score(), results=self.get_results(),
+                            answers=get_answers(), other_answers=get_other_answers()).compute()
+
+        self.assertEqual(paths[2], {})
+        self.assertEqual(sum(w.val for w in paths[3].itervalues()), 1)
+        self.assertTrue(14 <= get_score() + sum(w.score for w in paths[3].itervalues()) < 35)
+        self.assertEqual(sum(w.val for w in paths[1].itervalues()), 1)
+        self.assertTrue(-9 <= get_score() + sum(w.score for w in paths[1].itervalues()) < 0)
+
+    def test_unreachable(self):
+        results = [Result(min_score=1000, max_score=2000, id=9, summary='Too far')]
+        paths = ResultPaths(score=get_score(), results=results,
+                            answers=get_answers(), other_answers=get_other_answers()).compute()
+
+        self.assertIsNone(paths[9])
+
+    def test_middle_scored_answer(self):
+        answers = {1: {1: [AnsTuple(id=1, score=0)]}}
+        other_answers = {1: {1: [AnsTuple(id=2, score=5), AnsTuple(id=3, score=10), AnsTuple(id=4, score=15)]}}
+        results = [Result(min_score=low, max_score=low + 5, id=low, summary='') for low in range(0, 20, 5)]
+        paths = ResultPaths(score=0, results=results, answers=answers, other_answers=other_answers).compute()
+
+        self.assertEqual([(w.val, w.score, w.add) for w in paths[10].values()], [(1, 10, [AnsTuple(id=3, score=10)])])
+
+    def test_fewest_changes_on_random_surveys(self):
+        rnd = random.Random(13)
+        results = [Result(min_score=low, max_score=low + 1, id=low, summary='') for low in range(-20, 30)]
+        for i in range(20):
+            answers, other_answers = random_answers(rnd, pages=2, questions=2, answers=5)
+            found = ResultPaths(score=0, results=results, answers=answers, other_answers=other_answers).compute()
+            options = brute_force_page_options(answers, other_answers)
+            for result in results:
+                expected = brute_force_interval(options, result.min_score, result.max_score)
+                if expected is None:
+                    self.assertIsNone(found[result.id])
+                    continue
+                changes = found[result.id]
+                self.assertEqual(sum(w.val for w in changes.itervalues()), expected)
+                self.assertTrue(result.min_score <= sum(w.score for w in changes.itervalues()) < result.max_score)
+                self.assertEqual(len(set(w.pg for w in changes.itervalues())), len(changes))
+
+
+    def test_only_scores_inside_results(self):
+        answers = {1: {1: [AnsTuple(id=1, score=0)]}, 2: {2: [AnsTuple(id=2, score=0)]}}
+        other_answers = {1: {1: [AnsTuple(id=3, score=100), AnsTuple(id=4, score=1), AnsTuple(id=7, score=200)]},
+                         2: {2: [AnsTuple(id=5, score=-100), AnsTuple(id=6, score=2)]}}
+        results = [Result(min_score=0, max_score=4, id=1, summary='')]
+        paths = ResultPaths(score=0, results=results, answers=answers, other_answers=other_answers)
+
+        by_page = paths._weight_by_page(0, 3)
+        # +100 on page 1 could only come back inside [0, 3] with -100 on page 2, and the other way round
+        self.assertEqual(sorted(w.score for w in by_page[1]), [1, 100, 101])
+        self.assertEqual(paths.compute(), {1: {}})
+
+    def test_deadline_on_wide_scores(self):
+        rnd = random.Random(17)
+        answers, other_answers = random_answers(rnd, pages=20, questions=1, answers=16, min_score=-1000,
+                                                max_score=1000)
+        results = [Result(min_score=low, max_score=low + 50, id=low, summary='') for low in range(-500, 500, 50)]
+        paths = ResultPaths(score=0, results=results, answers=answers, other_answers=other_answers, deadline=100)
+        start = default_timer()
+        found = paths.compute()
+
+        self.assertTrue(default_timer() - start < 1)
+        self.assertTrue(paths.truncated)
+        for result in results:
+            if found[result.id] is not None:
+                score = sum(w.score for w in found[result.id].itervalues())
+                self.assertTrue(result.min_score <= score < result.max_score)
+
+
+def brute_force_page_options(answers, other_answers):
+    """Every (score change, number of changes) of every page, from the subsets of the raw answers:
+    one question changed, answers removed and added, and the question keeps at least one answer.
+    """
+    options = []
+    for page_id, questions in answers.iteritems():
+        page_options = [(0, 0)]
+        for q_id, given in questions.iteritems():
+            other = other_answers[page_id][q_id]
+            for j in range(len(given) + 1):
+                for k in range(len(other) + 1):
+                    if k == 0 and (j == 0 or j == len(given)):
+                        continue
+                    for removed in combinations(given, j):
+                        for added in combinations(other, k):
+                            page_options.append((sum(a.score for a in added) - sum(a.score for a in removed), j + k))
+        options.append(page_options)
+    return options
+
+
+def brute_force_interval(options, min_score, max_score):
+    fewest = None
+    for combination in product(*options):
+        if min_score <= sum(score for score, changes in combination) < max_score:
+            changes = sum(changes for score, changes in combination)
+            if fewest is None or changes < fewest:
+                fewest = changes
+    return fewest
+
+
+def brute_force_all_changes(by_page, points_needed):
+    """The costs of the change sets reaching points_needed, without those containing a smaller one that does."""
+    costs = []
+    for combination in product(*[[None] + weights for weights in by_page.values()]):
+        chosen = [w for w in combination if w is not None]
+        if sum(w.score for w in chosen) < points_needed:
+            continue
+        if any(sum(w.score for w in fewer) >= points_needed
+               for n in range(len(chosen)) for fewer in combinations(chosen, n)):
+            continue
+        costs.append(sum(w.val for w in chosen))
+    return sorted(costs)
+
+
+def brute_force_fewest_changes(weights, points_needed):
+    by_page = {}
+    for details in weights.itervalues():
+        for page_id, w in details.iteritems():
+            by_page.setdefault(page_id, [None]).append(w)
+    fewest = None
+    for combination in product(*by_page.values()):
+        chosen = [w for w in combination if w is not None]
+        if sum(w.score for w in chosen) < points_needed:
+            continue
+        changes = sum(w.val for w in chosen)
+        if fewest is None or changes < fewest:
+            fewest = changes
+    return fewest
+
+
+def random_answers(rnd, pages, questions, answers, min_score=-5, max_score=10):
+    given = {}
+    other = {}
+    ans_id = 1
+    for pg in range(1, pages + 1):
+        given[pg] = {}
+        other[pg] = {}
+        for q in range(questions):
+            q_id = pg * 100 + q
+            given[pg][q_id] = []
+            other[pg][q_id] = []
+            for a in range(answers):
+                a_tuple = AnsTuple(id=ans_id, score=rnd.randint(min_score, max_score))
+                ans_id += 1
+                if a == 0 or rnd.random() < 0.3:
+                    given[pg][q_id].append(a_tuple)
+                else:
+                    other[pg][q_id].append(a_tuple)
+    return given, other
+
+
 def get_answers():
     return {
         1: {  # page 1
@@ -0,0 +1,129 @@
+import random
+from itertools import combinations, product
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse, NoReverseMatch
+from django.test import SimpleTestCase, TestCase
+from django.test.client import Client
+
+from survey.coverage import Coverage, question_scores, reachable_scores, survey_coverage
+from survey.models import Question, Result
+from survey.tests.factories import create_survey
+
+
+def brute_force(questions):
+    """Every total of every way to answer the questions."""
+    choices = []
+    for q_type, scores in questions:
+        if q_type == Question.SINGLE:
+            choices.append(set(scores))
+        else:
+            choices.append(set(sum(subset) for n in range(1, len(scores) + 1)
+                               for subset in combinations(scores, n)))
+    return set(sum(totals) for totals in product(*choices))
+
+
+class ReachableScoresTest(SimpleTestCase):
+
+    def test_radio_takes_one_answer(self):
+        self.assertEqual(list(question_scores(Question.SINGLE, [0, 5])), [0, 5])
+
+    def test_checkbox_takes_a_non_empty_subset(self):
+        self.assertEqual(list(question_scores(Question.MULTIPLE, [2, 3])), [2, 3, 5])
+        # 0 only comes from the answers scoring 0
+        self.assertNotIn(0, question_scores(Question.MULTIPLE, [1, 2]))
+        self.assertIn(0, question_scores(Question.MULTIPLE, [1, -1]))
+
+    def test_question_without_answers(self):
+        self.assertFalse(reachable_scores([(Question.SINGLE, [1]), (Question.MULTIPLE, [])]))
+
+    def test_same_as_brute_force(self):
+        rnd = random.Random(0)
+        for i in range(50):
+            questions = [(rnd.choice([Question.SINGLE, Question.MULTIPLE]),
+                          [rnd.randint(-6, 6) for a in range(rnd.randint(1, 4))])
+                         for q in range(rnd.randint(1, 4))]
+            self.assertEqual(set(reachable_scores(questions)), brute_force(questions), questions)
+
+    def test_large_survey(self):
+        rnd = random.Random(0)
+        questions = [(Question.MULTIPLE, [rnd.randint(-10, 10) for a in range(10)]) for q in range(300)]
+        reachable = reachable_scores(questions)
+
+        # all the negative (or positive) answers of every question
+        lowest = sum(min(sum(s for s in scores if s < 0), min(scores)) for q_type, scores in questions)
+        highest = sum(max(sum(s for s in scores if s > 0), max(scores)) for q_type, scores in questions)
+        self.assertEqual(reachable.intervals(), [(lowest, highest + 1)])
+
+
+class CoverageTest(SimpleTestCase):
+
+    def test_uncovered_and_dead(self):
+        # 0, 2, 4, 6
+        reachable = reachable_scores([(Question.SINGLE, [0, 2]), (Question.SINGLE, [0, 4])])
+        results = [Result(summary='Low', min_score=-100, max_score=1), Result(summary='Odd', min_score=3, max_score=4),
+                   Result(summary='High', min_score=5, max_score=1000)]
+        coverage = Coverage(reachable, results)
+
+        self.assertEqual(coverage.uncovered, [(2, 3), (4, 5)])
+        self.assertEqual([r.summary for r in coverage.dead], ['Odd'])
+        self.assertEqual(coverage.warnings(), [
+            'No result for the attainable scores 2.',
+            'No result for the attainable scores 4.',
+            'Nobody can get the result "Odd": no attainable score is between 3 and 3.'])
+
+    def test_covered(self):
+        reachable = reachable_scores([(Question.MULTIPLE, [1, 2, 3])])
+        coverage = Coverage(reachable, [Result(min_score=1, max_score=4), Result(min_score=4, max_score=7)])
+
+        self.assertEqual(coverage.warnings(), [])
+
+
+class SurveyCoverageTest(TestCase):
+
+    def test_survey(self):
+        survey = create_survey([[(Question.SINGLE, [1, 2])], [(Question.MULTIPLE, [0, 10])]],
+                               results=[(0, 5), (100, 200)])
+        coverage = survey_coverage(survey.id)
+
+        self.assertEqual(list(coverage.reachable), [1, 2, 11, 12])
+        self.assertEqual(coverage.uncovered, [(11, 13)])
+        self.assertEqual([(r.min_score, r.max_score) for r in coverage.dead], [(100, 200)])
+
+    def test_admin(self):
+        try:
+            url = reverse('admin:survey_survey_change', args=(0,))
+        except NoReverseMatch:
+            self.skipTest('the admin is not in the URLconf')
+        survey = create_survey([[(Question.SINGLE, [1, 2])]], results=[(0, 2)])
+        result = survey.result_set.get()
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        client = Client()
+        client.login(username='admin', password='admin')
+        url = reverse('admin:survey_survey_change', args=(survey.id,))
+
+        response = client.get(url)
+        self.assertContains(response, 'No result for the attainable scores 2.')
+
+        response = client.post(url, {
+            'name': survey.name,
+            'description': survey.description,
+            'page_set-TOTAL_FORMS': 1,
+            'page_set-INITIAL_FORMS': 1,
+            'page_set-MAX_NUM_FORMS': 1000,
+            'page_set-0-id': survey.page_set.get().id,
+            'page_set-0-survey': survey.id,
+            'page_set-0-page_num': 1,
+            'result_set-TOTAL_FORMS': 1,
+            'result_set-INITIAL_FORMS': 1,
+            'result_set-MAX_NUM_FORMS': 1000,
+            'result_set-0-id': result.id,
+            'result_set-0-survey': survey.id,
+            'result_set-0-summary': 'Out of reach',
+            'result_set-0-min_score': 5,
+            'result_set-0-max_score': 10,
+        }, follow=True)
+        self.assertEqual(Result.objects.get(pk=result.id).min_score, 5)
+        shown = [str(m) for m in response.context['messages']]
+        self.assertIn('No result for the attainable scores from 1 to 2.', shown)
+        self.assertIn('Nobody can get the result "Out of reach": no attainable score is between 5 and 9.', shown)
@@ -0,0 +1,105 @@
+import csv
+import json
+import os
+import tempfile
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.client import Client
+
+from survey import export
+from survey.models import Answer
+from survey.tests.test_statistics import RESPONSES, save_responses
+
+
+class ExportTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        save_responses(RESPONSES)
+
+    def test_jsonl(self):
+        records = [json.loads(line) for line in export.stream([1], 'jsonl', chunk_size=2)]
+        answers = [r for r in records if r['type'] == 'answer']
+        responses = [r for r in records if r['type'] == 'response']
+
+        self.assertEqual(len(answers), Answer.objects.filter(question__page__survey=1).count())
+        self.assertEqual([r['answer_ids'] for r in responses], [r[3] for r in RESPONSES])
+        self.assertEqual([r['score'] for r in responses], [r[1] for r in RESPONSES])
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(''.join(export.stream([1], 'csv', chunk_size=2)))))
+        response_rows = [r for r in rows if r['offset']]
+
+        self.assertEqual(len(rows) - len(response_rows), Answer.objects.filter(question__page__survey=1).count())
+        self.assertEqual(len(response_rows), sum(len(r[3]) for r in RESPONSES))
+        answer = Answer.objects.select_related('question__page').get(pk=int(response_rows[0]['answer_id']))
+        self.assertEqual(response_rows[0]['answer_text'], answer.answer_text)
+        self.assertEqual(int(response_rows[0]['page_num']), answer.question.page.page_num)
+
+    def test_resume(self):
+        records = [json.loads(line) for line in export.stream([1], 'jsonl')]
+        responses = [r for r in records if r['type'] == 'response']
+        resumed = [json.loads(line) for line in export.stream([1], 'jsonl', after=responses[0]['offset'])]
+
+        self.assertEqual(resumed, responses[1:])
+
+    def test_constant_queries_per_chunk(self):
+        list(export.stream([1], 'jsonl'))
+        # two queries per chunk of 2 responses, and one to find there are no more
+        with self.assertNumQueries(5):
+            list(export.stream([1], 'jsonl', chunk_size=2))
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('export_survey', '1', format='jsonl', output=path)
+            with open(path) as f:
+                lines = f.readlines()
+            offsets = [json.loads(line).get('offset') for line in lines]
+            call_command('export_survey', '1', format='jsonl', output=path, after=offsets[-1])
+            with open(path) as f:
+                self.assertEqual(f.readlines(), lines)
+        finally:
+            os.remove(path)
+
+    def test_command_resumes_csv_mid_response(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('export_survey', '1', output=path)
+            with open(path, 'rb') as f:
+                lines = f.readlines()
+            offsets = [row[1] for row in csv.reader(lines)]
+            # stopped after the first row of a response with several rows
+            cut = next(i for i, offset in enumerate(offsets) if offset and offsets.count(offset) > 1) + 1
+            with open(path, 'wb') as f:
+                f.writelines(lines[:cut])
+            call_command('export_survey', '1', output=path, after=int(offsets[cut - 1]))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.readlines(), lines)
+        finally:
+            os.remove(path)
+
+    def test_cut_csv_multiline_field(self):
+        f = StringIO()
+        csv.writer(f).writerows([export.CSV_COLUMNS[:3], [1, '', 'a\nb'], [1, 4, 'k'], [1, 5, 'k\nl'], [1, 5, 'x']])
+        expected = f.getvalue()[:f.getvalue().index('1,5,')]
+        export.cut_csv(f, 5)
+
+        self.assertEqual(f.getvalue(), expected)
+
+    def test_admin_action(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        c = Client()
+        c.login(username='admin', password='pass')
+        response = c.post('/admin/survey/survey/', {'action': 'export_csv', '_selected_action': [1, 2]})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(''.join(response.streaming_content))))
+        self.assertEqual(rows[0], export.CSV_COLUMNS)
+        # survey 2 has no questions and no responses
+        self.assertEqual(set(row[0] for row in rows[1:]), {'1'})
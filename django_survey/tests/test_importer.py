@@ -0,0 +1,120 @@
+import copy
+import json
+import sys
+from StringIO import StringIO
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from survey import importer
+from survey.models import Survey, Question
+from survey.snapshot import get_snapshot
+
+
+SURVEY = {
+    'name': 'Imported',
+    'description': 'A survey',
+    'pages': [
+        [
+            {'text': 'First', 'type': 'radio', 'answers': [{'text': 'a', 'score': 1}, {'text': 'b', 'score': 2}]},
+            {'text': 'Second', 'answers': [{'text': 'c', 'score': -1}]}
+        ],
+        [
+            {'text': 'Third', 'answers': [{'text': 'd', 'score': 5}, {'text': 'e', 'score': 0}]}
+        ]
+    ],
+    'results': [
+        {'summary': 'Low', 'min_score': -10, 'max_score': 3},
+        {'summary': 'High', 'min_score': 3, 'max_score': 20}
+    ]
+}
+
+
+def changed(**kwargs):
+    data = copy.deepcopy(SURVEY)
+    data.update(kwargs)
+    return data
+
+
+class ImportSurveyTest(TestCase):
+
+    def test_import(self):
+        survey, warnings = importer.import_survey(SURVEY)
+
+        self.assertEqual(warnings, [])
+        snapshot = get_snapshot(survey.id)
+        self.assertEqual(list(snapshot.page_nums), [1, 2])
+        first_page = snapshot.get_questions(1)
+        self.assertEqual([q.question_text for q in first_page], ['First', 'Second'])
+        self.assertEqual([q.type for q in first_page], ['radio', 'checkbox'])
+        self.assertEqual([(a.answer_text, a.score) for a in first_page[0].answers], [('a', 1), ('b', 2)])
+        self.assertEqual(snapshot.get_result(3).summary, 'High')
+
+    def test_constant_queries(self):
+        small = changed(pages=[SURVEY['pages'][1]])
+        # sqlite limits the number of values per query, so bigger surveys take a few more
+        big = changed(pages=[SURVEY['pages'][0] * 30] * 2)
+        with CaptureQueriesContext(connection) as small_queries:
+            importer.import_survey(small)
+        with self.assertNumQueries(len(small_queries)):
+            importer.import_survey(big)
+        self.assertEqual(Question.objects.filter(page__survey__name='Imported').count(), 121)
+
+    def test_invalid_nothing_saved(self):
+        bad = changed(pages=[[{'text': 'No answers', 'answers': []}]])
+
+        self.assertRaises(importer.InvalidSurvey, importer.import_survey, bad)
+        self.assertFalse(Survey.objects.filter(name='Imported').exists())
+
+    def test_overlapping_results(self):
+        bad = changed(results=[{'summary': 'Low', 'min_score': 0, 'max_score': 5},
+                               {'summary': 'High', 'min_score': 4, 'max_score': 10}])
+
+        self.assertRaises(importer.InvalidSurvey, importer.import_survey, bad)
+
+    def test_empty_result(self):
+        bad = changed(results=[{'summary': 'Low', 'min_score': 5, 'max_score': 5}])
+
+        self.assertRaises(importer.InvalidSurvey, importer.import_survey, bad)
+
+    def test_result_gap(self):
+        gap = changed(results=[{'summary': 'Low', 'min_score': 0, 'max_score': 5},
+                               {'summary': 'High', 'min_score': 7, 'max_score': 10}])
+        survey, warnings = importer.import_survey(gap)
+
+        self.assertEqual(warnings, ['Imported: no result for the scores from 5 to 6.'])
+
+    def test_read_jsonl(self):
+        lines = StringIO('\n'.join([json.dumps(SURVEY), '', json.dumps(changed(name='Other'))]))
+
+        self.assertEqual([s['name'] for s in importer.read_surveys(lines, 'jsonl')], ['Imported', 'Other'])
+
+    @skipIf(importer.yaml is None, 'PyYAML is not installed')
+    def test_read_yaml(self):
+        documents = StringIO(importer.yaml.safe_dump_all([SURVEY, changed(name='Other')]))
+
+        self.assertEqual(list(importer.read_surveys(documents, 'yaml')), [SURVEY, changed(name='Other')])
+
+    def test_command(self):
+        out = StringIO()
+        stdin = sys.stdin
+        sys.stdin = StringIO(json.dumps([SURVEY, changed(name='Other')]))
+        try:
+            call_command('import_survey', '-', stdout=out)
+        finally:
+            sys.stdin = stdin
+
+        self.assertEqual(Survey.objects.filter(name__in=['Imported', 'Other']).count(), 2)
+        self.assertIn('Imported survey', out.getvalue())
+
+    def test_command_invalid(self):
+        stdin = sys.stdin
+        sys.stdin = StringIO(json.dumps(changed(results='none')))
+        try:
+            self.assertRaises(CommandError, call_command, 'import_survey', '-', stdout=StringIO())
+        finally:
+            sys.stdin = stdin
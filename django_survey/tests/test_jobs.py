@@ -0,0 +1,225 @@
+import json
+import threading
+from timeit import default_timer
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+
+from survey.cache import closest_path_cache, closest_path_key
+from survey import jobs as jobs_module
+from survey.jobs import ClosestPathJobs, _Routes, closest_path_jobs
+from survey.tests.test_closealternative import (get_score, get_next_result, get_prev_result,
+                                                get_answers, get_other_answers)
+
+
+def search_arguments():
+    return {
+        'score': get_score(),
+        'next_result': get_next_result(),
+        'prev_result': get_prev_result(),
+        'answers': get_answers(),
+        'other_answers': get_other_answers()
+    }
+
+
+class hold_searches(object):
+    """Keep the route searches of the pool waiting until shortly after the block starts."""
+
+    def __init__(self, release_after=0.1):
+        self.release_after = release_after
+
+    def __enter__(self):
+        self.release = threading.Event()
+        search_named = self.search_named = jobs_module._search_named
+
+        def held(item):
+            self.release.wait()
+            return search_named(item)
+
+        jobs_module._search_named = held
+        self.timer = threading.Timer(self.release_after, self.release.set)
+        self.timer.start()
+
+    def __exit__(self, *exc_info):
+        jobs_module._search_named = self.search_named
+        self.release.set()
+        self.timer.cancel()
+
+
+class ClosestPathJobsTest(TestCase):
+
+    def setUp(self):
+        closest_path_cache.clear()
+
+    def route_searches(self):
+        return {
+            'better': dict(search_arguments(), prev_result=None),
+            'worse': dict(search_arguments(), next_result=None)
+        }
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL=None)
+    def test_submit_routes_without_pool(self):
+        jobs = ClosestPathJobs()
+        jobs.submit_routes('key', self.route_searches())
+
+        self.assertFalse(jobs.is_pending('key'))
+        # nothing left to wait for
+        self.assertEqual(list(jobs.wait_routes('key', 1)), [])
+        self.assertEqual(set(closest_path_cache.get('key')), {'better', 'worse', 'truncated'})
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+    def test_submit_routes_to_thread_pool(self):
+        jobs = ClosestPathJobs()
+        jobs.submit_routes('key', self.route_searches())
+        jobs.shutdown()
+
+        self.assertFalse(jobs.is_pending('key'))
+        self.assertEqual(set(closest_path_cache.get('key')), {'better', 'worse', 'truncated'})
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+    def test_wait_routes(self):
+        jobs = ClosestPathJobs()
+        with hold_searches():
+            jobs.submit_routes('key', self.route_searches())
+            self.assertTrue(jobs.is_pending('key'))
+            outcomes = dict(jobs.wait_routes('key', 10))
+        jobs.shutdown()
+
+        self.assertEqual(set(outcomes), {'better', 'worse'})
+        self.assertEqual(set(outcomes['better'][0]), {'better', 'truncated'})
+        self.assertFalse(jobs.is_pending('key'))
+        alternatives = closest_path_cache.get('key')
+        self.assertEqual(alternatives['better'], outcomes['better'][0]['better'])
+        self.assertEqual(alternatives['worse'], outcomes['worse'][0]['worse'])
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+    def test_wait_routes_timeout(self):
+        jobs = ClosestPathJobs()
+        with hold_searches(release_after=0.5):
+            jobs.submit_routes('key', self.route_searches())
+            self.assertEqual(list(jobs.wait_routes('key', 0.05)), [])
+        jobs.shutdown()
+
+        self.assertTrue('key' in closest_path_cache)
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL=None)
+    def test_submit_routes_after_expired(self):
+        jobs = ClosestPathJobs()
+        stale = jobs._pending['key'] = _Routes(['better'], expires=default_timer() - 1)
+
+        self.assertFalse(jobs.is_pending('key'))
+        jobs.submit_routes('key', self.route_searches())
+        self.assertTrue('key' in closest_path_cache)
+        # the lost routes finishing after all leave the new search alone
+        jobs._pending['key'] = new = _Routes(['better'])
+        jobs._route_done('key', stale, ('better', ({'better': None, 'truncated': []}, None)))
+        self.assertIs(jobs._pending['key'], new)
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL=None)
+    def test_failed_route_is_not_cached(self):
+        jobs = ClosestPathJobs()
+        searches = self.route_searches()
+        searches['worse']['prev_result'] = None
+        jobs.submit_routes('key', searches)
+
+        self.assertFalse(jobs.is_pending('key'))
+        self.assertFalse('key' in closest_path_cache)
+
+    def search_each(self):
+        better = dict(search_arguments(), prev_result=None)
+        worse = dict(search_arguments(), next_result=None)
+        failing = dict(search_arguments(), next_result=None, prev_result=None)
+        jobs = ClosestPathJobs()
+        outcomes = dict(jobs.search_each({'better': better, 'worse': worse, 'failing': failing}))
+        jobs.shutdown()
+        return outcomes
+
+    def assertOutcomes(self, outcomes):
+        self.assertEqual(set(outcomes['better'][0]), {'better', 'truncated'})
+        self.assertEqual(set(outcomes['worse'][0]), {'worse', 'truncated'})
+        self.assertIsNone(outcomes['failing'][0])
+        self.assertIn('ValueError', outcomes['failing'][1])
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL=None)
+    def test_search_each_without_pool(self):
+        self.assertOutcomes(self.search_each())
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+    def test_search_each_in_thread_pool(self):
+        self.assertOutcomes(self.search_each())
+
+
+@override_settings(SURVEY_CLOSEST_PATH_POOL=None, SURVEY_RESPONSES_SYNC=True)
+class FinishedSurveyTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.c = Client()
+        session = SessionStore()
+        session['survey_page'] = 2
+        session['answers'] = [1, 2, 5, 7, 8]
+        session['page_answers'] = {'1': [1, 2, 5, 7, 8]}
+        session['page_scores'] = {'1': 8}
+        session.save()
+        self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        closest_path_cache.clear()
+
+    def test_closest_path_ready_after_last_page(self):
+        self.c.post('/survey/1/page/2', {'question[4]': 10, 'question[5]': 12})
+        key = closest_path_key(1, 8, [1, 2, 5, 7, 8, 10, 12], 3)
+
+        self.assertTrue(key in closest_path_cache)
+
+        self.c.get('/survey/1/result')
+        response = self.c.get('/survey/1/closest_path')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(closest_path_cache.stats()['hits'], 1)
+
+    def get_with_pending(self, routes):
+        key = closest_path_key(1, 8, [1, 2, 5, 7, 8, 10, 12], 3)
+        closest_path_jobs._pending[key] = routes
+        session = self.c.session
+        session['score'] = 8
+        session['answers'] = [1, 2, 5, 7, 8, 10, 12]
+        session.save()
+        try:
+            return self.c.get('/survey/1/closest_path')
+        finally:
+            closest_path_jobs._pending.pop(key, None)
+
+    def test_pending(self):
+        response = self.get_with_pending(_Routes(['better', 'worse'], expires=default_timer() + 60))
+
+        self.assertEqual(response.status_code, 202)
+
+    def test_pending_expired(self):
+        # a search whose routes never finished, like one lost with a process worker
+        response = self.get_with_pending(_Routes(['better', 'worse'], expires=default_timer() - 1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(closest_path_cache), 1)
+
+    @override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+    def test_stream_waits_for_background_search(self):
+        key = closest_path_key(1, 8, [1, 2, 5, 7, 8, 10, 12], 3)
+        searched = []
+        closest_path_jobs.search_each = lambda searches: iter(searched.extend(searches) or [])
+        try:
+            with hold_searches():
+                self.c.post('/survey/1/page/2', {'question[4]': 10, 'question[5]': 12})
+                self.assertTrue(closest_path_jobs.is_pending(key))
+                self.c.get('/survey/1/result')
+                response = self.c.get('/survey/1/closest_path/stream')
+                routes = [json.loads(line)['route'] for line in ''.join(response.streaming_content).splitlines()]
+        finally:
+            del closest_path_jobs.search_each
+            closest_path_jobs.shutdown()
+
+        self.assertEqual(sorted(routes), ['better', 'worse'])
+        # both routes came from the search started by the last page
+        self.assertEqual(searched, [])
+        self.assertTrue(key in closest_path_cache)
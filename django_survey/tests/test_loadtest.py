@@ -0,0 +1,93 @@
+import json
+import random
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase
+from django.test.utils import override_settings
+
+from survey.loadtest import pick_answers, plan_survey, run_load_test, summarize
+from survey.models import Page, Question, Response
+
+
+class PickAnswersTest(SimpleTestCase):
+
+    def test_valid_answers(self):
+        rnd = random.Random(0)
+        questions = [(1, Question.SINGLE, [1, 2, 3]), (2, Question.MULTIPLE, [4, 5, 6])]
+        for i in range(50):
+            data = pick_answers(questions, rnd)
+            self.assertEqual(len(data['question[1]']), 1)
+            self.assertIn(data['question[1]'][0], [1, 2, 3])
+            self.assertTrue(1 <= len(set(data['question[2]'])) == len(data['question[2]']) <= 3)
+            self.assertTrue(set(data['question[2]']) <= set([4, 5, 6]))
+
+
+class SummarizeTest(SimpleTestCase):
+
+    def test_percentiles(self):
+        samples = [('survey:list', i / 100.0, i != 100) for i in range(1, 101)]
+        report = summarize(samples + [('survey:result', 0.5, True)], elapsed=2.0)
+
+        self.assertEqual(report['requests'], 101)
+        self.assertEqual(report['throughput'], 50.5)
+        stats = report['urls']['survey:list']
+        self.assertEqual((stats['p50'], stats['p95'], stats['p99']), (0.5, 0.95, 0.99))
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['error_rate'], 0.01)
+        self.assertEqual(report['urls']['survey:result']['p99'], 0.5)
+
+
+@override_settings(SURVEY_CLOSEST_PATH_POOL=None, SURVEY_RESPONSES_SYNC=True)
+class RunLoadTestTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_in_process(self):
+        pages = Page.objects.filter(survey=1).count()
+        report = run_load_test([1], respondents=3, concurrency=1)
+
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(Response.objects.filter(survey=1).count(), 3)
+        urls = report['urls']
+        self.assertEqual(urls['survey:list']['requests'], 3)
+        self.assertEqual(urls['survey:survey']['requests'], 3 * 2 * pages)
+        self.assertEqual(urls['survey:result']['requests'], 3)
+        self.assertEqual(urls['survey:closest_stream']['requests'], 3)
+        self.assertNotIn('survey:closest', urls)
+        self.assertTrue(all(stats['errors'] == 0 for stats in urls.itervalues()))
+
+    def test_in_process_polling(self):
+        report = run_load_test([1], respondents=3, concurrency=1, stream=False)
+
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(report['urls']['survey:closest']['requests'], 3)
+        self.assertNotIn('survey:closest_stream', report['urls'])
+
+    def test_plan(self):
+        plan = plan_survey(1)
+
+        self.assertEqual([page_num for page_num, questions in plan],
+                         list(Page.objects.filter(survey=1).order_by('page_num').values_list('page_num', flat=True)))
+        question = Question.objects.get(pk=plan[0][1][0][0])
+        self.assertEqual(plan[0][1][0][2], [a.id for a in question.answer_set.all()])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('survey_loadtest', '1', respondents=2, concurrency=1, stdout=out, stderr=StringIO())
+
+        report = json.loads(out.getvalue())['report']
+        self.assertEqual(report['respondents'], 2)
+        self.assertEqual(report['failed'], 0)
+
+
+@override_settings(SURVEY_CLOSEST_PATH_POOL=None, SURVEY_RESPONSES_SYNC=True)
+class RunLoadTestHttpTest(LiveServerTestCase):
+    fixtures = ['survey.json']
+
+    def test_over_http(self):
+        report = run_load_test([1], respondents=4, concurrency=2, base_url=self.live_server_url)
+
+        self.assertEqual(report['failures'], [])
+        self.assertEqual(report['urls']['survey:result']['requests'], 4)
+        self.assertEqual(report['urls']['survey:closest_stream']['requests'], 4)
+        self.assertEqual(Response.objects.filter(survey=1).count(), 4)
@@ -0,0 +1,87 @@
+import logging
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from survey import middleware
+from survey.models import Answer, Question
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class QueryRecorderTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_repeated_shapes(self):
+        recorder = middleware.QueryRecorder(slowest=2)
+        installed = middleware._install(recorder)
+        try:
+            for question in Question.objects.all():
+                list(Answer.objects.filter(question=question))
+        finally:
+            middleware._uninstall(installed)
+        questions = Question.objects.count()
+
+        self.assertEqual(recorder.count, questions + 1)
+        self.assertEqual(len(recorder.slowest()), 2)
+        shape, count, duration = recorder.repeated(threshold=3)[0]
+        self.assertEqual(count, questions)
+        self.assertIn('"survey_answer"."question_id" = ?', shape)
+
+    def test_uninstalled(self):
+        recorder = middleware.QueryRecorder()
+        middleware._uninstall(middleware._install(recorder))
+        list(Question.objects.all())
+
+        self.assertEqual(recorder.count, 0)
+
+    def test_keeps_capturing_queries(self):
+        recorder = middleware.QueryRecorder()
+        with self.assertNumQueries(1):
+            installed = middleware._install(recorder)
+            try:
+                list(Question.objects.all())
+            finally:
+                middleware._uninstall(installed)
+        self.assertEqual(recorder.count, 1)
+
+
+@override_settings(MIDDLEWARE_CLASSES=settings.MIDDLEWARE_CLASSES + (
+    'survey.middleware.SqlInstrumentationMiddleware',))
+class SqlInstrumentationMiddlewareTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.handler = _Capture()
+        middleware.logger.addHandler(self.handler)
+        self.level = middleware.logger.level
+        middleware.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        middleware.logger.removeHandler(self.handler)
+        middleware.logger.setLevel(self.level)
+
+    @override_settings(SURVEY_SQL_SAMPLE_RATE=1)
+    def test_summary(self):
+        Client().get('/survey/')
+
+        summary = self.handler.records[-1].sql_summary
+        self.assertEqual(summary['view'], 'survey:list')
+        self.assertEqual(summary['status'], 200)
+        self.assertTrue(summary['queries'] > 0)
+        self.assertEqual(len(summary['slowest']), min(summary['queries'], 5))
+
+    @override_settings(SURVEY_SQL_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        Client().get('/survey/')
+
+        self.assertEqual(self.handler.records, [])
@@ -4,6 +4,7 @@ from django.test import TestCase
 
 from survey.tests.factories import SurveyFactory
 from survey.models import Survey, Result, Question, Answer, Page
+from survey.snapshot import get_snapshot
 
 
 def create_surveys(num=5):
@@ -26,6 +27,19 @@ class SurveyTest(TestCase):
 
         self.assertEqual(description, 'Short')
 
+    def test_shorten_description_from_list_rows(self):
+        s = Survey.objects.list_rows(description_length=6).get(pk=1)
+        with self.assertNumQueries(0):
+            description = s.shorten_description(6)
+
+        self.assertEqual(description, 'Thi...')
+
+    def test_count_forgotten_on_new_survey(self):
+        count = Survey.objects.get_count()
+        Survey(name='Survey').save()
+
+        self.assertEqual(Survey.objects.get_count(), count + 1)
+
     def test_save_modified_time(self):
         s = Survey(name='Survey')
         minute_slice = slice(0, 17)
@@ -55,6 +69,19 @@ class AnswerTest(TestCase):
         score = Answer.objects.get_score_sum([1, 4, 8, 9, 13])
         self.assertEqual(score, 6)
 
+    def test_split_by_page(self):
+        given_ids = [1, 4, 8, 9, 13]
+        with self.assertNumQueries(1):
+            given_ans, other_ans = Answer.objects.split_by_page(1, given_ids)
+
+        answers = Answer.objects.filter(question__page__survey=1).select_related('question')
+        for ans in answers:
+            split = given_ans if ans.id in given_ids else other_ans
+            self.assertIn((ans.id, ans.score), split[ans.question.page_id][ans.question_id])
+        self.assertEqual(sum(len(ans) for q in given_ans.itervalues() for ans in q.itervalues()), len(given_ids))
+        self.assertEqual(sum(len(ans) for q in other_ans.itervalues() for ans in q.itervalues()),
+                         len(answers) - len(given_ids))
+
 
 class ResultTest(TestCase):
     fixtures = ['survey.json']
@@ -96,3 +123,26 @@ class ResultTest(TestCase):
         result = Result.objects.get_result_below(1, score=0)
 
         self.assertIsNone(result)
+
+    def test_get_index_built_once(self):
+        index = Result.objects.get_index(1)
+        with self.assertNumQueries(0):
+            self.assertIs(Result.objects.get_index('1'), index)
+            Result.objects.get_result(1, 0)
+            Result.objects.get_result_above(1, 0)
+            Result.objects.get_result_below(1, 0)
+
+    def test_get_index_from_snapshot(self):
+        self.assertIs(Result.objects.get_index(1), get_snapshot(1).result_index)
+
+    def test_get_index_missing_survey(self):
+        self.assertIsNone(Result.objects.get_result(1000, 0))
+        self.assertIsNone(Result.objects.get_result_above(1000, 0))
+
+    def test_get_index_rebuilt_on_result_change(self):
+        Result.objects.get_index(1)
+        result = Result.objects.filter(survey=1).order_by('-max_score')[0]
+        result.max_score += 10
+        result.save()
+
+        self.assertEqual(Result.objects.get_result(1, result.max_score - 1), result)
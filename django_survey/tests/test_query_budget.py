@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse, NoReverseMatch
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from survey.benchmark import generate_spec
+from survey.cache import closest_path_cache
+from survey.models import Question
+from survey.responses import response_writer
+from survey.tests.factories import create_survey
+
+
+# pages, questions per page, answers per question
+SIZES = [(2, 1, 2), (3, 4, 3), (6, 10, 5)]
+ADMIN_CHANGELISTS = ['survey_survey', 'survey_question', 'survey_response']
+
+
+# the sessions are kept in cookies and the closest path search runs in the request,
+# so only the queries made by the survey code are counted
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+                   SURVEY_CLOSEST_PATH_POOL=None, SURVEY_RESPONSES_SYNC=False)
+class QueryBudgetTest(TestCase):
+    """Every view must make the same number of queries, whatever the size of the survey.
+
+    A view whose count grows with the pages, questions or answers (a template following
+    q.answer_set, an admin column following a foreign key) fails here.
+    """
+
+    def setUp(self):
+        self.client = Client()
+        self.queries = defaultdict(set)
+        # the finished surveys are buffered, not written by the request, and flushed here
+        response_writer._start_thread = lambda: None
+
+    def tearDown(self):
+        response_writer.flush()
+        del response_writer._start_thread
+
+    def request(self, method, url_name, args=(), data=None, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(reverse(url_name, args=args), data or {})
+        self.assertIn(response.status_code, (200, 302), '{} {}'.format(method.upper(), url_name))
+        self.queries[method, url_name].add(len(queries))
+        return response
+
+    def walk(self, size):
+        """Take a generated survey from the list to the closest path.
+
+        :param size: (pages, questions, answers)
+        :return: dict {(method, url name): set of query counts}
+        """
+        self.queries = defaultdict(set)
+        spec = generate_spec(*size, min_score=0, max_score=3, question_type='mixed')
+        survey = create_survey(spec, results=[(-1000, 1), (1, 5), (5, 1000)])
+
+        self.request('get', 'survey:list')
+        self.request('get', 'survey:survey', (survey.id,))
+        for page in survey.page_set.order_by('page_num'):
+            answers = {}
+            for question in page.question_set.all():
+                # the first answer, or the first two for a checkbox
+                given = question.answer_set.all()[:1 if question.type == Question.SINGLE else 2]
+                answers['question[{}]'.format(question.id)] = [a.id for a in given]
+            self.request('get', 'survey:survey', (survey.id, page.page_num))
+            self.request('post', 'survey:survey', (survey.id, page.page_num), answers)
+        self.request('get', 'survey:result', (survey.id,))
+        # search during the request, not when the survey was finished
+        closest_path_cache.clear()
+        self.request('get', 'survey:closest', (survey.id,))
+        self.request('get', 'survey:closest', (survey.id,))
+        self.request('get', 'survey:paths', (survey.id,))
+        return dict(self.queries)
+
+    def test_respondent_flow(self):
+        budgets = [self.walk(size) for size in SIZES]
+
+        for size, queries in zip(SIZES[1:], budgets[1:]):
+            for view, counts in sorted(budgets[0].iteritems()):
+                self.assertEqual(queries[view], counts, '{} {}: {} queries on a {} survey, {} on a {} survey'.format(
+                    view[0].upper(), view[1], sorted(queries[view]), size, sorted(counts), SIZES[0]))
+
+    def test_admin_changelists(self):
+        try:
+            reverse('admin:survey_survey_changelist')
+        except NoReverseMatch:
+            self.skipTest('the admin is not in the URLconf')
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        admin = Client()
+        admin.login(username='admin', password='admin')
+
+        budgets = []
+        for size in SIZES:
+            survey = create_survey(generate_spec(*size))
+            for i in xrange(size[0] * size[1]):
+                response_writer.record(survey.id, [], score=i)
+            response_writer.flush()
+            self.queries = defaultdict(set)
+            for model in ADMIN_CHANGELISTS:
+                self.request('get', 'admin:{}_changelist'.format(model), client=admin)
+            budgets.append(dict(self.queries))
+
+        for size, queries in zip(SIZES[1:], budgets[1:]):
+            self.assertEqual(queries, budgets[0], 'the admin changelists queries grow with the survey size')
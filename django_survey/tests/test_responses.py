@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.db import IntegrityError, connection
+
+from survey.models import Response, ResponseAnswer
+from survey.responses import ResponseWriter
+
+
+class ResponseWriterTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.writer = ResponseWriter()
+        # no background flushes during the tests
+        self.writer._start_thread = lambda: None
+
+    @override_settings(SURVEY_RESPONSES_SYNC=True)
+    def test_sync(self):
+        key = self.writer.record(1, [1, 2, 5], score=3, result_id=None)
+
+        self.assertEqual(self.writer.pending(), 0)
+        response = Response.objects.get(key=key)
+        self.assertEqual(response.survey_id, 1)
+        self.assertEqual(response.score, 3)
+        self.assertEqual(sorted(response.responseanswer_set.values_list('answer_id', flat=True)), [1, 2, 5])
+
+    def test_buffered(self):
+        keys = [self.writer.record(1, [1, 2, 2, 5], score=3) for i in range(10)]
+
+        self.assertEqual(self.writer.pending(), 10)
+        self.assertFalse(Response.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.writer.flush(), 10)
+        sql = [q['sql'] for q in queries.captured_queries]
+        # one insert per table, whatever the number of responses
+        self.assertEqual(len([q for q in sql if 'INSERT INTO "survey_response" (' in q]), 1)
+        self.assertEqual(len([q for q in sql if 'INSERT INTO "survey_responseanswer" (' in q]), 1)
+        self.assertEqual(self.writer.pending(), 0)
+        self.assertEqual(sorted(Response.objects.values_list('key', flat=True)), sorted(keys))
+        self.assertEqual(ResponseAnswer.objects.count(), 30)
+
+    def test_flush_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.writer.flush(), 0)
+
+    def test_failed_flush_keeps_responses(self):
+        def fail(batch):
+            raise ValueError('database unavailable')
+        self.writer.record(1, [1], score=-5)
+        self.writer.record(1, [4], score=0)
+        self.writer._write = fail
+
+        self.assertEqual(self.writer.flush(), 0)
+        self.assertEqual(self.writer.pending(), 2)
+        del self.writer._write
+        self.assertEqual(self.writer.flush(), 2)
+
+    def test_rejected_response_set_aside(self):
+        write = self.writer._write
+
+        def reject_missing_answer(batch):
+            # what a database checking the foreign keys does
+            if any(a.answer_id == 999999 for response, answers in batch for a in answers):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            write(batch)
+        self.writer._write = reject_missing_answer
+        good = self.writer.record(1, [1], score=-5)
+        bad = self.writer.record(1, [999999], score=0)
+        later = self.writer.record(1, [4], score=0)
+
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self.writer.pending(), 0)
+        self.assertEqual(sorted(Response.objects.values_list('key', flat=True)), sorted([good, later]))
+        self.assertEqual([response.key for response, answers in self.writer.rejected], [bad])
+
+        self.writer.record(1, [5], score=1)
+        self.assertEqual(self.writer.flush(), 1)
+
+    @override_settings(SURVEY_RESPONSES_BATCH_SIZE=3)
+    def test_full_buffer_wakes_writer(self):
+        for i in range(2):
+            self.writer.record(1, [1])
+        self.assertFalse(self.writer._wake.is_set())
+        self.writer.record(1, [1])
+        self.assertTrue(self.writer._wake.is_set())
+
+
+@override_settings(SURVEY_RESPONSES_SYNC=True)
+class FinishedSurveyResponseTest(TestCase):
+    fixtures = ['survey.json']
+
+    def test_response_recorded(self):
+        c = Client()
+        session = SessionStore()
+        session['survey_page'] = 2
+        session['page_answers'] = {'1': [1, 2, 5, 7, 8]}
+        session['page_scores'] = {'1': 8}
+        session.save()
+        c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        c.post('/survey/1/page/2', {'question[4]': 10, 'question[5]': 12})
+
+        response = Response.objects.get(key=c.session['response'])
+        self.assertEqual(response.score, 8)
+        self.assertEqual(response.result.min_score, 0)
+        self.assertEqual(sorted(response.responseanswer_set.values_list('answer_id', flat=True)),
+                         [1, 2, 5, 7, 8, 10, 12])
+
+    def test_unknown_answer_dropped(self):
+        c = Client()
+        session = SessionStore()
+        session['survey_page'] = 2
+        session['page_answers'] = {'1': [1, 2, 5, 7, 8]}
+        session['page_scores'] = {'1': 8}
+        session.save()
+        c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        c.post('/survey/1/page/2', {'question[4]': 10, 'question[5]': [12, 999999]})
+
+        response = Response.objects.get(key=c.session['response'])
+        self.assertEqual(sorted(response.responseanswer_set.values_list('answer_id', flat=True)),
+                         [1, 2, 5, 7, 8, 10, 12])
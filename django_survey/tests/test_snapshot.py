@@ -0,0 +1,66 @@
+from django.test import TestCase
+
+from survey.models import Survey, Page, Question, Answer, Result
+from survey.snapshot import SurveySnapshot, get_snapshot, snapshot_cache
+
+
+class SurveySnapshotTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.snapshot = SurveySnapshot(1)
+
+    def test_questions(self):
+        for page_num in (1, 2):
+            questions = Question.objects.filter(page__page_num=page_num, page__survey=1)
+            nodes = self.snapshot.get_questions(page_num)
+            self.assertEqual([q.id for q in nodes], [q.id for q in questions])
+            for q, node in zip(questions, nodes):
+                self.assertEqual([a.id for a in node.answers], [a.id for a in q.answer_set.all()])
+        self.assertEqual(self.snapshot.get_questions(3), ())
+
+    def test_next_page(self):
+        for page_num in (0, 1, 2):
+            self.assertEqual(self.snapshot.get_next_page(page_num), Page.objects.get_next_page(1, page_num))
+
+    def test_score(self):
+        answer_ids = [1, 4, 8, 9, 13]
+        self.assertEqual(self.snapshot.get_score(answer_ids), Answer.objects.get_score_sum(answer_ids))
+        self.assertIsNone(self.snapshot.get_score([]))
+
+    def test_split_by_page(self):
+        answer_ids = [1, 2, 5, 7, 8, 10, 12]
+        self.assertEqual(self.snapshot.split_by_page(answer_ids), Answer.objects.split_by_page(1, answer_ids))
+
+    def test_results(self):
+        results = Result.objects.filter(survey=1)
+        scores = range(min(r.min_score for r in results) - 2, max(r.max_score for r in results) + 2)
+        for score in scores:
+            self.assertEqual(self.snapshot.get_result(score), Result.objects.get_result(1, score))
+            self.assertEqual(self.snapshot.get_result_above(score), Result.objects.get_result_above(1, score))
+            self.assertEqual(self.snapshot.get_result_below(score), Result.objects.get_result_below(1, score))
+
+
+class GetSnapshotTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        snapshot_cache.clear()
+
+    def test_built_once(self):
+        snapshot = get_snapshot(1)
+        with self.assertNumQueries(0):
+            self.assertIs(get_snapshot('1'), snapshot)
+
+    def test_rebuilt_when_changed(self):
+        snapshot = get_snapshot(1)
+        answer = Answer.objects.get(pk=1)
+        answer.score += 100
+        answer.save()
+
+        changed = get_snapshot(1)
+        self.assertIsNot(changed, snapshot)
+        self.assertEqual(changed.get_score([1]), answer.score)
+
+    def test_missing_survey(self):
+        self.assertRaises(Survey.DoesNotExist, get_snapshot, 100)
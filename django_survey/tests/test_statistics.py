@@ -0,0 +1,104 @@
+import json
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.client import Client
+
+from survey import statistics
+from survey.models import Response, ResponseAnswer, StatCounter
+
+
+RESPONSES = [
+    (1, 8, 2, [1, 2, 5, 7, 8, 10, 12]),
+    (1, 8, 2, [1, 2, 5, 7, 8, 10, 12]),
+    (1, -5, 1, [1, 4, 9, 13]),
+]
+
+
+def save_responses(responses):
+    for i, (survey_id, score, result_id, answer_ids) in enumerate(responses):
+        key = 'response{}'.format(i)
+        Response.objects.create(key=key, survey_id=survey_id, score=score, result_id=result_id,
+                                created_at='2015-01-01 00:00')
+        for answer_id in answer_ids:
+            ResponseAnswer.objects.create(response_id=key, answer_id=answer_id)
+
+
+class StatisticsTest(TestCase):
+    fixtures = ['survey.json']
+
+    def assertStatistics(self, stats):
+        self.assertEqual(stats['completions'], 3)
+        self.assertEqual(stats['scores'], [(-5, 1), (8, 2)])
+        self.assertEqual(stats['results'], {1: 1, 2: 2})
+        self.assertEqual(stats['answers'][1], (3, 1.0))
+        self.assertEqual(stats['answers'][2], (2, 2 / 3.0))
+        self.assertEqual(stats['answers'][4], (1, 1 / 3.0))
+        self.assertNotIn(3, stats['answers'])
+
+    def test_add_responses(self):
+        statistics.add_responses(RESPONSES[:1])
+        statistics.add_responses(RESPONSES[1:])
+
+        self.assertStatistics(statistics.get_statistics(1))
+
+    def test_shards_are_summed(self):
+        for shard, response in enumerate(RESPONSES):
+            statistics._increment(1, StatCounter.COMPLETIONS, 0, shard, 1)
+
+        self.assertEqual(StatCounter.objects.filter(kind=StatCounter.COMPLETIONS).count(), 3)
+        self.assertEqual(statistics.get_statistics(1)['completions'], 3)
+
+    def test_one_update_per_counter(self):
+        statistics.add_responses(RESPONSES)
+        counters = len(statistics.count_responses(RESPONSES))
+        with self.settings(SURVEY_STATS_SHARDS=1):
+            statistics.add_responses(RESPONSES)
+            with self.assertNumQueries(counters):
+                statistics.add_responses(RESPONSES)
+
+    def test_no_statistics(self):
+        stats = statistics.get_statistics(2)
+
+        self.assertEqual(stats, {'completions': 0, 'scores': [], 'results': {}, 'answers': {}})
+
+    def test_rebuild(self):
+        save_responses(RESPONSES)
+        statistics.add_responses(RESPONSES[:1])
+
+        self.assertEqual(statistics.rebuild(1, chunk_size=2), 3)
+        self.assertStatistics(statistics.get_statistics(1))
+
+    def test_rebuild_command(self):
+        save_responses(RESPONSES)
+        out = StringIO()
+        call_command('rebuild_survey_stats', '1', chunk_size=1, stdout=out)
+
+        self.assertIn('Survey 1: 3 responses counted.', out.getvalue())
+        self.assertStatistics(statistics.get_statistics(1))
+
+
+class SurveyStatisticsViewTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.c = Client()
+        user = User.objects.create_user('staff', password='pass')
+        user.is_staff = True
+        user.save()
+        self.c.login(username='staff', password='pass')
+
+    def test_get(self):
+        statistics.add_responses(RESPONSES)
+        response = self.c.get('/survey/1/stats')
+        stats = json.loads(response.content)
+
+        self.assertEqual(stats['completions'], 3)
+        self.assertEqual(stats['answers']['2'], {'count': 2, 'rate': 2 / 3.0})
+
+    def test_staff_only(self):
+        response = Client().get('/survey/1/stats')
+
+        self.assertEqual(response.status_code, 302)
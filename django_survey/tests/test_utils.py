@@ -0,0 +1,45 @@
+from django.test import SimpleTestCase
+
+from survey.models import Result
+from survey.utils import ResultIndex
+
+
+def results(*intervals):
+    return [Result(pk=i, min_score=min_score, max_score=max_score)
+            for i, (min_score, max_score) in enumerate(intervals, 1)]
+
+
+class ResultIndexTest(SimpleTestCase):
+
+    def test_lookup(self):
+        index = ResultIndex(results((10, 20), (-5, 0), (0, 10)))
+        self.assertEqual(index.lookup(-6), (None, index.results[0], None))
+        self.assertEqual(index.lookup(-5), (index.results[0], index.results[1], None))
+        self.assertEqual(index.lookup(0), (index.results[1], index.results[2], None))
+        self.assertEqual(index.lookup(1), (index.results[1], index.results[2], index.results[0]))
+        self.assertEqual(index.lookup(15), (index.results[2], None, index.results[1]))
+        self.assertEqual(index.lookup(20), (None, None, index.results[1]))
+        self.assertEqual(index.lookup(21), (None, None, index.results[2]))
+
+    def test_same_as_queries(self):
+        index = ResultIndex(results((-5, 0), (2, 10), (10, 20)))
+        for score in range(-10, 25):
+            current = [r for r in index.results if r.min_score <= score < r.max_score]
+            above = [r for r in index.results if r.min_score > score]
+            below = [r for r in index.results if r.max_score < score]
+            self.assertEqual(index.get_result(score), current[0] if current else None)
+            self.assertEqual(index.get_result_above(score), above[0] if above else None)
+            self.assertEqual(index.get_result_below(score), below[-1] if below else None)
+
+    def test_clean(self):
+        index = ResultIndex(results((-5, 0), (0, 10)))
+        self.assertEqual(index.overlaps, [])
+        self.assertEqual(index.gaps, [])
+
+    def test_overlaps_and_gaps(self):
+        index = ResultIndex(results((-5, 1), (0, 10), (12, 20)))
+        self.assertEqual([(a.pk, b.pk) for a, b in index.overlaps], [(1, 2)])
+        self.assertEqual([(a.pk, b.pk) for a, b in index.gaps], [(2, 3)])
+
+    def test_empty(self):
+        self.assertEqual(ResultIndex([]).lookup(0), (None, None, None))
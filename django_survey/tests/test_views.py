@@ -1,9 +1,14 @@
+import json
+
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.test.client import Client
 from django.conf import settings
 from django.contrib.sessions.backends.db import SessionStore
 
-from survey.models import Result
+from survey.cache import closest_path_cache
+from survey.models import Survey, Result, Answer
+from survey.tests.factories import create_survey
 
 
 class ListViewTest(TestCase):
@@ -43,6 +48,41 @@ class ListViewTest(TestCase):
         self.assertEqual(num_surveys, 2)
 
 
+class ListViewKeysetTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_walk_forward_and_back(self):
+        expected = list(Survey.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        pages = [self.client.get('/survey/').context]
+        while pages[-1]['next_cursor']:
+            pages.append(self.client.get('/survey/', {'after': pages[-1]['next_cursor']}).context)
+        self.assertEqual([s.id for page in pages for s in page['surveys']], expected)
+        self.assertIsNone(pages[0]['prev_cursor'])
+
+        back = self.client.get('/survey/', {'before': pages[-1]['prev_cursor']}).context
+        self.assertEqual([s.id for s in back['surveys']], [s.id for s in pages[-2]['surveys']])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/survey/', {'after': 'not a cursor'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['surveys']), 3)
+
+    def test_queries(self):
+        self.client.get('/survey/')
+        # one query for the surveys, the count is cached
+        with self.assertNumQueries(1):
+            response = self.client.get('/survey/')
+        self.assertEqual(response.context['total'], Survey.objects.count())
+        for survey in response.context['surveys']:
+            self.assertEqual(survey.shorten_description(),
+                             Survey.objects.get(pk=survey.id).shorten_description())
+
+
+@override_settings(SURVEY_RESPONSES_SYNC=True)
 class SurveyViewTest(TestCase):
     fixtures = ['survey.json']
 
@@ -106,6 +146,8 @@ class SurveyViewTest(TestCase):
         session = SessionStore()
         session['survey_page'] = 2
         session['answers'] = [1, 2, 5, 7, 8]
+        session['page_answers'] = {'1': [1, 2, 5, 7, 8]}
+        session['page_scores'] = {'1': 8}
         session.save()
         self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
 
@@ -120,6 +162,71 @@ class SurveyViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIsInstance(result, Result)
 
+    def test_post_survey_page_again(self):
+        self.c.post('/survey/1', {'question[1]': (1, 2), 'question[2]': 5, 'question[3]': (7, 8)})
+        session = self.c.session
+        session['survey_page'] = 1
+        session.save()
+        self.c.post('/survey/1', {'question[1]': (1, 1), 'question[2]': 5, 'question[3]': 7})
+        session = self.c.session
+
+        self.assertEqual(session['answers'], [1, 5, 7])
+        self.assertEqual(session['page_answers'], {'1': [1, 5, 7]})
+        self.assertEqual(session['page_scores'], {'1': Answer.objects.get_score_sum([1, 5, 7])})
+
+    def test_get_first_page_starts_over(self):
+        self.c.post('/survey/1', {'question[1]': (1, 2), 'question[2]': 5, 'question[3]': (7, 8)})
+        session = self.c.session
+        session['survey_page'] = 1
+        session.save()
+        self.c.get('/survey/1')
+        session = self.c.session
+
+        self.assertEqual(session['answers'], [])
+        self.assertEqual(session['page_scores'], {})
+
+
+# the session is kept in a cookie, so only the survey queries are counted
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies', SURVEY_RESPONSES_SYNC=True)
+class SurveyViewQueriesTest(TestCase):
+
+    def setUp(self):
+        self.c = Client()
+
+    def survey_with_questions(self, questions):
+        return create_survey([[('checkbox', [1, 2, 3])] * questions, [('radio', [0, 1])]])
+
+    def test_get_queries(self):
+        for questions in (1, 10):
+            survey = self.survey_with_questions(questions)
+            # the survey snapshot is built on the first view
+            with self.assertNumQueries(5):
+                self.c.get('/survey/{}'.format(survey.id))
+            with self.assertNumQueries(0):
+                response = self.c.get('/survey/{}'.format(survey.id))
+            self.assertEqual(len(response.context['questions']), questions)
+            self.assertContains(response, 'class="survey-answer"', count=questions * 3)
+
+    def test_post_missing_answers_queries(self):
+        for questions in (1, 10):
+            survey = self.survey_with_questions(questions)
+            with self.assertNumQueries(5):
+                self.c.post('/survey/{}'.format(survey.id), {})
+            with self.assertNumQueries(0):
+                response = self.c.post('/survey/{}'.format(survey.id), {})
+            self.assertEqual(len(response.context['unanswered']), questions)
+            self.assertEqual(response.context['next_page'], 2)
+
+    def test_result_queries(self):
+        survey = create_survey([[('radio', [1, 2])], [('radio', [0, 3])]], results=[(0, 2), (2, 10)])
+        for page in survey.page_set.order_by('page_num'):
+            answer = page.question_set.get().answer_set.all()[0]
+            self.c.post('/survey/{}/page/{}'.format(survey.id, page.page_num),
+                        {'question[{}]'.format(answer.question_id): answer.id})
+        with self.assertNumQueries(0):
+            response = self.c.get('/survey/{}/result'.format(survey.id))
+        self.assertEqual(response.context['result'].min_score, 0)
+
 
 class ResultViewTest(TestCase):
     fixtures = ['survey.json']
@@ -144,3 +251,98 @@ class ResultViewTest(TestCase):
         response = self.c.get('/survey/1/closest_path')
 
         self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SURVEY_CLOSEST_PATH_POOL='thread')
+class ClosestPathStreamTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.c = Client()
+        session = SessionStore()
+        session['score'] = 8
+        session['answers'] = [1, 2, 5, 7, 8, 10, 12]
+        session.save()
+        self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        closest_path_cache.clear()
+
+    def get_chunks(self):
+        response = self.c.get('/survey/1/closest_path/stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [json.loads(line) for line in ''.join(response.streaming_content).splitlines()]
+
+    def test_stream_routes(self):
+        chunks = self.get_chunks()
+
+        self.assertEqual(sorted(chunk['route'] for chunk in chunks), ['better', 'worse'])
+        # the same sections as the whole closest path
+        html = self.c.get('/survey/1/closest_path').content
+        for chunk in chunks:
+            self.assertIn(chunk['html'].strip(), html)
+            self.assertIn('<b>{}</b> result'.format(chunk['route']), chunk['html'])
+
+    def test_stream_cached(self):
+        self.get_chunks()
+
+        self.assertEqual(len(closest_path_cache), 1)
+        # only the session is loaded
+        with self.assertNumQueries(1):
+            chunks = self.get_chunks()
+        self.assertEqual([chunk['route'] for chunk in chunks], ['better', 'worse'])
+
+    def test_stream_without_worse_result(self):
+        Result.objects.filter(survey=1, max_score__lte=8).delete()
+        chunks = self.get_chunks()
+
+        self.assertEqual(chunks[0]['route'], 'worse')
+        self.assertIn('No possible changes', chunks[0]['html'])
+        self.assertEqual(chunks[1]['route'], 'better')
+
+    def test_stream_no_score(self):
+        response = Client().get('/survey/1/closest_path/stream')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AllPathsTest(TestCase):
+    fixtures = ['survey.json']
+
+    def setUp(self):
+        self.c = Client()
+
+    def test_get_all_paths(self):
+        session = SessionStore()
+        session['score'] = 8
+        session['answers'] = [1, 2, 5, 7, 8, 10, 12]
+        session.save()
+        self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = self.c.get('/survey/1/paths')
+        results = response.context['results']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(results), Result.objects.filter(survey=1).count())
+        self.assertEqual([current for result, changes, current in results].count(True), 1)
+        for result, changes, current in results:
+            if not current and changes is not None:
+                self.assertTrue(len(changes) > 0)
+
+    def test_get_all_paths_cached(self):
+        closest_path_cache.clear()
+        session = SessionStore()
+        session['score'] = 8
+        session['answers'] = [1, 2, 5, 7, 8, 10, 12]
+        session.save()
+        self.c.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        first = self.c.get('/survey/1/paths')
+
+        self.assertEqual(len(closest_path_cache), 1)
+        self.assertFalse(first.context['truncated'])
+        second = self.c.get('/survey/1/paths')
+        self.assertEqual(closest_path_cache.stats()['hits'], 1)
+        self.assertEqual(second.content, first.content)
+
+    def test_get_all_paths_no_score(self):
+        response = self.c.get('/survey/1/paths')
+
+        self.assertEqual(response.status_code, 404)
@@ -7,7 +7,10 @@ survey_patterns = patterns('',
     url(r'^$', views.SurveyView.as_view(), name='survey'),
     url(r'^/page/(?P<page>\d+)$', views.SurveyView.as_view(), name='survey'),
     url(r'^/result$', views.ResultView.as_view(), name='result'),
-    url(r'^/closest_path$', views.ClosestPath.as_view(), name='closest')
+    url(r'^/closest_path$', views.ClosestPath.as_view(), name='closest'),
+    url(r'^/closest_path/stream$', views.ClosestPathStream.as_view(), name='closest_stream'),
+    url(r'^/paths$', views.AllPaths.as_view(), name='paths'),
+    url(r'^/stats$', views.SurveyStatistics.as_view(), name='stats')
 )
 
 urlpatterns = patterns('',
@@ -1,3 +1,10 @@
+import logging
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
 
 
 def get_first_value(q_set):
@@ -9,4 +16,68 @@ def get_first_value(q_set):
     try:
         return q_set[0]
     except IndexError:
-        return None
\ No newline at end of file
+        return None
+
+
+ResultLookup = namedtuple('ResultLookup', ['current', 'above', 'below'])
+
+
+class ResultIndex(object):
+    __slots__ = ('results', 'min_scores', 'max_scores', 'overlaps', 'gaps')
+
+    def __init__(self, results):
+        """The [min_score, max_score) intervals of a survey's results, sorted by min_score.
+
+        Overlapping intervals (a score with more than one result) and gaps between
+        intervals (scores without a result) are found while building the index.
+
+        :param results: iterable of objects with min_score and max_score
+        :return:
+        """
+        self.results = tuple(sorted(results, key=lambda r: (r.min_score, r.max_score)))
+        self.min_scores = array('l', [r.min_score for r in self.results])
+        self.max_scores = array('l', [r.max_score for r in self.results])
+        # pairs of consecutive results
+        self.overlaps = []
+        self.gaps = []
+        for prev, result in zip(self.results, self.results[1:]):
+            if result.min_score < prev.max_score:
+                self.overlaps.append((prev, result))
+            elif result.min_score > prev.max_score:
+                self.gaps.append((prev, result))
+        for prev, result in self.overlaps:
+            logger.warning(u'Results {} and {} overlap: [{}, {}) and [{}, {}).'.format(
+                prev.pk, result.pk, prev.min_score, prev.max_score, result.min_score, result.max_score))
+        for prev, result in self.gaps:
+            logger.warning(u'No result for the scores between results {} and {}: [{}, {}).'.format(
+                prev.pk, result.pk, prev.max_score, result.min_score))
+
+    def lookup(self, score):
+        """The result a score gets, the first result above it and the first result below it.
+
+        Same as DefaultResultManager.get_result, get_result_above and get_result_below.
+
+        :param score: int
+        :return: ResultLookup
+        """
+        i = bisect_right(self.min_scores, score)
+        current = None
+        below = None
+        # the results before i start at or below the score
+        for j in xrange(i - 1, -1, -1):
+            if current is None and self.max_scores[j] > score:
+                current = self.results[j]
+            elif self.max_scores[j] < score:
+                below = self.results[j]
+                break
+        above = self.results[i] if i < len(self.results) else None
+        return ResultLookup(current, above, below)
+
+    def get_result(self, score):
+        return self.lookup(score).current
+
+    def get_result_above(self, score):
+        return self.lookup(score).above
+
+    def get_result_below(self, score):
+        return self.lookup(score).below
@@ -1,16 +1,25 @@
-from math import ceil
+import json
 import logging
 
-from django.shortcuts import (render, HttpResponseRedirect,
-                              Http404, get_object_or_404)
+from django.shortcuts import render, HttpResponse, HttpResponseRedirect, Http404
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.core.urlresolvers import reverse
 from django.views.generic.base import View
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.paginator import PageNotAnInteger, EmptyPage
 from django.contrib.auth.decorators import user_passes_test
 from django.utils.decorators import method_decorator
 
-from survey.models import Survey, Question, Answer, Page, Result
-from closealternative import compute_closest_alternatives, AnsTuple
+from survey.models import Survey
+from survey.cache import cache_closest_path, closest_path_cache, closest_path_key
+from survey.snapshot import get_snapshot
+from survey.pagination import KeysetPaginator, CountedPaginator
+from survey.jobs import closest_path_jobs
+from survey.responses import response_writer
+from survey import statistics
+from closealternative import (find_closest_alternatives, _prepare_result_for_display,
+                              _prepare_changes_for_display, ResultPaths, SearchStats,
+                              stats_logger)
 
 
 logger = logging.getLogger(__name__)
@@ -18,20 +27,41 @@ logger = logging.getLogger(__name__)
 
 class ListView(View):
     template_name = 'survey/list.html'
+    limit = 3
 
     def get(self, request):
         """Display a list with all the surveys available.
 
-        The results are paged.
+        The results are paged. By default the pages follow each other with cursors
+        (?after=... for older surveys, ?before=... for newer ones), which costs the same
+        on every page; numbered pages (?page=N) are still available.
 
         :param request:
         :return:
         """
+        if 'page' in request.GET:
+            return self._get_numbered_page(request)
+
+        paginator = KeysetPaginator(Survey.objects.list_rows(), self.limit)
+        try:
+            surveys = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+        except ValueError:
+            surveys = paginator.page()
+
+        context = {
+            'surveys': surveys.object_list,
+            'next_cursor': surveys.next_cursor,
+            'prev_cursor': surveys.prev_cursor,
+            'total': Survey.objects.get_count()
+        }
+        return render(request, self.template_name, context)
+
+    def _get_numbered_page(self, request):
         page = request.GET.get('page', 1)
-        limit = 3
+        limit = self.limit
 
-        all_surveys = Survey.objects.all()
-        paginator = Paginator(all_surveys, limit)
+        all_surveys = Survey.objects.list_rows()
+        paginator = CountedPaginator(all_surveys, limit, Survey.objects.get_count())
 
         try:
             surveys = paginator.page(page)
@@ -44,7 +74,8 @@ class ListView(View):
 
         context = {
             'surveys': surveys,
-            'start_at': start_at
+            'start_at': start_at,
+            'total': paginator.count
         }
 
         return render(request, self.template_name, context)
@@ -57,6 +88,9 @@ def test_me(user):
 class SurveyView(View):
     template_name = 'survey/survey.html'
     SURVEY_PAGE = 'survey_page'
+    # {page_num: [answer ids]} and {page_num: score}, page_num as a string
+    PAGE_ANSWERS = 'page_answers'
+    PAGE_SCORES = 'page_scores'
 
     @method_decorator(user_passes_test(test_func=test_me))
     def dispatch(self, request, *args, **kwargs):
@@ -68,13 +102,13 @@ class SurveyView(View):
         Store in session the survey_page (current page) and the ids of the answers.
         The survey_page is used to restrict the user (skip ahead in the survey).
         The answer ids is used later to compute a close result alternative.
+        Starting the survey over forgets the answers given so far.
 
         :param request:
         :param survey_id: numeric
         :param page: numeric
         :return:
         """
-        survey = get_object_or_404(Survey, pk=survey_id)
         page = int(page)
         session_page = request.session.get(self.SURVEY_PAGE, 1)
 
@@ -83,12 +117,13 @@ class SurveyView(View):
 
         if page == 1:
             request.session['answers'] = []
+            request.session[self.PAGE_ANSWERS] = {}
+            request.session[self.PAGE_SCORES] = {}
 
-        questions = Question.objects.filter(page__page_num=page, page__survey=survey_id)
-        next_page = Page.objects.get_next_page(survey_id, page)
+        snapshot, questions, next_page = self._load_page(survey_id, page)
 
         context = {
-            'survey': survey,
+            'survey': snapshot.survey,
             'questions': questions,
             'next_page': next_page,
             'current_page': page
@@ -102,16 +137,17 @@ class SurveyView(View):
         If all are answered then proceed to the next page or to the results page.
         If not, redisplay the page, with the questions marked.
 
+        The answers and the score of each page are kept separately, so submitting a page
+        again replaces its answers instead of adding to them.
+
         :param request:
         :param survey_id: numeric
         :param page: numeric
         :return:
         """
-        questions_on_page = Question.objects.filter(page__page_num=page, page__survey=survey_id)
-        survey = get_object_or_404(Survey, pk=survey_id)
+        snapshot, questions_on_page, next_page = self._load_page(survey_id, page)
         unanswered_q = []
         answered_ids = []
-        answers_so_far = request.session.get('answers', [])
         for q in questions_on_page:
             answer_ids_str = request.POST.getlist('question[{}]'.format(q.id))
             try:
@@ -122,14 +158,12 @@ class SurveyView(View):
                 logger.info(e)
 
             if answer_ids:
-                answers_so_far += answer_ids
                 answered_ids += answer_ids
             else:
                 unanswered_q.append(q.id)
-        next_page = Page.objects.get_next_page(survey_id, page)
 
         if len(unanswered_q) == 0:
-            request.session['answers'] = answers_so_far
+            self._save_page_answers(request.session, snapshot, page, answered_ids)
             if next_page:
                 # there is another page
                 request.session[SurveyView.SURVEY_PAGE] = next_page
@@ -138,29 +172,92 @@ class SurveyView(View):
             else:
                 # finished the survey
                 del request.session[SurveyView.SURVEY_PAGE]
+                score = _get_score(request.session)
+                result = snapshot.get_result(score) if score is not None else None
+                # only the answers of this survey can be saved with the response
+                answer_ids = [a for a in request.session['answers'] if a in snapshot.answers]
+                request.session['response'] = response_writer.record(
+                    snapshot.id, answer_ids, score, result.id if result else None)
+                self._start_closest_path(snapshot, request.session['answers'], score)
                 return HttpResponseRedirect(reverse('survey:result', args=(survey_id,)))
         # some questions were not answered
         # so we're going to redisplay the same page
         context = {
             'unanswered': unanswered_q,
             'answered': answered_ids,
-            'survey': survey,
+            'survey': snapshot.survey,
             'next_page': next_page,
             'questions': questions_on_page,
             'current_page': page
         }
         return render(request, self.template_name, context)
 
+    @staticmethod
+    def _load_page(survey_id, page):
+        """Everything needed to display a survey page, from the survey snapshot.
+
+        :param survey_id:
+        :param page: numeric
+        :return: SurveySnapshot, tuple of QuestionNode, int or None
+        """
+        snapshot = _get_snapshot_or_404(survey_id)
+        return snapshot, snapshot.get_questions(page), snapshot.get_next_page(page)
+
+    @classmethod
+    def _save_page_answers(cls, session, snapshot, page, answer_ids):
+        """Store the answers of a page and their score, replacing the ones of an earlier submit.
+
+        :param session:
+        :param snapshot: SurveySnapshot
+        :param page: numeric
+        :param answer_ids: list
+        :return:
+        """
+        seen = set()
+        # an answer posted twice is counted once
+        answer_ids = [a for a in answer_ids if not (a in seen or seen.add(a))]
+        page_answers = session.get(cls.PAGE_ANSWERS, {})
+        page_scores = session.get(cls.PAGE_SCORES, {})
+        page_answers[str(page)] = answer_ids
+        page_scores[str(page)] = snapshot.get_score(answer_ids) or 0
+        session[cls.PAGE_ANSWERS] = page_answers
+        session[cls.PAGE_SCORES] = page_scores
+        session['answers'] = [a for p in sorted(page_answers, key=int) for a in page_answers[p]]
+
+    @staticmethod
+    def _start_closest_path(snapshot, answer_ids, score):
+        """Start searching for the closest alternatives in the background,
+        so that they are ready (or almost) when the result page asks for them.
+
+        :param snapshot: SurveySnapshot
+        :param answer_ids: list
+        :param score: int
+        :return:
+        """
+        if score is None:
+            return
+        key = closest_path_key(snapshot.id, score, answer_ids, ClosestPath.alternatives)
+        if key in closest_path_cache:
+            return
+        arguments = _closest_path_arguments(snapshot, score, answer_ids, ClosestPath.alternatives,
+                                            ClosestPath.deadline)
+        searches = ClosestPathStream.route_searches(arguments)
+        if not searches:
+            # nothing to search for
+            return
+        # a route at a time, so that ClosestPathStream can send each one when it is found
+        closest_path_jobs.submit_routes(key, searches, expire_after=ClosestPathStream.wait_timeout)
+
 
 class ResultView(View):
     template_name = 'survey/result.html'
 
     def get(self, request, survey_id):
-        answer_ids = request.session.get('answers', [])
-        score = Answer.objects.get_score_sum(answer_ids)
+        snapshot = _get_snapshot_or_404(survey_id)
+        score = _get_score(request.session)
         request.session['score'] = score
 
-        result = Result.objects.get_result(survey_id, score)
+        result = snapshot.get_result(score) if score is not None else None
         context = {
             'result': result,
             'score': score,
@@ -172,44 +269,253 @@ class ResultView(View):
 
 class ClosestPath(View):
     template_name = 'survey/closest_path.html'
+    # how many different ways to reach the next/previous result are shown
+    alternatives = 3
+    # milliseconds the search may take before showing the best changes found so far
+    deadline = 2000
 
     def get(self, request, survey_id):
         try:
             score = int(request.session.get('score', None))
         except TypeError:
             raise Http404()
-        next_result = Result.objects.get_result_above(survey_id, score)
-        prev_result = Result.objects.get_result_below(survey_id, score)
-        given_ans_ids = request.session.get('answers')
-
-        pages = Page.objects.filter(survey=survey_id)
-        other_ans = {}
-        given_ans = {}
-        # organize the answers by page and question
-        # and keep them split into answers the user has submitted
-        # and into answers the user has not submitted for that particular page and question
-        # this is useful when computing score improvements
-        for page in pages:
-            answers = Answer.objects.filter(question__page=page)
-            given_ans[page.id] = {}
-            other_ans[page.id] = {}
-            for ans in answers:
-                a = AnsTuple(id=ans.id, score=ans.score)
-                other_ans[page.id][ans.question_id] = other_ans[page.id].get(ans.question_id, [])
-                given_ans[page.id][ans.question_id] = given_ans[page.id].get(ans.question_id, [])
-
-                if ans.id in given_ans_ids:
-                    given_ans[page.id][ans.question_id].append(a)
-                else:
-                    other_ans[page.id][ans.question_id].append(a)
-
-        better, worse = compute_closest_alternatives(score=score,
-                                                     next_result=next_result,
-                                                     prev_result=prev_result,
-                                                     answers=given_ans,
-                                                     other_answers=other_ans)
+        given_ans_ids = request.session.get('answers', [])
+        snapshot = _get_snapshot_or_404(survey_id)
+
+        # the same answers always lead to the same alternatives, until the survey is changed
+        key = closest_path_key(survey_id, score, given_ans_ids, self.alternatives)
+        pending = closest_path_jobs.is_pending(key)
+        alternatives = closest_path_cache.get(key)
+        if alternatives is None:
+            if pending:
+                # the search started when the survey was finished is still running
+                return HttpResponse(json.dumps({'status': 'pending'}), status=202,
+                                    content_type='application/json')
+            alternatives = find_closest_alternatives(
+                **_closest_path_arguments(snapshot, score, given_ans_ids, self.alternatives, self.deadline))
+            cache_closest_path(key, alternatives)
+
+        better, worse = _prepare_result_for_display(alternatives, snapshot)
+        truncated = alternatives.get('truncated', [])
         context = {
             'better': better,
-            'worse': worse
+            'worse': worse,
+            'better_truncated': 'better' in truncated,
+            'worse_truncated': 'worse' in truncated
+        }
+        return render(request, self.template_name, context)
+
+
+class ClosestPathStream(View):
+    route_template_name = 'survey/closest_route.html'
+    # the name of each route and the result it leads to
+    routes = (('better', 'next_result'), ('worse', 'prev_result'))
+    # seconds to wait for the routes searched since the survey was finished,
+    # after which that search is no longer seen as pending
+    wait_timeout = 2 * ClosestPath.deadline / 1000.0
+
+    def get(self, request, survey_id):
+        """Same changes as ClosestPath, sent a route at a time.
+
+        The better and the worse routes are searched separately, in the closest path worker pool,
+        and each one is sent as soon as it is found: one line of JSON per route,
+        {"route": "better" or "worse", "html": the rendered route}, or "error" instead of "html"
+        when its search failed. A route without a result to reach is sent right away.
+        The routes submitted when the survey was finished are waited for, not searched again.
+
+        :param request:
+        :param survey_id: numeric
+        :return:
+        """
+        try:
+            score = int(request.session.get('score', None))
+        except TypeError:
+            raise Http404()
+        given_ans_ids = request.session.get('answers', [])
+        snapshot = _get_snapshot_or_404(survey_id)
+        return StreamingHttpResponse(self._stream(snapshot, score, given_ans_ids),
+                                     content_type='application/x-ndjson')
+
+    @classmethod
+    def route_searches(cls, arguments):
+        """The arguments of the search of each route, for the routes with a result to reach.
+
+        :param arguments: dict from _closest_path_arguments
+        :return: dict {route name: the arguments for find_closest_alternatives}
+        """
+        searches = {}
+        for name, result_key in cls.routes:
+            if arguments[result_key] is not None:
+                # each search follows one route, with its own deadline and statistics
+                search = dict(arguments, next_result=None, prev_result=None,
+                              stats=SearchStats() if arguments['stats'] is not None else None)
+                search[result_key] = arguments[result_key]
+                searches[name] = search
+        return searches
+
+    def _stream(self, snapshot, score, given_ans_ids):
+        key = closest_path_key(snapshot.id, score, given_ans_ids, ClosestPath.alternatives)
+        alternatives = closest_path_cache.get(key)
+        if alternatives is not None:
+            for name, result_key in self.routes:
+                yield self._render_route(snapshot, name, alternatives)
+            return
+
+        arguments = _closest_path_arguments(snapshot, score, given_ans_ids, ClosestPath.alternatives,
+                                            ClosestPath.deadline)
+        searches = self.route_searches(arguments)
+        found = {'truncated': []}
+        for name, result_key in self.routes:
+            if name not in searches:
+                found[name] = None
+                yield self._render_route(snapshot, name, found)
+
+        outcomes = {}
+        # the routes of the background search, if it is still running
+        for name, outcome in closest_path_jobs.wait_routes(key, self.wait_timeout):
+            outcomes[name] = outcome
+            yield self._outcome_line(snapshot, name, outcome, found)
+        # then the ones it did not give in time, if any
+        remaining = dict((name, search) for name, search in searches.iteritems() if name not in outcomes)
+        for name, outcome in closest_path_jobs.search_each(remaining):
+            outcomes[name] = outcome
+            yield self._outcome_line(snapshot, name, outcome, found)
+        if not any(error for route_alternatives, error in outcomes.itervalues()):
+            cache_closest_path(key, found)
+
+    def _outcome_line(self, snapshot, name, outcome, found):
+        """Add the alternatives of a route to found, and render them.
+
+        :param outcome: (dict, None) or (None, str), from a closest path job
+        :param found: dict, the alternatives of the routes sent so far
+        :return: str, a line of JSON
+        """
+        route_alternatives, error = outcome
+        if error:
+            logger.error('Closest path search failed: {}'.format(error))
+            return json.dumps({'route': name, 'error': True}) + '\n'
+        found[name] = route_alternatives.get(name)
+        found['truncated'] += route_alternatives['truncated']
+        return self._render_route(snapshot, name, found)
+
+    def _render_route(self, snapshot, name, alternatives):
+        """
+        :return: str, a line of JSON
+        """
+        better, worse = _prepare_result_for_display({name: alternatives.get(name)}, snapshot)
+        html = render_to_string(self.route_template_name, {
+            'route': name,
+            'alternatives': better if name == 'better' else worse,
+            'truncated': name in alternatives.get('truncated', [])
+        })
+        return json.dumps({'route': name, 'html': html}) + '\n'
+
+
+class AllPaths(View):
+    template_name = 'survey/all_paths.html'
+    # milliseconds the computation may take before showing the changes found so far
+    deadline = ClosestPath.deadline
+
+    def get(self, request, survey_id):
+        """Show what it would take to reach each result of the survey.
+
+        :param request:
+        :param survey_id: numeric
+        :return:
+        """
+        try:
+            score = int(request.session.get('score', None))
+        except TypeError:
+            raise Http404()
+        given_ans_ids = request.session.get('answers', [])
+        snapshot = _get_snapshot_or_404(survey_id)
+
+        results = snapshot.results
+        # cached with the closest paths, 'paths' standing for the number of alternatives
+        key = closest_path_key(survey_id, score, given_ans_ids, 'paths')
+        found = closest_path_cache.get(key)
+        if found is None:
+            given_ans, other_ans = snapshot.split_by_page(given_ans_ids)
+            result_paths = ResultPaths(score=score, results=results, answers=given_ans, other_answers=other_ans,
+                                       deadline=self.deadline)
+            found = {'paths': result_paths.compute(), 'truncated': ['paths'] if result_paths.truncated else []}
+            cache_closest_path(key, found)
+        paths = found['paths']
+
+        reachable = [r for r in results if paths[r.id] is not None]
+        prepared = dict(zip([r.id for r in reachable],
+                            _prepare_changes_for_display([paths[r.id] for r in reachable], snapshot)))
+        context = {
+            'score': score,
+            'survey_id': survey_id,
+            'results': [(r, prepared.get(r.id), r.min_score <= score < r.max_score) for r in results],
+            'truncated': bool(found['truncated'])
         }
         return render(request, self.template_name, context)
+
+
+class SurveyStatistics(View):
+
+    @method_decorator(user_passes_test(lambda user: user.is_staff))
+    def dispatch(self, request, *args, **kwargs):
+        return super(SurveyStatistics, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, survey_id):
+        """The statistics of a survey, as JSON, for dashboards.
+
+        :param request:
+        :param survey_id: numeric
+        :return:
+        """
+        if not Survey.objects.filter(pk=survey_id).exists():
+            raise Http404()
+        stats = statistics.get_statistics(survey_id)
+        # JSON object keys are strings
+        stats['results'] = dict((str(k), v) for k, v in stats['results'].iteritems())
+        stats['answers'] = dict((str(k), {'count': count, 'rate': rate})
+                                for k, (count, rate) in stats['answers'].iteritems())
+        return HttpResponse(json.dumps(stats), content_type='application/json')
+
+
+def _get_score(session):
+    """The survey score, summed from the scores of the submitted pages.
+
+    :param session:
+    :return: int or None when no page was submitted
+    """
+    page_scores = session.get(SurveyView.PAGE_SCORES)
+    return sum(page_scores.itervalues()) if page_scores else None
+
+
+def _get_snapshot_or_404(survey_id):
+    try:
+        return get_snapshot(survey_id)
+    except Survey.DoesNotExist:
+        raise Http404()
+
+
+def _closest_path_arguments(snapshot, score, given_ans_ids, alternatives, deadline=None):
+    """Everything find_closest_alternatives needs for a set of answers.
+
+    The search statistics are collected only when the 'survey-search' logger logs debug messages.
+
+    :param snapshot: SurveySnapshot
+    :param score: int
+    :param given_ans_ids: list
+    :param alternatives: int
+    :param deadline: int
+    :return: dict
+    """
+    given_ans, other_ans = snapshot.split_by_page(given_ans_ids)
+    results = snapshot.result_index.lookup(score)
+
+    return {
+        'score': score,
+        'next_result': results.above,
+        'prev_result': results.below,
+        'answers': given_ans,
+        'other_answers': other_ans,
+        'alternatives': alternatives,
+        'deadline': deadline,
+        'stats': SearchStats() if stats_logger.isEnabledFor(logging.DEBUG) else None
+    }